@@ -50,7 +50,15 @@ for msg in data['messages']:
     if msg.get('event') == 'websocket_message':
         # Check if data is a dict before calling get
         data_obj = msg.get('data')
-        if isinstance(data_obj, dict):
+        payload = data_obj.get('payload') if isinstance(data_obj, dict) else None
+        if isinstance(data_obj, dict) and data_obj.get('packet') == '42' and isinstance(payload, list):
+            # Decoded capture: {'packet': '42', 'payload': ['m', {...}]}
+            if len(payload) > 1 and payload[0] == 'm' and isinstance(payload[1], dict):
+                socket_messages.append({
+                    'timestamp': msg['timestamp'],
+                    'data': payload[1]
+                })
+        elif isinstance(data_obj, dict):
             raw_data = data_obj.get('raw', '')
             if raw_data.startswith('42["m"'):
                 try:
@@ -7,8 +7,8 @@ import time
 import json
 import logging
 import sys
-from typing import List, Dict, Any
-from datetime import datetime
+import threading
+from typing import List, Dict, Any, Callable, Optional
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -22,6 +22,9 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium_stealth import stealth
 from selenium.webdriver.common.action_chains import ActionChains
 
+from capture_store import merge_capture_sources, write_capture_file
+from capture_segments import SegmentedCaptureWriter, write_capture_segments
+
 try:
     from webdriver_manager.chrome import ChromeDriverManager
     from selenium.webdriver.chrome.service import Service as ChromeService
@@ -40,13 +43,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+WINAMAX_PAGE_URL = "https://www.winamax.fr/paris-sportifs/sports/1"
+
 class SocketIOCapture:
     """Capture Socket.IO messages using Selenium stealth"""
     
-    def __init__(self):
-        self.url = "https://www.winamax.fr/paris-sportifs/sports/1"
+    def __init__(self, on_messages: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 decoded_payloads: bool = False, segment_dir: Optional[str] = None,
+                 url: str = WINAMAX_PAGE_URL):
+        # Sport or tournament page to capture
+        self.url = url
         self.driver = None
         self.messages: List[Dict[str, Any]] = []
+        # CDP performance-log entries, merged with the hook frames on save
+        self.network_entries: List[Dict[str, Any]] = []
+        # Called with every batch drained from the browser, for live ingestion
+        self.on_messages = on_messages
+        # Store frames as decoded payloads instead of escaped raw strings
+        self.decoded_payloads = decoded_payloads
+        # Append to a segmented capture directory instead of writing the capture file
+        self.segment_dir = segment_dir
         self.setup_driver()
     
     def setup_driver(self):
@@ -221,7 +237,7 @@ class SocketIOCapture:
                 
                 # Look for WebSocket related messages
                 if 'Network.webSocket' in method or 'Network.webSocketFrame' in method:
-                    self.messages.append({
+                    self.network_entries.append({
                         'timestamp': log['timestamp'],
                         'method': method,
                         'params': params
@@ -236,15 +252,21 @@ class SocketIOCapture:
         logger.info("Collecting captured messages...")
         
         try:
-            messages = self.driver.execute_script("return window.capturedMessages || [];")
+            # Take and clear in one call so frames arriving in between are not lost
+            messages = self.driver.execute_script(
+                "return window.capturedMessages ? window.capturedMessages.splice(0) : [];")
             if messages:
                 self.messages.extend(messages)
                 logger.info(f"Collected {len(messages)} captured messages")
-                
-                # Clear captured messages
-                self.driver.execute_script("window.capturedMessages = [];")
         except Exception as e:
             logger.warning(f"Could not collect captured messages: {e}")
+            return
+        
+        if messages and self.on_messages:
+            try:
+                self.on_messages(messages)
+            except Exception as e:
+                logger.warning(f"Live message handler failed: {e}")
     
     def wait_for_socketio_activity(self, duration: int = 30):
         """Wait and monitor for Socket.IO activity with auto-scrolling"""
@@ -282,19 +304,24 @@ class SocketIOCapture:
         
         logger.info("Monitoring complete")
     
+    def merge_sources(self):
+        """Fold CDP log entries into self.messages, one record per frame"""
+        # Hook frames first, CDP only for frames the hook did not see
+        if self.network_entries:
+            merged = merge_capture_sources(self.messages, self.network_entries)
+            logger.info(f"Dropped {len(self.messages) + len(self.network_entries) - len(merged)} duplicate CDP frames")
+            self.messages, self.network_entries = merged, []
+    
     def save_results(self, filename: str = "winamax_socketio_analysis.json"):
         """Save analysis results to JSON file"""
         logger.info(f"Saving results to {filename}...")
         
-        output = {
-            'url': self.url,
-            'timestamp': datetime.now().isoformat(),
-            'message_count': len(self.messages),
-            'messages': self.messages
-        }
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
+        self.merge_sources()
+        if self.segment_dir:
+            write_capture_segments(self.messages, self.url, self.segment_dir, decoded=self.decoded_payloads)
+            filename = self.segment_dir
+        else:
+            write_capture_file(self.messages, self.url, filename, decoded=self.decoded_payloads)
         
         logger.info(f"Results saved to {filename}")
         
@@ -318,8 +345,8 @@ class SocketIOCapture:
         else:
             print("\nNo messages captured. Socket.IO might not be used or detection failed.")
     
-    def run(self, duration: int = 30):
-        """Run the complete analysis"""
+    def run(self, duration: int = 30, save: bool = True):
+        """Run the complete analysis, without save the merged frames are only kept in self.messages"""
         try:
             logger.info("Starting Winamax Socket.IO analysis...")
             
@@ -336,7 +363,10 @@ class SocketIOCapture:
             self.analyze_network_logs()
             
             # Save results
-            self.save_results()
+            if save:
+                self.save_results()
+            else:
+                self.merge_sources()
             
         except Exception as e:
             logger.error(f"Error during analysis: {e}", exc_info=True)
@@ -351,6 +381,233 @@ class SocketIOCapture:
         if self.driver:
             self.driver.quit()
 
+class PersistentCaptureWorker:
+    """Long-lived capture worker keeping one stealthed Chrome session open.
+
+    window.capturedMessages is drained continuously and handed to
+    on_messages. A health check reloads the page when the WebSocket closes
+    or goes quiet, and restarts the driver when it stops responding or
+    reloads keep failing. Each page load is a session that starts with a
+    full initial frame; on_session_start is called before its first batch.
+    """
+    
+    def __init__(self, on_messages: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 on_session_start: Optional[Callable[[], None]] = None,
+                 on_save: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 drain_interval: float = 2, scroll_interval: float = 5,
+                 health_check_interval: float = 30, stale_after: float = 120,
+                 max_reloads_before_restart: int = 2, save_interval: float = 60,
+                 max_session_messages: int = 20000, decoded_payloads: bool = False,
+                 segment_dir: Optional[str] = None, url: str = WINAMAX_PAGE_URL):
+        self.url = url
+        self.on_messages = on_messages
+        self.on_session_start = on_session_start
+        self.on_save = on_save
+        self.drain_interval = drain_interval
+        self.scroll_interval = scroll_interval
+        self.health_check_interval = health_check_interval
+        self.stale_after = stale_after
+        self.max_reloads_before_restart = max_reloads_before_restart
+        self.save_interval = save_interval
+        # Reload (fresh session with a new initial frame) once a session holds this many messages
+        self.max_session_messages = max_session_messages
+        self.decoded_payloads = decoded_payloads
+        # Append each session to segments as it grows instead of rewriting the capture file
+        self.segment_dir = segment_dir
+        self.segment_writer: Optional[SegmentedCaptureWriter] = None
+        self.saved_messages = 0
+        
+        self.capture: Optional[SocketIOCapture] = None
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.reload_requested = False
+        self.websocket_open = False
+        self.session_started: Optional[float] = None
+        self.last_frame_time: Optional[float] = None
+        self.last_health_check = 0.0
+        self.last_save = 0.0
+        self.last_scroll = 0.0
+        self.failed_reloads = 0
+        self.reloads = 0
+        self.driver_restarts = 0
+        self.last_error: Optional[str] = None
+    
+    def start(self):
+        """Start the worker thread"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Stop the worker and close the browser"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+        self._quit_driver()
+    
+    def request_reload(self):
+        """Ask the worker to reload the page (fresh session) on its next tick"""
+        self.reload_requested = True
+    
+    def status(self) -> Dict[str, Any]:
+        """Worker health summary for the API"""
+        now = time.time()
+        return {
+            'running': self.running,
+            'websocket_open': self.websocket_open,
+            'session_age_seconds': round(now - self.session_started, 1) if self.session_started else None,
+            'last_frame_age_seconds': round(now - self.last_frame_time, 1) if self.last_frame_time else None,
+            'session_messages': len(self.capture.messages) if self.capture else 0,
+            'reloads': self.reloads,
+            'driver_restarts': self.driver_restarts,
+            'last_error': self.last_error
+        }
+    
+    def _handle_batch(self, messages: List[Dict[str, Any]]):
+        """Track WebSocket health from drained messages, then forward them"""
+        for message in messages:
+            event = message.get('event')
+            if event == 'websocket_open':
+                self.websocket_open = True
+            elif event == 'websocket_close':
+                self.websocket_open = False
+            elif event == 'websocket_message':
+                self.last_frame_time = time.time()
+        if self.on_messages:
+            self.on_messages(messages)
+    
+    def _start_driver(self):
+        """Start Chrome with stealth and the capture script (driver setup happens once per restart)"""
+        self.capture = SocketIOCapture(on_messages=self._handle_batch, decoded_payloads=self.decoded_payloads,
+                                       url=self.url)
+        self.capture.inject_socketio_capture()
+        self._start_session(reload=False)
+    
+    def _start_session(self, reload: bool = True):
+        """(Re)load the page, the injected script re-arms itself on every navigation"""
+        self.save()
+        if self.segment_writer is not None:
+            self.segment_writer.close()
+            self.segment_writer = None
+        if self.on_session_start:
+            self.on_session_start()
+        self.capture.messages = []
+        self.saved_messages = 0
+        self.websocket_open = False
+        self.last_frame_time = None
+        self.session_started = time.time()
+        if reload:
+            logger.info("Reloading page for a fresh Socket.IO session...")
+            self.reloads += 1
+        self.capture.load_page()
+    
+    def _quit_driver(self):
+        if self.capture is not None:
+            try:
+                self.capture.cleanup()
+            except Exception:
+                pass
+            self.capture = None
+    
+    def _restart_driver(self, reason: str):
+        logger.warning(f"Restarting browser: {reason}")
+        self.last_error = reason
+        self._quit_driver()
+        self.driver_restarts += 1
+        self.failed_reloads = 0
+        self._start_driver()
+    
+    def health_check(self) -> bool:
+        """Check driver responsiveness, WebSocket state and frame freshness, heal if needed"""
+        try:
+            self.capture.driver.execute_script("return document.readyState;")
+        except Exception as e:
+            self._restart_driver(f"driver not responding ({e})")
+            return False
+        
+        now = time.time()
+        reference = self.last_frame_time or self.session_started
+        stale = now - reference > self.stale_after
+        if self.websocket_open and not stale:
+            self.failed_reloads = 0
+            return True
+        
+        reason = "WebSocket closed" if not self.websocket_open else f"no frames for {int(now - reference)}s"
+        self.last_error = reason
+        if self.failed_reloads >= self.max_reloads_before_restart:
+            self._restart_driver(reason)
+        else:
+            logger.warning(f"Capture unhealthy ({reason}), reloading page")
+            self.failed_reloads += 1
+            self._start_session()
+        return False
+    
+    def save(self):
+        """Save the current session to the capture file (or append it to segments) and notify on_save"""
+        self.last_save = time.time()
+        if self.capture is None or not self.capture.messages:
+            return
+        try:
+            if self.segment_dir:
+                if self.segment_writer is None:
+                    self.segment_writer = SegmentedCaptureWriter(self.segment_dir, self.capture.url,
+                                                                 decoded=self.decoded_payloads)
+                self.segment_writer.append(self.capture.messages[self.saved_messages:])
+                self.saved_messages = len(self.capture.messages)
+                self.segment_writer.flush()
+                document = self.segment_writer.metadata()
+            else:
+                document = write_capture_file(self.capture.messages, self.capture.url,
+                                              decoded=self.decoded_payloads)
+            if self.on_save:
+                self.on_save(document)
+        except Exception as e:
+            logger.warning(f"Could not save capture: {e}")
+    
+    def _tick(self):
+        """One drain cycle: collect, scroll, save and health-check when due"""
+        self.capture.collect_captured_messages()
+        now = time.time()
+        
+        if now - self.last_scroll >= self.scroll_interval:
+            try:
+                self.capture.driver.execute_script("window.scrollBy(0, 1000);")
+            except Exception:
+                pass
+            self.last_scroll = now
+        
+        if now - self.last_save >= self.save_interval:
+            self.save()
+        
+        if self.reload_requested or len(self.capture.messages) >= self.max_session_messages:
+            self.reload_requested = False
+            self._start_session()
+        elif now - self.last_health_check >= self.health_check_interval:
+            self.last_health_check = now
+            self.health_check()
+    
+    def _run(self):
+        backoff = 5
+        while self.running:
+            try:
+                if self.capture is None:
+                    self._start_driver()
+                    backoff = 5
+                self._tick()
+            except Exception as e:
+                logger.error(f"Persistent capture error: {e}", exc_info=True)
+                self.last_error = str(e)
+                self._quit_driver()
+                self.driver_restarts += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+                continue
+            time.sleep(self.drain_interval)
+        self.save()
+
+
 def main():
     """Main entry point"""
     print("\nWinamax Socket.IO Traffic Analyzer")
@@ -0,0 +1,298 @@
+"""
+Winamax Benchmarks
+Author: Anass EL
+Description: Micro-benchmarks of the serve path (parse, state build, filters, serialization, endpoints) written to JSON
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import combinations
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+import serve_data
+from capture_store import write_capture_file
+from compact_records import memory_budget
+from match_columns import NUMPY_AVAILABLE, build_columns
+from match_store import MatchState, parse_socketio_message
+from response_cache import BROTLI_AVAILABLE, RenderedBody
+from synthetic_capture import frame_sizes, generate_capture
+
+BENCHMARK_FILE = 'benchmark_results.json'
+DEFAULT_SCALES = (1000, 10000)  # Synthetic catalogue sizes, with 2 update frames per match
+DEFAULT_REPEAT = 5
+REGRESSION_THRESHOLD = 1.10  # Median ratio flagged when comparing runs
+FILTER_PARAMS = ('sportId', 'date', 'range', 'morethan', 'anyonehas')
+BATCH_SIZE = 50  # Ids per benchmarked batch lookup
+
+
+def measure(func, repeat=DEFAULT_REPEAT, warmup=1):
+    """Wall-clock milliseconds of repeat calls of func after warmup calls"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'max_ms': round(max(samples), 3),
+        'runs': repeat
+    }
+
+
+def raw_frames(messages):
+    return [msg['data']['raw'] for msg in messages
+            if isinstance(msg.get('data'), dict) and isinstance(msg['data'].get('raw'), str)]
+
+
+def filter_values(snapshot):
+    """Filter arguments that select a realistic slice of the snapshot"""
+    sport_id = max(snapshot.by_sport, key=lambda key: len(snapshot.by_sport[key][0]), default=1)
+    dated = [start for start in snapshot.ordered_starts if start != float('inf')]
+    median_start = dated[len(dated) // 2] if dated else time.time()
+    return {
+        'sportId': {'sportId': str(sport_id)},
+        'date': {'date': datetime.fromtimestamp(median_start, tz=timezone.utc).strftime('%d-%m-%Y')},
+        'range': {'from': str(int(median_start)), 'to': str(int(median_start) + 86400)},
+        'morethan': {'morethan': '2.0'},
+        'anyonehas': {'anyonehas': '1.4'}
+    }
+
+
+def filter_combinations(values):
+    """(name, args) for every combination of the /api/matches filters, 'none' first"""
+    for size in range(len(FILTER_PARAMS) + 1):
+        for names in combinations(FILTER_PARAMS, size):
+            args = {}
+            for name in names:
+                args.update(values[name])
+            yield '+'.join(names) or 'none', ImmutableMultiDict(args)
+
+
+def benchmark_parse(capture, repeat, timings):
+    """Capture file load and frame parsing"""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'capture.json')
+        write_capture_file(capture['messages'], capture.get('url'), filename=filename)
+        size = os.path.getsize(filename)
+
+        def load():
+            with open(filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        timings['parse.capture_file'] = measure(load, repeat)
+    frames = raw_frames(capture['messages'])
+    timings['parse.frames'] = measure(lambda: [parse_socketio_message(raw) for raw in frames], repeat)
+    timings['parse.frames']['frames'] = len(frames)
+    return size
+
+
+def benchmark_state(capture, repeat, timings):
+    """State build from the messages and snapshot materialization, returns the snapshot"""
+    messages = capture['messages']
+    for name, compact in (('dict', False), ('compact', True)):
+        timings[f'state.build_{name}'] = measure(lambda: MatchState(compact=compact).apply_messages(messages), repeat)
+    state = MatchState(compact=serve_data.COMPACT_RECORDS_ENABLED)
+    state.apply_messages(messages)
+    timings['snapshot.materialize'] = measure(state.snapshot, repeat)
+    snapshot = state.snapshot(url=capture.get('url'), timestamp=capture.get('timestamp'))
+    if NUMPY_AVAILABLE:
+        timings['snapshot.columns'] = measure(lambda: build_columns(snapshot), repeat)
+    return snapshot
+
+
+def benchmark_filters(snapshot, repeat, timings):
+    """Every filter combination with the index backend and, with NumPy, the columnar backend"""
+    values = filter_values(snapshot)
+    backends = [('index', None)]
+    if NUMPY_AVAILABLE:
+        backends.append(('columnar', build_columns(snapshot)))
+    for backend, columns in backends:
+        snapshot.columns = columns
+        for name, args in filter_combinations(values):
+            key = f'filter.{backend}.{name}'
+            timings[key] = measure(lambda: serve_data.filter_match_ids(snapshot, args), repeat)
+            timings[key]['matches'] = len(serve_data.filter_match_ids(snapshot, args))
+    snapshot.columns = None
+
+
+def benchmark_serialization(snapshot, repeat, timings):
+    """Payload build, JSON rendering and compression of the unfiltered match lists"""
+    no_args = ImmutableMultiDict()
+    for name, build_payload in (('matches', serve_data.build_matches_payload),
+                                ('verbose', serve_data.build_matches_verbose_payload)):
+        payload = build_payload(snapshot, no_args)
+        body = serve_data.render_payload(payload).identity
+        timings[f'payload.{name}'] = measure(lambda: build_payload(snapshot, no_args), repeat)
+        timings[f'serialize.{name}'] = measure(lambda: serve_data.render_payload(payload), repeat)
+        timings[f'serialize.{name}']['bytes'] = len(body)
+        timings[f'compress.{name}.gzip'] = measure(lambda: RenderedBody(body).encoded('gzip'), repeat)
+        timings[f'compress.{name}.gzip']['bytes'] = len(RenderedBody(body).encoded('gzip')[0])
+        if BROTLI_AVAILABLE:
+            timings[f'compress.{name}.br'] = measure(lambda: RenderedBody(body).encoded('br'), repeat)
+            timings[f'compress.{name}.br']['bytes'] = len(RenderedBody(body).encoded('br')[0])
+
+
+def endpoint_requests(snapshot):
+    """(name, method, url, json body) of the benchmarked API requests"""
+    values = filter_values(snapshot)
+    listed = snapshot.ordered_ids
+    match_id = listed[len(listed) // 2] if listed else '0'
+    batch_ids = [str(match_id) for match_id in listed[::max(1, len(listed) // BATCH_SIZE)][:BATCH_SIZE]]
+    sport_date = '&'.join(f'{key}={value}' for key, value in {**values['sportId'], **values['date']}.items())
+    return [
+        ('matches', 'GET', '/api/matches', None),
+        ('matches_verbose', 'GET', '/api/matches/verbose', None),
+        ('matches_sport_date', 'GET', f'/api/matches?{sport_date}', None),
+        ('matches_morethan', 'GET', '/api/matches?morethan=2.0', None),
+        ('matches_anyonehas', 'GET', '/api/matches?anyonehas=1.4', None),
+        ('matches_page', 'GET', '/api/matches?limit=100', None),
+        ('verbose_projected_page', 'GET', '/api/matches/verbose?fields=title,matchStart,odds&limit=100', None),
+        ('match', 'GET', f'/api/matches/{match_id}', None),
+        ('match_history', 'GET', f'/api/matches/{match_id}/history', None),
+        ('matches_ids', 'GET', '/api/matches?ids=' + ','.join(batch_ids), None),
+        ('matches_batch', 'POST', '/api/matches/batch', {'ids': batch_ids}),
+        ('status', 'GET', '/api/status', None)
+    ]
+
+
+def benchmark_endpoints(capture, repeat, timings):
+    """Flask endpoints through the test client, with cold caches and warm (cached) responses"""
+    state = MatchState(serve_data.odds_history, serve_data.COMPACT_RECORDS_ENABLED)
+    state.apply_messages(capture['messages'])
+    snapshot = state.snapshot(url=capture.get('url'), timestamp=capture.get('timestamp'))
+    serve_data.captured_data = {key: value for key, value in capture.items() if key != 'messages'}
+    serve_data.publish_snapshot(snapshot)
+    client = serve_data.app.test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+
+    def cold(method, url, body):
+        serve_data.response_cache.clear()
+        snapshot.rendered.clear()
+        return client.open(url, method=method, json=body, headers=headers)
+
+    for name, method, url, body in endpoint_requests(snapshot):
+        response = cold(method, url, body)
+        timings[f'endpoint.cold.{name}'] = measure(lambda: cold(method, url, body), repeat)
+        timings[f'endpoint.cold.{name}']['bytes'] = len(response.get_data())
+        timings[f'endpoint.cold.{name}']['status'] = response.status_code
+        timings[f'endpoint.cached.{name}'] = measure(
+            lambda: client.open(url, method=method, json=body, headers=headers), repeat)
+
+
+def run_benchmarks(capture, repeat=DEFAULT_REPEAT, memory=True, label=None):
+    """Time the serve path on one capture document, returns a run entry of the results file"""
+    timings = {}
+    started = time.time()
+    file_bytes = benchmark_parse(capture, repeat, timings)
+    snapshot = benchmark_state(capture, repeat, timings)
+    benchmark_filters(snapshot, repeat, timings)
+    benchmark_serialization(snapshot, repeat, timings)
+    benchmark_endpoints(capture, repeat, timings)
+    sizes = sorted(frame_sizes(capture))
+    run = {
+        'label': label or f"{len(snapshot.matches)} matches",
+        'capture': {
+            'messages': len(capture['messages']),
+            'frames': len(sizes),
+            'file_bytes': file_bytes,
+            'largest_frame_bytes': sizes[-1] if sizes else 0,
+            'median_frame_bytes': sizes[len(sizes) // 2] if sizes else 0,
+            'matches': len(snapshot.matches),
+            'listed_matches': len(snapshot.ordered_ids),
+            'outcomes': len(snapshot.outcomes)
+        },
+        'timings': timings
+    }
+    if memory:
+        run['memory'] = memory_budget(capture['messages'])
+    run['elapsed_s'] = round(time.time() - started, 1)
+    return run
+
+
+def run_suite(scales=DEFAULT_SCALES, repeat=DEFAULT_REPEAT, capture_files=(), seed=0, memory=True):
+    """Benchmark synthetic captures of each (matches, updates) scale and the given capture files"""
+    runs = []
+    for scale in scales:
+        matches, updates = scale if isinstance(scale, tuple) else (scale, 2 * scale)
+        capture = generate_capture(matches, updates, seed=seed)
+        run = run_benchmarks(capture, repeat, memory, label=f'synthetic {matches} matches')
+        run['capture'].update(source='synthetic', requested_matches=matches, updates=updates, seed=seed)
+        runs.append(run)
+    for filename in capture_files:
+        with open(filename, 'r', encoding='utf-8') as f:
+            capture = json.load(f)
+        run = run_benchmarks(capture, repeat, memory, label=filename)
+        run['capture']['source'] = filename
+        runs.append(run)
+    return {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': NUMPY_AVAILABLE,
+        'brotli': BROTLI_AVAILABLE,
+        'compact_records': serve_data.COMPACT_RECORDS_ENABLED,
+        'repeat': repeat,
+        'runs': runs
+    }
+
+
+def compare_results(previous, current):
+    """(label, benchmark, previous median, current median, ratio) of benchmarks present in both files"""
+    previous_runs = {run['label']: run for run in previous.get('runs', [])}
+    rows = []
+    for run in current.get('runs', []):
+        before = previous_runs.get(run['label'])
+        if before is None:
+            continue
+        for name, stats in run['timings'].items():
+            old = before['timings'].get(name)
+            if old is None or not old['median_ms']:
+                continue
+            rows.append((run['label'], name, old['median_ms'], stats['median_ms'],
+                         round(stats['median_ms'] / old['median_ms'], 2)))
+    return rows
+
+
+def parse_scales(value):
+    """'1000,10000:50000' -> [(1000, 2000), (10000, 50000)]"""
+    scales = []
+    for part in value.split(','):
+        matches, _, updates = part.partition(':')
+        scales.append((int(matches), int(updates) if updates else 2 * int(matches)))
+    return scales
+
+
+def main():
+    """python benchmark.py [matches[:updates],...|capture.json] [results.json] [previous_results.json]"""
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    output = sys.argv[2] if len(sys.argv) > 2 else BENCHMARK_FILE
+    previous_file = sys.argv[3] if len(sys.argv) > 3 else None
+    if target and target.endswith('.json'):
+        results = run_suite(scales=(), capture_files=[target])
+    else:
+        results = run_suite(scales=parse_scales(target) if target else DEFAULT_SCALES)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    for run in results['runs']:
+        print(f"✓ {run['label']}: {len(run['timings'])} benchmarks in {run['elapsed_s']}s")
+    print(f"Results written to {output}")
+
+    if previous_file:
+        with open(previous_file, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        for label, name, old, new, ratio in compare_results(previous, results):
+            flag = ' ⚠' if ratio >= REGRESSION_THRESHOLD else ''
+            print(f"{label:<28} {name:<52} {old:10.3f} ms → {new:10.3f} ms  {ratio:5.2f}x{flag}")
+
+
+if __name__ == '__main__':
+    main()
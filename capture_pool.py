@@ -0,0 +1,130 @@
+"""
+Winamax Capture Pool
+Author: Anass EL
+Description: Captures several sport/tournament pages concurrently in browser worker processes and merges their frames
+"""
+import logging
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from analyze_winamax_socketio import SocketIOCapture
+from capture_segments import write_capture_segments
+from capture_store import PAGE_KEY, parse_timestamp, write_capture_file
+
+logger = logging.getLogger(__name__)
+
+DRAIN_TIMEOUT = 0.5  # Seconds the parent waits for a streamed batch before checking the workers
+
+
+def capture_page(url, duration, frames, capture_class=SocketIOCapture):
+    """Worker process: capture one page, streaming drained batches to the frames queue.
+
+    Returns the page's messages with its CDP frames merged in; the capture
+    file is written by the parent once every page is done.
+    """
+    capture = capture_class(on_messages=lambda batch: frames.put((url, batch)), url=url)
+    capture.run(duration=duration, save=False)
+    return capture.messages
+
+
+def tag_messages(messages, url):
+    """Copies of messages carrying the page they were captured from"""
+    return [{**msg, PAGE_KEY: url} if isinstance(msg, dict) else msg for msg in messages]
+
+
+class CapturePool:
+    """Runs one browser capture per page on a bounded pool of worker processes.
+
+    Workers are spawned processes (one Chrome each, at most max_workers at
+    a time), so N pages take the wall-clock time of one page while the pool
+    is large enough. Batches drained by every worker are streamed back,
+    tagged with their page and handed to on_messages as they arrive, so one
+    MatchState ingests the whole catalogue live. When all pages are done
+    their messages are merged in timestamp order into one capture file (or
+    segment session).
+    """
+
+    def __init__(self, urls, max_workers=4, on_messages=None, decoded_payloads=False, segment_dir=None,
+                 capture_class=SocketIOCapture):
+        if not urls:
+            raise ValueError('CapturePool needs at least one page')
+        self.urls = list(dict.fromkeys(urls))
+        self.url = self.urls[0]  # Capture information url, every page is listed under 'pages'
+        self.max_workers = max(1, min(max_workers, len(self.urls)))
+        self.on_messages = on_messages
+        self.decoded_payloads = decoded_payloads
+        self.segment_dir = segment_dir
+        self.capture_class = capture_class
+        self.messages = []
+        self.pages = {url: {'frames': 0, 'messages': 0, 'elapsed': None, 'error': None} for url in self.urls}
+
+    def _handle_batch(self, url, batch):
+        self.pages[url]['frames'] += len(batch)
+        if self.on_messages:
+            try:
+                self.on_messages(tag_messages(batch, url))
+            except Exception as e:
+                logger.warning(f"Live message handler failed: {e}")
+
+    def _drain(self, frames, timeout):
+        try:
+            url, batch = frames.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        self._handle_batch(url, batch)
+        while True:
+            try:
+                url, batch = frames.get_nowait()
+            except queue.Empty:
+                return True
+            self._handle_batch(url, batch)
+
+    def run(self, duration=30):
+        """Capture every page for duration seconds and save the merged capture, returns the messages"""
+        started = time.time()
+        results = {}
+        # Spawned, not forked: the API process has running threads
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            frames = manager.Queue()
+            with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as pool:
+                futures = {pool.submit(capture_page, url, duration, frames, self.capture_class): url
+                           for url in self.urls}
+                logger.info(f"Capturing {len(self.urls)} pages on {self.max_workers} workers")
+                pending = set(futures)
+                while pending:
+                    self._drain(frames, DRAIN_TIMEOUT)
+                    for future in [future for future in pending if future.done()]:
+                        pending.discard(future)
+                        url = futures[future]
+                        self.pages[url]['elapsed'] = round(time.time() - started, 1)
+                        try:
+                            results[url] = future.result()
+                        except Exception as e:
+                            logger.error(f"Capture of {url} failed: {e}")
+                            self.pages[url]['error'] = str(e)
+            while self._drain(frames, 0):
+                pass
+
+        merged = []
+        for url in self.urls:
+            page_messages = tag_messages(results.get(url, []), url)
+            self.pages[url]['messages'] = len(page_messages)
+            merged.extend(page_messages)
+        merged.sort(key=lambda msg: parse_timestamp(msg.get('timestamp')) or 0.0)
+        self.messages = merged
+        self.save_results()
+        logger.info(f"Captured {len(merged)} messages from {len(results)}/{len(self.urls)} pages "
+                    f"in {time.time() - started:.1f}s")
+        return merged
+
+    def save_results(self):
+        if self.segment_dir:
+            write_capture_segments(self.messages, self.url, self.segment_dir, decoded=self.decoded_payloads)
+        else:
+            write_capture_file(self.messages, self.url, decoded=self.decoded_payloads, pages=self.urls)
+
+    def status(self):
+        return {'workers': self.max_workers, 'pages': self.pages}
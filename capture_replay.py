@@ -0,0 +1,259 @@
+"""
+Winamax Capture Replay
+Author: Anass EL
+Description: Replays a capture through the local Socket.IO stand-in into the live ingestion path and API, reporting lag and freshness
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+from capture_segments import SegmentedCaptureReader
+from capture_store import CAPTURE_FILE, frame_text, parse_timestamp
+from engineio_client import SocketIOClientCapture
+from engineio_standin import SocketIOStandInServer
+
+logger = logging.getLogger(__name__)
+
+REPLAY_REPORT_FILE = 'replay_report.json'
+BATCH_INTERVAL = 0.5  # Seconds between batches drained by the replay client
+POLL_INTERVAL = 0.25  # Seconds between API freshness probes
+POLL_PATH = '/api/matches'
+DRAIN_GRACE = 10.0  # Seconds without a frame, once the schedule is over, before the replay stops waiting
+
+
+def load_replay_frames(source):
+    """(epoch, raw) of the '42["m",...]' frames of a capture file or segment directory (last session)"""
+    if os.path.isdir(source):
+        reader = SegmentedCaptureReader(source)
+        messages = reader.iter_messages(reader.last_session_start())
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            messages = json.load(f).get('messages', [])
+    frames = []
+    for msg in messages:
+        if not isinstance(msg, dict) or msg.get('event') != 'websocket_message':
+            continue
+        raw = frame_text(msg.get('data'))
+        if raw.startswith('42["m"'):
+            frames.append((parse_timestamp(msg.get('timestamp')), raw))
+    return frames
+
+
+def replay_schedule(epochs, speed=1.0):
+    """Send offsets in seconds: capture gaps divided by speed, all 0 when speed is None (as fast as possible)"""
+    if not speed:
+        return [0.0] * len(epochs)
+    offsets = []
+    first = None
+    offset = 0.0
+    for epoch in epochs:
+        # Frames without a timestamp go out with the previous one
+        if epoch is not None:
+            first = epoch if first is None else first
+            offset = max(offset, (epoch - first) / speed)
+        offsets.append(offset)
+    return offsets
+
+
+def frame_messages(batch):
+    """Number of websocket frames in a batch of captured messages"""
+    return sum(1 for msg in batch if msg.get('event') == 'websocket_message')
+
+
+def distribution(samples):
+    """Percentiles in milliseconds of durations in seconds, None without samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+    return {
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ordered[-1] * 1000, 1),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 1),
+        'samples': len(ordered)
+    }
+
+
+class CaptureReplay:
+    """Serves capture frames from the stand-in to a SocketIOClientCapture and measures the pipeline.
+
+    Frames go out on their captured schedule divided by speed (back to back
+    when speed is None) and reach on_messages in drained batches, exactly
+    like a direct Socket.IO capture. A frame's ingest lag runs from its send
+    to the end of the on_messages call that applied it. probe() returns how
+    many frames the API currently reflects; API freshness is the age of the
+    oldest sent frame it does not reflect yet (0 when it is up to date).
+    probe() is called every poll_interval seconds, and before every batch
+    when speed is None: a replay as fast as possible can be over before the
+    first poll.
+    """
+
+    def __init__(self, frames, speed=1.0, on_messages=None, probe=None,
+                 batch_interval=BATCH_INTERVAL, poll_interval=POLL_INTERVAL):
+        self.frames = frames
+        self.speed = speed
+        self.on_messages = on_messages
+        self.probe = probe
+        self.batch_interval = batch_interval
+        self.poll_interval = poll_interval
+        self.probe_each_batch = probe is not None and not speed
+        self.server = None
+        self.applied_times = []
+        self.freshness = []
+
+    def _on_messages(self, batch):
+        if self.probe_each_batch:
+            self._probe_once()
+        if self.on_messages:
+            self.on_messages(batch)
+        done = time.time()
+        self.applied_times.extend([done] * frame_messages(batch))
+
+    def _probe_once(self):
+        try:
+            visible = self.probe()
+        except Exception as e:
+            logger.warning(f"Freshness probe failed: {e}")
+            return
+        sent_times = self.server.sent_times
+        now = time.time()
+        self.freshness.append(now - sent_times[visible] if visible < len(sent_times) else 0.0)
+
+    def _poll(self, stop):
+        while not stop.wait(self.poll_interval):
+            self._probe_once()
+
+    def run(self):
+        """Replay every frame, returns the report"""
+        schedule = replay_schedule([epoch for epoch, _ in self.frames], self.speed)
+        last_offset = schedule[-1] if schedule else 0.0
+        self.server = SocketIOStandInServer([raw for _, raw in self.frames], schedule=schedule)
+        capture = None
+        with self.server:
+            capture = SocketIOClientCapture(on_messages=self._on_messages, socket_url=self.server.url,
+                                            batch_interval=self.batch_interval)
+            stop = threading.Event()
+            poller = threading.Thread(target=self._poll, args=(stop,), daemon=True)
+            if self.probe is not None:
+                poller.start()
+            started = time.time()
+            progress = {'count': 0, 'time': started}
+
+            def should_stop():
+                now = time.time()
+                if capture.frame_count != progress['count']:
+                    progress.update(count=capture.frame_count, time=now)
+                if capture.frame_count >= len(self.frames):
+                    return True
+                return now > started + last_offset and now - progress['time'] > DRAIN_GRACE
+
+            logger.info(f"Replaying {len(self.frames)} frames from {self.server.url} "
+                        f"({f'{self.speed}x' if self.speed else 'as fast as possible'})")
+            capture.run(duration=None, save=False, should_stop=should_stop)
+            stop.set()
+            if self.probe is not None:
+                poller.join()
+                self._probe_once()
+        return self.report(capture)
+
+    def report(self, capture):
+        sent_times = self.server.sent_times
+        lags = [applied - sent for sent, applied in zip(sent_times, self.applied_times)]
+        epochs = [epoch for epoch, _ in self.frames if epoch is not None]
+        elapsed = (self.applied_times[-1] - sent_times[0]) if self.applied_times and sent_times else 0.0
+        sent_bytes = sum(len(raw.encode('utf-8')) for _, raw in self.frames[:len(sent_times)])
+        return {
+            'frames': len(self.frames),
+            'sent': len(sent_times),
+            'received': capture.frame_count,
+            'applied': len(self.applied_times),
+            'speed': self.speed or 'max',
+            'capture_span_s': round(epochs[-1] - epochs[0], 3) if epochs else 0.0,
+            'elapsed_s': round(elapsed, 3),
+            'frames_per_s': round(len(self.applied_times) / elapsed, 1) if elapsed else None,
+            'megabytes_per_s': round(sent_bytes / elapsed / 1e6, 2) if elapsed else None,
+            'ingest_lag': distribution(lags),
+            'api_freshness': distribution(self.freshness),
+            'freshness_probes': 'before every batch' if self.probe_each_batch else f'every {self.poll_interval}s'
+        }
+
+
+def replay_into_api(source, speed=1.0, batch_interval=BATCH_INTERVAL, poll_interval=POLL_INTERVAL):
+    """Replay a capture into serve_data's live state and snapshots while probing POLL_PATH.
+
+    Batches are applied and published like run_capture() does with live
+    frames, at most every LIVE_PUBLISH_INTERVAL seconds; the probe reads the
+    snapshot version of each API response from its ETag to know which
+    frames the API was serving.
+    """
+    import serve_data
+    from match_store import LiveStatePublisher, MatchState
+
+    frames = load_replay_frames(source)
+    state = MatchState(serve_data.odds_history, serve_data.COMPACT_RECORDS_ENABLED)
+    published = {}  # snapshot version -> frames it reflects
+    publish_lock = threading.Lock()
+
+    def publish(state):
+        # Replayed frames are all 'm' frames, so frames applied = frames sent; the publisher
+        # (also called from its timer) never runs while a batch is being applied
+        with publish_lock:
+            serve_data.publish_snapshot(state.snapshot(url=source))
+            published[serve_data.snapshot_version] = state.frame_count
+
+    publisher = LiveStatePublisher(state, publish, serve_data.LIVE_PUBLISH_INTERVAL)
+
+    client = serve_data.app.test_client()
+
+    def probe():
+        etag, _ = client.get(POLL_PATH).get_etag()
+        version = int(etag.split('-')[0][1:]) if etag else None
+        with publish_lock:
+            return published.get(version, 0)
+
+    replay = CaptureReplay(frames, speed, publisher.apply_messages, probe, batch_interval, poll_interval)
+    try:
+        report = replay.run()
+    finally:
+        publisher.close()
+    report.update(source=source, poll_path=POLL_PATH, snapshots_published=len(published),
+                  publish_interval_s=serve_data.LIVE_PUBLISH_INTERVAL, matches=len(state.matches))
+    return report
+
+
+def parse_speed(value):
+    """'fast' or 'max' -> None (as fast as possible), otherwise a speed factor"""
+    return None if value in ('fast', 'max') else float(value)
+
+
+def main():
+    """python capture_replay.py [capture.json|segment_dir] [speed|fast] [report.json]"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    source = sys.argv[1] if len(sys.argv) > 1 else CAPTURE_FILE
+    speed = parse_speed(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    output = sys.argv[3] if len(sys.argv) > 3 else REPLAY_REPORT_FILE
+    report = replay_into_api(source, speed)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Replayed {report['applied']}/{report['frames']} frames in {report['elapsed_s']}s "
+          f"({report['frames_per_s']} frames/s, {report['snapshots_published']} snapshots, {report['matches']} matches)")
+    for name in ('ingest_lag', 'api_freshness'):
+        stats = report[name]
+        if stats:
+            print(f"  {name}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, max {stats['max_ms']} ms "
+                  f"({stats['samples']} samples)")
+    print(f"  API probed {report['freshness_probes']}, snapshots published at most every "
+          f"{report['publish_interval_s']}s")
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Winamax Adaptive Capture Scheduler
+Author: Anass EL
+Description: Picks the delay before the next capture and its duration from observed update rates
+"""
+import random
+import time
+
+
+class CaptureDecision:
+    """When the next capture starts, how long it runs, and why"""
+
+    __slots__ = ('delay', 'duration', 'reason', 'signals', 'decided_at')
+
+    def __init__(self, delay, duration, reason, signals, decided_at):
+        self.delay = delay
+        self.duration = duration
+        self.reason = reason
+        self.signals = signals
+        self.decided_at = decided_at
+
+    def to_dict(self):
+        return {
+            'delay_seconds': round(self.delay, 1),
+            'duration_seconds': round(self.duration, 1),
+            'reason': self.reason,
+            'signals': self.signals,
+            'decided_at': self.decided_at,
+            'next_capture_at': self.decided_at + self.delay
+        }
+
+
+class AdaptiveCaptureScheduler:
+    """Capture cadence driven by the last capture and the current snapshot.
+
+    Signals are the frame rate of the last capture, liveMatchCount /
+    reallyLiveMatchCount from the sports frames and the time until the next
+    listed matchStart:
+
+    - live: matches are really live, capture as often and as long as allowed
+    - pre-match: a match starts within prematch_window, capture more often
+      the closer it is
+    - busy: the last capture saw at least busy_frame_rate frames per second
+    - idle: nothing is moving, stretch the delay towards max_delay
+
+    Every delay gets +/- jitter, and consecutive failed captures back off
+    exponentially from backoff_base up to max_delay.
+    """
+
+    def __init__(self, base_delay=60, min_delay=15, max_delay=1800,
+                 base_duration=180, min_duration=60, max_duration=300,
+                 prematch_window=1800, busy_frame_rate=1.0, jitter=0.1,
+                 backoff_base=60, clock=time.time, rng=None):
+        self.base_delay = base_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.base_duration = base_duration
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.prematch_window = prematch_window
+        self.busy_frame_rate = busy_frame_rate
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.last_frame_rate = None
+        self.consecutive_failures = 0
+        self.captures = 0
+        self.failures = 0
+        self.last_decision = None
+
+    def record_capture(self, success, frames, elapsed):
+        """Feed back the outcome of one capture"""
+        self.captures += 1
+        if elapsed and elapsed > 0:
+            self.last_frame_rate = frames / elapsed
+        if success:
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def _clamp(self, value, low, high):
+        return max(low, min(high, value))
+
+    def next_decision(self, snapshot):
+        """Decide the delay before the next capture and its duration"""
+        now = self.clock()
+        counters = snapshot.counters
+        live = counters.get('reallyLiveMatchCount') or 0
+        until_next = snapshot.seconds_until_next_start(now)
+        frame_rate = self.last_frame_rate
+
+        if live > 0:
+            reason = 'live'
+            delay, duration = self.min_delay, self.max_duration
+        elif until_next is not None and until_next <= self.prematch_window:
+            reason = 'pre-match'
+            # Capture roughly four times before kick-off
+            delay, duration = until_next / 4, self.base_duration
+        elif frame_rate is not None and frame_rate >= self.busy_frame_rate:
+            reason = 'busy'
+            delay, duration = self.base_delay, self.base_duration
+        else:
+            reason = 'idle'
+            delay = until_next / 4 if until_next is not None else self.max_delay
+            delay, duration = max(delay, self.base_delay), self.min_duration
+
+        delay = self._clamp(delay, self.min_delay, self.max_delay)
+        if self.consecutive_failures:
+            reason += ' (backoff)'
+            backoff = self.backoff_base * 2 ** (self.consecutive_failures - 1)
+            delay = max(delay, min(backoff, self.max_delay))
+        if self.jitter:
+            delay *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+
+        signals = {
+            'frame_rate': round(frame_rate, 3) if frame_rate is not None else None,
+            'live_match_count': counters.get('liveMatchCount'),
+            'really_live_match_count': counters.get('reallyLiveMatchCount'),
+            'seconds_until_next_start': round(until_next) if until_next is not None else None,
+            'consecutive_failures': self.consecutive_failures
+        }
+        self.last_decision = CaptureDecision(delay, self._clamp(duration, self.min_duration, self.max_duration),
+                                             reason, signals, now)
+        return self.last_decision
+
+    def status(self):
+        return {
+            'captures': self.captures,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_decision': self.last_decision.to_dict() if self.last_decision else None
+        }
@@ -0,0 +1,308 @@
+"""
+Winamax Segmented Capture Store
+Author: Anass EL
+Description: Append-only gzip NDJSON capture segments with a sidecar index of frame offsets, timestamps and keys
+"""
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime
+
+from capture_store import atomic_write, decode_messages, generation_file, parse_timestamp
+from match_store import parse_socketio_message
+
+SEGMENT_DIR = 'captures'
+MANIFEST_FILE = 'manifest.json'
+BLOCK_RECORDS = 256  # Messages per gzip block (the unit loaders decompress)
+BLOCK_BYTES = 512 * 1024  # Uncompressed bytes that close a block early
+SEGMENT_BYTES = 64 * 1024 * 1024  # Compressed bytes after which a new segment file is started
+COMPRESS_LEVEL = 6
+KEEP_SESSIONS = 10  # Sessions kept on disk, older segments are deleted on flush (None keeps everything)
+
+
+def manifest_path(directory=SEGMENT_DIR):
+    return os.path.join(directory, MANIFEST_FILE)
+
+
+def read_manifest(directory=SEGMENT_DIR):
+    """Load the manifest of a segment directory, raises FileNotFoundError if there is none"""
+    with open(manifest_path(directory), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def payload_keys(message):
+    """Top-level keys of a '42["m",{...}]' frame, raw or decoded, [] for other messages"""
+    if not isinstance(message, dict) or message.get('event') != 'websocket_message':
+        return []
+    data = message.get('data')
+    if not isinstance(data, dict):
+        return []
+    if 'raw' in data:
+        parsed = parse_socketio_message(data['raw'])
+    else:
+        payload = data.get('payload')
+        parsed = payload[1] if isinstance(payload, list) and len(payload) > 1 else None
+    return sorted(parsed) if isinstance(parsed, dict) else []
+
+
+class SegmentedCaptureWriter:
+    """Appends captured messages to gzip NDJSON segments of a capture directory.
+
+    Messages are buffered into blocks; each block is one gzip member, so
+    segment files stay valid gzip streams (zcat works) and any block can be
+    decompressed on its own. Every segment has a sidecar .idx NDJSON file
+    with one entry per message: index, block offset and length, line within
+    the block, timestamp, event and payload keys. The manifest (segments,
+    sessions, message count, generation) is atomically replaced on every
+    flush() and is the only thing readers trust: index entries and blocks
+    beyond its message count are ignored.
+
+    Each writer is one capture session; loaders rebuild state from the
+    first message of the last session. With keep_sessions, every flush
+    deletes the segments that only hold older sessions.
+    """
+
+    def __init__(self, directory=SEGMENT_DIR, url=None, decoded=False, keep_sessions=KEEP_SESSIONS,
+                 block_records=BLOCK_RECORDS, block_bytes=BLOCK_BYTES, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.decoded = decoded
+        self.keep_sessions = keep_sessions
+        self.block_records = block_records
+        self.block_bytes = block_bytes
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        try:
+            self.manifest = read_manifest(directory)
+        except FileNotFoundError:
+            self.manifest = {'message_count': 0, 'generation': 0, 'segments': [], 'sessions': []}
+        self.manifest['url'] = url
+        self.session = uuid.uuid4().hex
+        self.manifest['sessions'].append({
+            'session': self.session,
+            'first_index': self.manifest['message_count'],
+            'started': datetime.now().isoformat()
+        })
+        self.message_count = self.manifest['message_count']
+        self._block = []
+        self._block_size = 0
+        self._segment = None
+        self._data_file = None
+        self._index_file = None
+
+    def _open_segment(self):
+        number = self.manifest['segments'][-1]['number'] + 1 if self.manifest['segments'] else 1
+        name = f'segment-{number:06d}'
+        self._segment = {
+            'number': number,
+            'file': name + '.ndjson.gz',
+            'index': name + '.idx',
+            'first_index': self.message_count,
+            'count': 0,
+            'bytes': 0
+        }
+        self.manifest['segments'].append(self._segment)
+        # A file of this number missing from the manifest was left by a writer that never
+        # flushed it: offsets start at 0, so it is truncated rather than appended to
+        self._data_file = open(os.path.join(self.directory, self._segment['file']), 'wb')
+        self._index_file = open(os.path.join(self.directory, self._segment['index']), 'w', encoding='utf-8')
+
+    def append(self, messages):
+        """Buffer messages, writing every block that fills up"""
+        if self.decoded:
+            messages = decode_messages(messages)
+        for message in messages:
+            line = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            self._block.append((message, line))
+            self._block_size += len(line)
+            if len(self._block) >= self.block_records or self._block_size >= self.block_bytes:
+                self._write_block()
+
+    def _write_block(self):
+        if not self._block:
+            return
+        if self._segment is None or self._segment['bytes'] >= self.segment_bytes:
+            self._close_segment()
+            self._open_segment()
+        data = gzip.compress(b''.join(line for _, line in self._block), compresslevel=COMPRESS_LEVEL)
+        offset = self._segment['bytes']
+        self._data_file.write(data)
+        for line_number, (message, _) in enumerate(self._block):
+            entry = {
+                'i': self.message_count,
+                'offset': offset,
+                'length': len(data),
+                'line': line_number,
+                'timestamp': message.get('timestamp') if isinstance(message, dict) else None,
+                'event': message.get('event', message.get('method')) if isinstance(message, dict) else None,
+                'keys': payload_keys(message)
+            }
+            self._index_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self.message_count += 1
+        self._segment['count'] += len(self._block)
+        self._segment['bytes'] += len(data)
+        self._block = []
+        self._block_size = 0
+
+    def flush(self):
+        """Write the pending block, fsync the segment and publish the manifest, returns the manifest"""
+        self._write_block()
+        if self._data_file is not None:
+            for f in (self._data_file, self._index_file):
+                f.flush()
+                os.fsync(f.fileno())
+        if self.keep_sessions:
+            self.prune(self.keep_sessions)
+        self.manifest['message_count'] = self.message_count
+        self.manifest['generation'] += 1
+        self.manifest['timestamp'] = datetime.now().isoformat()
+        path = manifest_path(self.directory)
+        manifest = json.loads(json.dumps(self.manifest))
+        atomic_write(path, lambda f: json.dump(manifest, f, indent=2))
+        atomic_write(generation_file(path), lambda f: f.write(str(manifest['generation'])))
+        return manifest
+
+    def _close_segment(self):
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._data_file = self._index_file = None
+
+    def close(self):
+        manifest = self.flush()
+        self._close_segment()
+        return manifest
+
+    def metadata(self):
+        """Capture information in the capture file format, without messages"""
+        return {
+            'url': self.manifest.get('url'),
+            'timestamp': self.manifest.get('timestamp'),
+            'generation': self.manifest['generation'],
+            'message_count': self.message_count
+        }
+
+    def prune(self, keep_sessions=1):
+        """Delete whole segments that end before the last keep_sessions sessions, returns how many"""
+        sessions = self.manifest['sessions']
+        first_kept = sessions[-keep_sessions]['first_index'] if len(sessions) >= keep_sessions else 0
+        removed = []
+        for segment in self.manifest['segments']:
+            if segment is self._segment or segment['first_index'] + segment['count'] > first_kept:
+                break
+            removed.append(segment)
+        for segment in removed:
+            for name in (segment['file'], segment['index']):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        del self.manifest['segments'][:len(removed)]
+        self.manifest['sessions'] = [session for session in sessions if session['first_index'] >= first_kept]
+        return len(removed)
+
+
+def write_capture_segments(messages, url, directory=SEGMENT_DIR, decoded=False):
+    """Append one capture session to a segment directory, returns the capture information"""
+    writer = SegmentedCaptureWriter(directory, url, decoded=decoded)
+    writer.append(messages)
+    writer.close()
+    return writer.metadata()
+
+
+class SegmentedCaptureReader:
+    """Reads a capture directory written by SegmentedCaptureWriter.
+
+    A reader is pinned to the manifest it was opened with; index entries
+    and blocks written after it are not visible.
+    """
+
+    def __init__(self, directory=SEGMENT_DIR):
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+        self.message_count = self.manifest['message_count']
+        self.generation = self.manifest.get('generation', 0)
+
+    @property
+    def sessions(self):
+        return self.manifest.get('sessions', [])
+
+    def last_session_start(self):
+        """Index of the first message of the last session that has messages"""
+        for session in reversed(self.sessions):
+            if session['first_index'] < self.message_count:
+                return session['first_index']
+        return 0
+
+    def metadata(self):
+        """Capture information in the capture file format, without messages"""
+        return {
+            'url': self.manifest.get('url'),
+            'timestamp': self.manifest.get('timestamp'),
+            'generation': self.generation,
+            'message_count': self.message_count
+        }
+
+    def entries(self, start=0, stop=None):
+        """Yield index entries of messages start <= i < stop, reading only the overlapping index files"""
+        stop = self.message_count if stop is None else min(stop, self.message_count)
+        for segment in self.manifest['segments']:
+            first = segment['first_index']
+            if first + segment['count'] <= start or first >= stop:
+                continue
+            with open(os.path.join(self.directory, segment['index']), 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry['i'] >= stop:
+                        break
+                    if entry['i'] >= start:
+                        entry['segment'] = segment['file']
+                        yield entry
+
+    def select(self, start=0, stop=None, keys=None, events=None, since=None):
+        """Index entries filtered by payload keys (any of), event names and minimum timestamp"""
+        keys = set(keys) if keys else None
+        since_epoch = parse_timestamp(since) if since is not None else None
+        for entry in self.entries(start, stop):
+            if events and entry['event'] not in events:
+                continue
+            if keys and not keys.intersection(entry['keys']):
+                continue
+            if since_epoch is not None:
+                epoch = parse_timestamp(entry['timestamp'])
+                if epoch is None or epoch < since_epoch:
+                    continue
+            yield entry
+
+    def read(self, entries):
+        """Yield the messages of index entries, decompressing each block once"""
+        block_key, lines = None, None
+        handles = {}
+        try:
+            for entry in entries:
+                key = (entry['segment'], entry['offset'])
+                if key != block_key:
+                    f = handles.get(entry['segment'])
+                    if f is None:
+                        f = handles[entry['segment']] = open(os.path.join(self.directory, entry['segment']), 'rb')
+                    f.seek(entry['offset'])
+                    lines = gzip.decompress(f.read(entry['length'])).split(b'\n')
+                    block_key = key
+                yield json.loads(lines[entry['line']])
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def iter_messages(self, start=0, stop=None, **filters):
+        """Stream messages, optionally filtered like select()"""
+        return self.read(self.select(start, stop, **filters))
+
+    def message(self, index):
+        """Read a single message by index"""
+        for message in self.iter_messages(index, index + 1):
+            return message
+        raise IndexError(index)
+
+    def document(self):
+        """The whole capture in the capture file format"""
+        return {**self.metadata(), 'messages': list(self.iter_messages())}
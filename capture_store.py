@@ -0,0 +1,243 @@
+"""
+Winamax Capture Store
+Author: Anass EL
+Description: Reading and writing of capture files shared by every capture backend
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+from bisect import bisect_left
+from datetime import datetime, timezone
+from statistics import median
+
+CAPTURE_FILE = 'winamax_socketio_analysis.json'
+PAGE_KEY = 'page'  # Provenance field of messages captured by a multi-page capture: the page they came from
+GENERATION_SUFFIX = '.generation'  # Sidecar holding the generation of the published capture file
+FRAME_MATCH_TOLERANCE = 1.0  # Seconds between a hook frame and its CDP copy, after clock alignment
+CDP_LOG_LAG = 5.0  # Tolerance when the CDP clock cannot be aligned (log timestamps lag the frames)
+
+CDP_FRAME_DIRECTIONS = {
+    'Network.webSocketFrameReceived': 'received',
+    'Network.webSocketFrameSent': 'sent'
+}
+PACKET_PATTERN = re.compile(r'^(\d+)([\[{].*)$', re.DOTALL)
+
+
+def parse_timestamp(value):
+    """Epoch seconds of a hook ISO timestamp or a CDP log timestamp (epoch milliseconds)"""
+    if isinstance(value, (int, float)):
+        return value / 1000.0
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_timestamp(epoch):
+    """ISO timestamp in the browser hook format (new Date().toISOString())"""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def frame_text(data):
+    """Wire text of a websocket_message payload, stored raw, decoded or JSON-parsed by the hook"""
+    if isinstance(data, dict):
+        if 'raw' in data:
+            return data['raw']
+        if 'packet' in data and 'payload' in data:
+            return data['packet'] + json.dumps(data['payload'], ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def frame_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def decode_frame_data(data):
+    """Replace {'raw': '42[...]'} by {'packet': '42', 'payload': [...]}, other frames are kept"""
+    if not isinstance(data, dict) or not isinstance(data.get('raw'), str):
+        return data
+    match = PACKET_PATTERN.match(data['raw'])
+    if not match:
+        return data
+    try:
+        payload = json.loads(match.group(2))
+    except json.JSONDecodeError:
+        return data
+    return {'packet': match.group(1), 'payload': payload}
+
+
+def decode_messages(messages):
+    """Return messages with websocket frames stored as decoded payloads"""
+    decoded = []
+    for msg in messages:
+        if isinstance(msg, dict) and msg.get('event') == 'websocket_message':
+            msg = {**msg, 'data': decode_frame_data(msg.get('data'))}
+        decoded.append(msg)
+    return decoded
+
+
+def _cdp_frame(entry):
+    """(direction, text, monotonic seconds, log epoch seconds) of a CDP frame entry, or None"""
+    direction = CDP_FRAME_DIRECTIONS.get(entry.get('method'))
+    if direction is None:
+        return None
+    params = entry.get('params') or {}
+    text = (params.get('response') or {}).get('payloadData')
+    if not isinstance(text, str):
+        return None
+    return direction, text, params.get('timestamp'), parse_timestamp(entry.get('timestamp'))
+
+
+def _consume_nearby(epochs, consumed, epoch, tolerance):
+    """Mark the first unconsumed epoch within tolerance of epoch, returns True if there was one"""
+    position = bisect_left(epochs, epoch - tolerance)
+    while position < len(epochs) and epochs[position] <= epoch + tolerance:
+        if not consumed[position]:
+            consumed[position] = True
+            return True
+        position += 1
+    return False
+
+
+def merge_capture_sources(messages, network_entries, tolerance=FRAME_MATCH_TOLERANCE):
+    """Merge injected-hook messages with CDP performance-log entries, one record per frame.
+
+    The hook is authoritative for the frames it saw. A CDP frame is dropped
+    when a hook frame with the same direction and content hash lies within
+    tolerance seconds of it; the remaining CDP frames (sent frames, frames
+    the hook missed) are kept in the hook message format with source 'cdp'.
+    CDP timestamps are monotonic, they are aligned on the hook clock with the
+    median offset of frames whose content occurs once in both sources.
+    Non-frame CDP entries (socket creation, handshake) are kept unchanged.
+    """
+    hook_frames = {}
+    for msg in messages:
+        if isinstance(msg, dict) and msg.get('event') == 'websocket_message':
+            epoch = parse_timestamp(msg.get('timestamp'))
+            if epoch is not None:
+                key = ('received', frame_hash(frame_text(msg.get('data'))))
+                hook_frames.setdefault(key, []).append(epoch)
+
+    cdp_frames, others = [], []
+    for entry in network_entries:
+        frame = _cdp_frame(entry)
+        if frame is None:
+            others.append(entry)
+        else:
+            direction, text, monotonic, logged = frame
+            cdp_frames.append(((direction, frame_hash(text)), text, monotonic, logged))
+
+    cdp_counts = {}
+    for key, _, _, _ in cdp_frames:
+        cdp_counts[key] = cdp_counts.get(key, 0) + 1
+    offsets = [hook_frames[key][0] - monotonic for key, _, monotonic, _ in cdp_frames
+               if monotonic is not None and cdp_counts[key] == 1 and len(hook_frames.get(key, ())) == 1]
+    offset = median(offsets) if offsets else None
+    if offset is None:
+        tolerance = max(tolerance, CDP_LOG_LAG)
+
+    for epochs in hook_frames.values():
+        epochs.sort()
+    consumed = {key: [False] * len(epochs) for key, epochs in hook_frames.items()}
+
+    merged = list(messages)
+    for key, text, monotonic, logged in cdp_frames:
+        epoch = monotonic + offset if offset is not None and monotonic is not None else logged
+        if epoch is not None and key in hook_frames and \
+                _consume_nearby(hook_frames[key], consumed[key], epoch, tolerance):
+            continue
+        merged.append({
+            'timestamp': format_timestamp(epoch) if epoch is not None else None,
+            'event': 'websocket_message' if key[0] == 'received' else 'websocket_send',
+            'data': {'raw': text},
+            'source': 'cdp'
+        })
+
+    merged.extend(others)
+    merged.sort(key=lambda msg: parse_timestamp(msg.get('timestamp')) or 0.0)
+    return merged
+
+
+def generation_file(filename=CAPTURE_FILE):
+    return filename + GENERATION_SUFFIX
+
+
+def read_generation(filename=CAPTURE_FILE):
+    """Generation of the published capture file, 0 if none was published yet"""
+    try:
+        with open(generation_file(filename), 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def atomic_write(filename, write, binary=False):
+    """Write a file through a fsynced temp file renamed over filename.
+
+    write(f) receives the open text (or binary) file. Readers see either
+    the previous or the complete new content, never a partial write.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename) + '.', suffix='.tmp')
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    # Persist the rename itself (not supported on every platform)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def write_capture_file(messages, url, filename=CAPTURE_FILE, decoded=False, pages=None):
+    """Atomically publish captured messages in the capture file format read by serve_data.py.
+
+    Every write gets the next generation number, stored in the document and
+    in the generation sidecar, which is renamed into place last so watchers
+    only see generations whose capture file is complete.
+
+    With decoded=True, websocket frames are stored as {'packet', 'payload'}
+    instead of escaped raw strings, and the file is written compact since
+    indenting the nested payloads would double its size.
+
+    pages lists the captured pages when several were merged into one file.
+    """
+    if decoded:
+        messages = decode_messages(messages)
+    generation = read_generation(filename) + 1
+    output = {
+        'url': url,
+        'timestamp': datetime.now().isoformat(),
+        'generation': generation,
+        'message_count': len(messages),
+        'messages': messages
+    }
+    if pages:
+        output['pages'] = pages
+
+    if decoded:
+        atomic_write(filename, lambda f: json.dump(output, f, ensure_ascii=False, separators=(',', ':')))
+    else:
+        atomic_write(filename, lambda f: json.dump(output, f, indent=2, ensure_ascii=False))
+    atomic_write(generation_file(filename), lambda f: f.write(str(generation)))
+    return output
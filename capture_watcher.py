@@ -0,0 +1,98 @@
+"""
+Winamax Capture Watcher
+Author: Anass EL
+Description: Notifies the API when a new capture file generation is published
+"""
+import os
+import threading
+
+from capture_store import CAPTURE_FILE, generation_file, read_generation
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+
+class _GenerationEventHandler(FileSystemEventHandler):
+    """Forwards file system events touching the generation sidecar"""
+
+    def __init__(self, path, callback):
+        self.path = path
+        self.callback = callback
+
+    def on_any_event(self, event):
+        paths = (getattr(event, 'src_path', None), getattr(event, 'dest_path', None))
+        if any(path and os.path.abspath(path) == self.path for path in paths):
+            self.callback()
+
+
+class CaptureWatcher:
+    """Calls on_generation(generation) whenever a newer capture generation is published.
+
+    Uses file system notifications (inotify, FSEvents, ... through watchdog)
+    on the generation sidecar when watchdog is installed, and polls it every
+    poll_interval seconds otherwise. The sidecar is renamed into place after
+    the capture file, so a new generation always has a complete file.
+    """
+
+    def __init__(self, on_generation, filename=CAPTURE_FILE, poll_interval=1.0, use_notifications=True):
+        self.on_generation = on_generation
+        self.filename = filename
+        self.path = os.path.abspath(generation_file(filename))
+        self.poll_interval = poll_interval
+        self.backend = 'watchdog' if use_notifications and WATCHDOG_AVAILABLE else 'polling'
+        self.last_generation = read_generation(filename)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    def start(self, last_generation=None):
+        """Start watching, generations up to last_generation are not reported"""
+        if last_generation is not None:
+            self.last_generation = last_generation
+        self._stopped.clear()
+        if self.backend == 'watchdog':
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_GenerationEventHandler(self.path, self.check),
+                                        os.path.dirname(self.path), recursive=False)
+                self._observer.daemon = True
+                self._observer.start()
+            except Exception as e:
+                print(f"⚠ File notifications unavailable ({e}), polling {self.path} instead")
+                self._observer = None
+                self.backend = 'polling'
+        if self.backend == 'polling':
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        # Catch a generation published before the watch was armed
+        self.check()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            self.check()
+
+    def check(self):
+        """Report the published generation if it is newer than the last one, returns it"""
+        with self._lock:
+            generation = read_generation(self.filename)
+            if generation <= self.last_generation:
+                return None
+            self.last_generation = generation
+        try:
+            self.on_generation(generation)
+        except Exception as e:
+            print(f"⚠ Could not reload capture generation {generation}: {e}")
+        return generation
@@ -0,0 +1,130 @@
+"""
+Winamax Change Stream
+Author: Anass EL
+Description: Diffs consecutive match snapshots and fans the changes out to Server-Sent Events clients
+"""
+import json
+import threading
+from collections import deque
+
+
+class ChangeEvent:
+    """One change of a listed match between two snapshots"""
+
+    __slots__ = ('id', 'type', 'match_id', 'data')
+
+    def __init__(self, event_id, event_type, match_id, data):
+        self.id = event_id
+        self.type = event_type
+        self.match_id = match_id
+        self.data = data
+
+    def to_sse(self, version):
+        """Format the event as a Server-Sent Events message"""
+        payload = json.dumps({'matchId': self.match_id, 'version': version, **self.data},
+                             ensure_ascii=False, separators=(',', ':'))
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class ChangeBatch:
+    """Events produced by one snapshot publication, with both snapshots for filtering"""
+
+    __slots__ = ('old', 'new', 'events', 'first_id', 'last_id')
+
+    def __init__(self, old, new, events, first_id, last_id):
+        self.old = old
+        self.new = new
+        self.events = events
+        self.first_id = first_id
+        self.last_id = last_id
+
+
+def match_summary(snapshot, match_id):
+    """Simplified match fields sent with match_added events"""
+    match_data = snapshot.matches[match_id]
+    return {
+        'title': match_data.get('title'),
+        'status': match_data.get('status'),
+        'competitor1Name': match_data.get('competitor1Name'),
+        'competitor2Name': match_data.get('competitor2Name'),
+        'matchStart': match_data.get('matchStart'),
+        'odds': {label: value for _, label, value in snapshot.main_odds.get(match_id, ())}
+    }
+
+
+def diff_snapshots(old, new):
+    """Return [(type, match_id, data)] for listed matches that changed between two snapshots.
+
+    Types are match_added, match_removed, status (match status changed) and
+    odds (main bet odds changed).
+    """
+    changes = []
+    old_ids = set(old.ordered_ids)
+    new_ids = set(new.ordered_ids)
+
+    for match_id in new.ordered_ids:
+        if match_id not in old_ids:
+            changes.append(('match_added', match_id, match_summary(new, match_id)))
+            continue
+
+        old_status = old.matches[match_id].get('status')
+        new_status = new.matches[match_id].get('status')
+        if old_status != new_status:
+            changes.append(('status', match_id, {'status': new_status, 'previous': old_status}))
+
+        old_odds = old.main_odds.get(match_id)
+        new_odds = new.main_odds.get(match_id)
+        if old_odds != new_odds:
+            changes.append(('odds', match_id, {
+                'odds': {label: value for _, label, value in new_odds or ()},
+                'previous': {label: value for _, label, value in old_odds or ()}
+            }))
+
+    for match_id in old.ordered_ids:
+        if match_id not in new_ids:
+            changes.append(('match_removed', match_id, {}))
+
+    return changes
+
+
+class ChangeBroadcaster:
+    """Single producer, many consumers fan-out of snapshot changes.
+
+    Publishing appends a batch to a bounded buffer and wakes every waiting
+    client; clients resume from an event id (Last-Event-ID) as long as it is
+    still buffered.
+    """
+
+    def __init__(self, max_batches=64):
+        self.batches = deque(maxlen=max_batches)
+        self.last_id = 0
+        self._condition = threading.Condition()
+
+    def publish(self, old, new):
+        """Diff two snapshots and broadcast the changes, returns the number of events"""
+        changes = diff_snapshots(old, new)
+        if not changes:
+            return 0
+        with self._condition:
+            first_id = self.last_id + 1
+            events = [ChangeEvent(first_id + offset, event_type, match_id, data)
+                      for offset, (event_type, match_id, data) in enumerate(changes)]
+            self.last_id = events[-1].id
+            self.batches.append(ChangeBatch(old, new, events, first_id, self.last_id))
+            self._condition.notify_all()
+        return len(events)
+
+    def wait_for_batches(self, after_id, timeout):
+        """Wait up to timeout seconds for events after after_id.
+
+        Returns (batches, missed) where missed is True when events after
+        after_id were already evicted from the buffer.
+        """
+        with self._condition:
+            if self.last_id <= after_id:
+                self._condition.wait(timeout)
+            batches = [batch for batch in self.batches if batch.last_id > after_id]
+            missed = bool(batches) and batches[0].first_id > after_id + 1
+            if not batches and self.last_id > after_id:
+                missed = True
+            return batches, missed
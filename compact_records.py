@@ -0,0 +1,203 @@
+"""
+Winamax Compact Records
+Author: Anass EL
+Description: Read-only __slots__ records with shared key layouts and interned strings for the match catalogue
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from collections.abc import Mapping
+
+from capture_store import CAPTURE_FILE
+
+_layouts = {}  # key tuple -> RecordLayout, shared by every record with the same fields
+_CONVERTED = frozenset((str, dict, list))  # Value types compact_value() changes, the rest is kept as-is
+
+
+class RecordLayout:
+    """Field names of a record shape and their positions"""
+
+    __slots__ = ('keys', 'index')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = {key: position for position, key in enumerate(keys)}
+
+
+def record_layout(keys):
+    layout = _layouts.get(keys)
+    if layout is None:
+        layout = _layouts[keys] = RecordLayout(tuple(sys.intern(key) for key in keys))
+    return layout
+
+
+def compact_value(value):
+    """Interned strings, tuples instead of lists and CompactRecord instead of dicts"""
+    kind = type(value)
+    if kind is str:
+        return sys.intern(value)
+    if kind is dict:
+        return CompactRecord.from_dict(value)
+    if kind is list:
+        return tuple([compact_value(item) if type(item) in _CONVERTED else item for item in value])
+    return value
+
+
+class CompactRecord(Mapping):
+    """Immutable mapping storing values in a tuple next to a shared RecordLayout.
+
+    A 30-field match costs one small object and one tuple instead of a
+    dict with its own hash table; field names and repeated strings (labels,
+    flags, codes, tournament names, help texts) are stored once. Reads
+    behave like the captured dicts: get(), in, **unpacking, dict(record).
+    """
+
+    __slots__ = ('_layout', '_values')
+
+    @classmethod
+    def _build(cls, keys, values):
+        record = cls.__new__(cls)
+        record._layout = record_layout(keys)
+        record._values = values
+        return record
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls._build(tuple(data), tuple([compact_value(value) if type(value) in _CONVERTED else value
+                                              for value in data.values()]))
+
+    def merge(self, delta):
+        """New record with the fields of a delta dict applied, unchanged values are shared.
+
+        Records are shared with published snapshots and never mutated; a delta
+        that only updates existing fields (odds, hotUsers, status, ...) keeps
+        the layout and copies the value tuple, without an intermediate dict.
+        """
+        index = self._layout.index
+        values = list(self._values)
+        for key, value in delta.items():
+            position = index.get(key)
+            if position is None:
+                return self._merge_fields(delta)
+            values[position] = compact_value(value) if type(value) in _CONVERTED else value
+        record = object.__new__(type(self))
+        record._layout = self._layout
+        record._values = tuple(values)
+        return record
+
+    def _merge_fields(self, delta):
+        """merge() of a delta adding fields, the record gets the layout of its new shape"""
+        merged = dict(zip(self._layout.keys, self._values))
+        for key, value in delta.items():
+            merged[key] = compact_value(value)
+        return self._build(tuple(merged), tuple(merged.values()))
+
+    def __getitem__(self, key):
+        return self._values[self._layout.index[key]]
+
+    def get(self, key, default=None):
+        position = self._layout.index.get(key)
+        return self._values[position] if position is not None else default
+
+    def __contains__(self, key):
+        return key in self._layout.index
+
+    def __iter__(self):
+        return iter(self._layout.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return self._layout.keys
+
+    def items(self):
+        return zip(self._layout.keys, self._values)
+
+    def values(self):
+        return self._values
+
+    def to_dict(self):
+        """Plain dict (nested records and tuples included) for JSON serialization"""
+        return {key: plain_value(value) for key, value in self.items()}
+
+    def __repr__(self):
+        return f'CompactRecord({self.to_dict()!r})'
+
+
+def as_dict(record):
+    """Shallow dict copy of a record, CompactRecord or dict"""
+    if isinstance(record, CompactRecord):
+        return dict(zip(record._layout.keys, record._values))
+    return dict(record)
+
+
+def plain_value(value):
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    if isinstance(value, tuple):
+        return [plain_value(item) for item in value]
+    return value
+
+
+def json_default(value):
+    """json.dumps default= hook serializing CompactRecord like the dict it came from"""
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def measure_state_memory(messages, compact):
+    """Bytes allocated by a MatchState holding messages, and its match count"""
+    from match_store import MatchState
+
+    gc.collect()
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        state = MatchState(compact=compact)
+        state.apply_messages(messages)
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    return after - before, len(state.matches)
+
+
+def measure_state_build(messages, compact, repeat=5):
+    """Best time in milliseconds to apply messages to a new MatchState (outside tracemalloc)"""
+    from match_store import MatchState
+
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        MatchState(compact=compact).apply_messages(messages)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 1)
+
+
+def memory_budget(messages, per_matches=10000):
+    """Measured state memory and build time with dict and compact records, memory scaled to per_matches matches"""
+    budget = {}
+    for name, compact in (('dict', False), ('compact', True)):
+        used, match_count = measure_state_memory(messages, compact)
+        budget[name] = {
+            'bytes': used,
+            'matches': match_count,
+            f'bytes_per_{per_matches}_matches': round(used * per_matches / match_count) if match_count else None,
+            'build_ms': measure_state_build(messages, compact)
+        }
+    return budget
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else CAPTURE_FILE
+    with open(filename, 'r', encoding='utf-8') as f:
+        captured = json.load(f)
+    print(json.dumps(memory_budget(captured.get('messages', [])), indent=2))
@@ -0,0 +1,441 @@
+"""
+Winamax Engine.IO v3 Client
+Author: Anass EL
+Description: Browserless Socket.IO ingestion speaking WebSocket + Engine.IO v3 framing directly
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import select
+import socket
+import ssl
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from capture_store import write_capture_file
+from capture_segments import write_capture_segments
+
+logger = logging.getLogger(__name__)
+
+WINAMAX_PAGE_URL = "https://www.winamax.fr/paris-sportifs/sports/1"
+WINAMAX_SOCKET_URL = ("wss://sports-eu-west-3.winamax.fr/uof-sports-server/socket.io/"
+                      "?language=FR&version=3.27.0&embed=false&EIO=3&transport=websocket")
+WINAMAX_ORIGIN = "https://www.winamax.fr"
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36")
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class WebSocketClosed(ConnectionError):
+    """The peer closed the WebSocket connection"""
+
+
+def websocket_accept_key(key):
+    """Sec-WebSocket-Accept value for a Sec-WebSocket-Key"""
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def apply_mask(data, key):
+    """XOR data with a 4-byte WebSocket masking key"""
+    length = len(data)
+    if not length:
+        return data
+    repeated = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+
+
+class WebSocketConnection:
+    """Minimal RFC 6455 connection over an already upgraded socket.
+
+    Clients mask outgoing frames, servers do not. Ping frames are answered
+    and fragmented messages reassembled inside recv_message().
+    """
+
+    def __init__(self, sock, is_client=True, buffer=b''):
+        self.sock = sock
+        self.is_client = is_client
+        self._buffer = bytearray(buffer)
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    def _recv_exact(self, size):
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(max(65536, size - len(self._buffer)))
+            if not chunk:
+                self.closed = True
+                raise WebSocketClosed('WebSocket connection closed')
+            self._buffer.extend(chunk)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readable(self, timeout):
+        """True if a frame can be read without waiting longer than timeout"""
+        if self._buffer:
+            return True
+        if isinstance(self.sock, ssl.SSLSocket) and self.sock.pending():
+            return True
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        return bool(ready)
+
+    def send_frame(self, payload, opcode=OPCODE_TEXT):
+        """Send one unfragmented frame"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        header = bytearray([0x80 | opcode])
+        mask_bit = 0x80 if self.is_client else 0
+        length = len(payload)
+        if length < 126:
+            header.append(mask_bit | length)
+        elif length < 65536:
+            header.append(mask_bit | 126)
+            header += struct.pack('!H', length)
+        else:
+            header.append(mask_bit | 127)
+            header += struct.pack('!Q', length)
+        if self.is_client:
+            key = os.urandom(4)
+            header += key
+            payload = apply_mask(payload, key)
+        with self._send_lock:
+            self.sock.sendall(bytes(header) + payload)
+
+    def send_text(self, text):
+        self.send_frame(text, OPCODE_TEXT)
+
+    def recv_frame(self):
+        """Read one frame, returns (fin, opcode, payload)"""
+        first, second = self._recv_exact(2)
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._recv_exact(8))[0]
+        key = self._recv_exact(4) if second & 0x80 else None
+        payload = self._recv_exact(length)
+        if key:
+            payload = apply_mask(payload, key)
+        return fin, opcode, payload
+
+    def recv_message(self):
+        """Read the next text message, handling control frames and fragmentation"""
+        fragments = []
+        while True:
+            fin, opcode, payload = self.recv_frame()
+            if opcode == OPCODE_PING:
+                self.send_frame(payload, OPCODE_PONG)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode == OPCODE_CLOSE:
+                self.close()
+                raise WebSocketClosed('WebSocket closed by peer')
+            fragments.append(payload)
+            if fin:
+                return b''.join(fragments).decode('utf-8', errors='replace')
+
+    def close(self):
+        """Send a close frame (best effort) and close the socket"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.send_frame(b'\x03\xe8', OPCODE_CLOSE)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def read_http_head(sock, limit=65536):
+    """Read an HTTP header block, returns (head, leftover bytes)"""
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionError('Connection closed during WebSocket handshake')
+        data += chunk
+        if len(data) > limit:
+            raise ConnectionError('WebSocket handshake headers too large')
+    head, leftover = data.split(b'\r\n\r\n', 1)
+    return head.decode('latin-1'), leftover
+
+
+def websocket_connect(url, headers=None, timeout=10):
+    """Open a client WebSocket (ws:// or wss://) and perform the upgrade handshake"""
+    parts = urlsplit(url)
+    secure = parts.scheme in ('wss', 'https')
+    host = parts.hostname
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    sock = socket.create_connection((host, port), timeout=timeout)
+    if secure:
+        context = ssl.create_default_context()
+        sock = context.wrap_socket(sock, server_hostname=host)
+
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    request_lines = [
+        f"GET {path} HTTP/1.1",
+        f"Host: {parts.netloc}",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Key: {key}",
+        "Sec-WebSocket-Version: 13",
+    ]
+    for name, value in (headers or {}).items():
+        request_lines.append(f"{name}: {value}")
+    sock.sendall(('\r\n'.join(request_lines) + '\r\n\r\n').encode('latin-1'))
+
+    head, leftover = read_http_head(sock)
+    status_line, *header_lines = head.split('\r\n')
+    status_parts = status_line.split()
+    if len(status_parts) < 2 or status_parts[1] != '101':
+        sock.close()
+        raise ConnectionError(f"WebSocket upgrade refused: {status_line}")
+    response_headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        response_headers[name.strip().lower()] = value.strip()
+    if response_headers.get('sec-websocket-accept') != websocket_accept_key(key):
+        sock.close()
+        raise ConnectionError('Invalid Sec-WebSocket-Accept in handshake response')
+
+    return WebSocketConnection(sock, is_client=True, buffer=leftover)
+
+
+class EngineIOClient:
+    """Engine.IO v3 / Socket.IO client over a WebSocket transport.
+
+    Handles the open packet ('0{...}'), Socket.IO connect ('40'), client
+    pings ('2' every pingInterval, answered by '3'), the upgrade probe
+    ('3probe' answered by '5') and passes every '42[...]' event frame to
+    on_frame unchanged, in the format the capture parser expects.
+    """
+
+    def __init__(self, url, headers=None, subscribe_packets=None, timeout=10):
+        self.url = url
+        self.headers = headers or {}
+        # Raw Socket.IO packets to emit once connected, e.g. '42["m",{...}]'
+        self.subscribe_packets = list(subscribe_packets or [])
+        self.timeout = timeout
+        self.ws = None
+        self.sid = None
+        self.ping_interval = 25.0
+        self.ping_timeout = 60.0
+        self.connected = False
+        self.last_ping_time = 0.0
+        self.last_pong_time = 0.0
+
+    def connect(self):
+        """Open the WebSocket transport"""
+        self.ws = websocket_connect(self.url, headers=self.headers, timeout=self.timeout)
+        self.last_ping_time = self.last_pong_time = time.time()
+        return self
+
+    def send_packet(self, packet):
+        self.ws.send_text(packet)
+
+    def handle_packet(self, packet, on_frame):
+        """Handle one Engine.IO packet, returns False when the session is over"""
+        if not packet:
+            return True
+        packet_type = packet[0]
+
+        if packet_type == '0':
+            # Open: {"sid": ..., "pingInterval": ms, "pingTimeout": ms, "upgrades": [...]}
+            try:
+                handshake = json.loads(packet[1:])
+                self.sid = handshake.get('sid')
+                self.ping_interval = handshake.get('pingInterval', 25000) / 1000.0
+                self.ping_timeout = handshake.get('pingTimeout', 60000) / 1000.0
+            except ValueError:
+                logger.warning(f"Invalid Engine.IO open packet: {packet[:200]}")
+        elif packet_type == '1':
+            return False
+        elif packet_type == '2':
+            # Server ping (or probe): answer with a pong
+            self.send_packet('3' + packet[1:])
+        elif packet_type == '3':
+            if packet == '3probe':
+                self.send_packet('5')
+            self.last_pong_time = time.time()
+        elif packet_type == '4':
+            return self.handle_socketio_packet(packet, on_frame)
+        return True
+
+    def handle_socketio_packet(self, packet, on_frame):
+        """Handle a Socket.IO packet carried in an Engine.IO message ('4...')"""
+        if packet.startswith('40'):
+            if not self.connected:
+                self.connected = True
+                for subscribe_packet in self.subscribe_packets:
+                    self.send_packet(subscribe_packet)
+        elif packet.startswith('41'):
+            return False
+        elif packet.startswith('42'):
+            on_frame(packet)
+        elif packet.startswith('44'):
+            logger.warning(f"Socket.IO error packet: {packet[:200]}")
+        return True
+
+    def run(self, duration, on_frame, should_stop=None, on_idle=None, idle_interval=1.0):
+        """Receive frames for up to duration seconds (None: until closed or should_stop()).
+
+        on_idle() is called whenever no packet arrived for idle_interval
+        seconds, so callers can flush buffered frames on a quiet feed.
+        """
+        deadline = time.time() + duration if duration is not None else None
+        while deadline is None or time.time() < deadline:
+            if should_stop is not None and should_stop():
+                break
+            now = time.time()
+            if now - self.last_ping_time >= self.ping_interval:
+                self.send_packet('2')
+                self.last_ping_time = now
+            if now - self.last_pong_time > self.ping_interval + self.ping_timeout:
+                raise ConnectionError('Engine.IO ping timeout')
+
+            wait = min(idle_interval, self.ping_interval)
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - now))
+            if not self.ws.readable(wait):
+                if on_idle is not None:
+                    on_idle()
+                continue
+            if not self.handle_packet(self.ws.recv_message(), on_frame):
+                break
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                if self.connected:
+                    self.send_packet('41')
+                self.send_packet('1')
+            except OSError:
+                pass
+            self.ws.close()
+            self.ws = None
+        self.connected = False
+
+
+def utc_timestamp():
+    """ISO timestamp in the same format as the browser hook (new Date().toISOString())"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class SocketIOClientCapture:
+    """Capture Socket.IO messages without a browser.
+
+    Drop-in alternative to SocketIOCapture: same message format, same
+    on_messages batches and same capture file, fed by EngineIOClient.
+    """
+
+    def __init__(self, on_messages: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 socket_url: str = WINAMAX_SOCKET_URL, page_url: str = WINAMAX_PAGE_URL,
+                 subscribe_packets: Optional[List[str]] = None, batch_interval: float = 2.0,
+                 decoded_payloads: bool = False, segment_dir: Optional[str] = None):
+        self.url = page_url
+        self.socket_url = socket_url
+        self.messages: List[Dict[str, Any]] = []
+        self.on_messages = on_messages
+        self.subscribe_packets = subscribe_packets
+        self.batch_interval = batch_interval
+        self.decoded_payloads = decoded_payloads
+        self.segment_dir = segment_dir
+        self.frame_count = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._last_flush = 0.0
+
+    def _record(self, event, data):
+        message = {'timestamp': utc_timestamp(), 'event': event, 'data': data}
+        self.messages.append(message)
+        self._pending.append(message)
+
+    def _on_frame(self, raw):
+        self.frame_count += 1
+        self._record('websocket_message', {'raw': raw})
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        # Also called when the socket is idle, so the last frames of a quiet feed are not held back
+        if time.time() - self._last_flush >= self.batch_interval:
+            self.flush()
+
+    def flush(self):
+        """Hand pending messages to on_messages, like a browser drain"""
+        self._last_flush = time.time()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        if self.on_messages:
+            try:
+                self.on_messages(batch)
+            except Exception as e:
+                logger.warning(f"Live message handler failed: {e}")
+
+    def run(self, duration: int = 30, save: bool = True,
+            should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Capture for duration seconds (or until should_stop()), returns True if any event frame was received"""
+        client = EngineIOClient(
+            self.socket_url,
+            headers={'Origin': WINAMAX_ORIGIN, 'User-Agent': USER_AGENT},
+            subscribe_packets=self.subscribe_packets
+        )
+        try:
+            logger.info(f"Connecting to {self.socket_url}...")
+            client.connect()
+            self._record('websocket_open', {'url': self.socket_url})
+            self._last_flush = time.time()
+            client.run(duration, self._on_frame, should_stop, on_idle=self._flush_if_due,
+                       idle_interval=min(1.0, self.batch_interval / 4))
+        except Exception as e:
+            logger.error(f"Engine.IO capture failed: {e}")
+        finally:
+            client.close()
+            self.flush()
+
+        logger.info(f"Engine.IO capture received {self.frame_count} frames")
+        if save and self.frame_count:
+            if self.segment_dir:
+                write_capture_segments(self.messages, self.url, self.segment_dir, decoded=self.decoded_payloads)
+            else:
+                write_capture_file(self.messages, self.url, decoded=self.decoded_payloads)
+        return self.frame_count > 0
+
+
+def main():
+    """Capture without a browser: python engineio_client.py [seconds] [socket_url]"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    duration = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    socket_url = sys.argv[2] if len(sys.argv) > 2 else WINAMAX_SOCKET_URL
+    capture = SocketIOClientCapture(socket_url=socket_url)
+    if not capture.run(duration=duration):
+        print("No Socket.IO frames received, use analyze_winamax_socketio.py (browser capture) instead")
+        sys.exit(1)
+    print(f"Captured {capture.frame_count} frames")
+
+
+if __name__ == "__main__":
+    main()
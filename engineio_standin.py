@@ -0,0 +1,164 @@
+"""
+Winamax Socket.IO Stand-in Server
+Author: Anass EL
+Description: Local Engine.IO v3 / Socket.IO WebSocket server serving prepared '42[...]' frames for offline ingestion
+"""
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+
+from engineio_client import WebSocketConnection, WebSocketClosed, read_http_head, websocket_accept_key
+
+logger = logging.getLogger(__name__)
+
+
+class SocketIOStandInServer:
+    """Engine.IO v3 stand-in for the Winamax sports socket.
+
+    Every client gets the open packet, a Socket.IO connect ('40') and then
+    the prepared frames, sent frame_interval seconds apart, or schedule[i]
+    seconds after the connect when a schedule is given (replays); send times
+    of the last client are kept in sent_times. Pings ('2') are answered
+    with pongs ('3'), the upgrade probe ('2probe') with '3probe', and every
+    packet received from clients is kept in received.
+    """
+
+    def __init__(self, frames=None, host='127.0.0.1', port=0, frame_interval=0.0,
+                 ping_interval=25000, ping_timeout=60000, schedule=None):
+        self.frames = list(frames or [])
+        self.schedule = list(schedule) if schedule is not None else None
+        self.host = host
+        self.port = port
+        self.frame_interval = frame_interval
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.received = []
+        self.sent_times = []
+        self.connections = 0
+        self._server = None
+        self._threads = []
+        self._stopped = threading.Event()
+
+    @property
+    def url(self):
+        """Socket URL clients connect to"""
+        return f"ws://{self.host}:{self.port}/socket.io/?EIO=3&transport=websocket"
+
+    def start(self):
+        """Listen on host:port (port 0 picks a free one) and accept clients in a thread"""
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        self._server.settimeout(0.5)
+        thread = threading.Thread(target=self._accept_loop, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Socket.IO stand-in listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            thread = threading.Thread(target=self._handle_client, args=(conn,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _upgrade(self, conn):
+        """Answer the WebSocket upgrade request, returns the server-side connection"""
+        conn.settimeout(10)
+        head, leftover = read_http_head(conn)
+        headers = {}
+        for line in head.split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if not key:
+            conn.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            raise ConnectionError('Missing Sec-WebSocket-Key')
+        conn.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {websocket_accept_key(key)}\r\n\r\n"
+        ).encode('latin-1'))
+        conn.settimeout(None)
+        return WebSocketConnection(conn, is_client=False, buffer=leftover)
+
+    def _handle_client(self, conn):
+        try:
+            ws = self._upgrade(conn)
+        except (OSError, ConnectionError) as e:
+            logger.warning(f"Stand-in handshake failed: {e}")
+            conn.close()
+            return
+
+        self.connections += 1
+        handshake = {
+            'sid': uuid.uuid4().hex[:20],
+            'upgrades': [],
+            'pingInterval': self.ping_interval,
+            'pingTimeout': self.ping_timeout
+        }
+        try:
+            ws.send_text('0' + json.dumps(handshake))
+            ws.send_text('40')
+        except OSError:
+            ws.close()
+            return
+
+        sender = threading.Thread(target=self.send_frames, args=(ws,), daemon=True)
+        sender.start()
+        try:
+            while not self._stopped.is_set() and not ws.closed:
+                if not ws.readable(0.5):
+                    continue
+                packet = ws.recv_message()
+                self.received.append(packet)
+                if packet == '2probe':
+                    ws.send_text('3probe')
+                elif packet.startswith('2'):
+                    ws.send_text('3' + packet[1:])
+                elif packet == '1' or packet.startswith('41'):
+                    break
+        except (OSError, WebSocketClosed):
+            pass
+        finally:
+            ws.close()
+
+    def send_frames(self, ws):
+        """Send the prepared frames to one client"""
+        sent_times = self.sent_times = []
+        started = time.time()
+        try:
+            for position, raw in enumerate(self.frames):
+                if self.schedule is not None:
+                    delay = started + self.schedule[position] - time.time()
+                    if delay > 0:
+                        self._stopped.wait(delay)
+                if self._stopped.is_set() or ws.closed:
+                    return
+                ws.send_text(raw)
+                sent_times.append(time.time())
+                if self.frame_interval and self.schedule is None:
+                    time.sleep(self.frame_interval)
+        except OSError:
+            pass
@@ -0,0 +1,115 @@
+"""
+Winamax Columnar Match Table
+Author: Anass EL
+Description: Optional NumPy column store built from a MatchSnapshot, evaluates combined filters as boolean masks
+"""
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SECONDS_PER_DAY = 86400
+
+
+class MatchColumns:
+    """Listed matches of one snapshot stored as NumPy arrays.
+
+    Rows follow the snapshot's (matchStart, matchId) order, so a filtered
+    selection is already sorted. Missing values are NaN (odds, matchStart)
+    or -1 (sportId, status code), which never satisfy a comparison.
+    """
+
+    def __init__(self, snapshot):
+        match_ids = snapshot.ordered_ids
+        count = len(match_ids)
+        self.match_ids = np.array(match_ids, dtype=object)
+        self.sport_id = np.full(count, -1, dtype=np.int64)
+        self.match_start = np.full(count, np.nan, dtype=np.float64)
+        self.day = np.full(count, -1, dtype=np.int64)
+        self.status = np.full(count, -1, dtype=np.int16)
+        self.status_names = []
+        self.home = np.full(count, np.nan, dtype=np.float64)
+        self.draw = np.full(count, np.nan, dtype=np.float64)
+        self.away = np.full(count, np.nan, dtype=np.float64)
+
+        status_codes = {}
+        for row, match_id in enumerate(match_ids):
+            match_data = snapshot.matches[match_id]
+            sport_id = match_data.get('sportId')
+            if isinstance(sport_id, int):
+                self.sport_id[row] = sport_id
+
+            match_start = match_data.get('matchStart')
+            if match_start is not None:
+                self.match_start[row] = float(match_start)
+            if match_start:
+                self.day[row] = int(match_start) // SECONDS_PER_DAY
+
+            status = match_data.get('status')
+            if status is not None:
+                if status not in status_codes:
+                    status_codes[status] = len(self.status_names)
+                    self.status_names.append(status)
+                self.status[row] = status_codes[status]
+
+            sides = snapshot.main_sides.get(match_id, {})
+            for side, column in (('home', self.home), ('draw', self.draw), ('away', self.away)):
+                if side in sides:
+                    column[row] = sides[side]
+
+    def __len__(self):
+        return len(self.match_ids)
+
+    @staticmethod
+    def day_number(date):
+        """Convert DD-MM-YYYY (UTC) to days since epoch, None if not a valid date"""
+        try:
+            day = datetime.strptime(date, '%d-%m-%Y').replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            return None
+        return int(day.timestamp()) // SECONDS_PER_DAY
+
+    def mask(self, sport_id=None, date=None, start_from=None, start_to=None,
+             morethan=None, anyonehas=None):
+        """Evaluate all filters in one vectorized pass, returns a boolean mask"""
+        mask = np.ones(len(self), dtype=bool)
+
+        if sport_id is not None:
+            mask &= self.sport_id == sport_id
+
+        if date:
+            # Matches without matchStart are not excluded by the date filter
+            undated = self.day < 0
+            day = self.day_number(date)
+            mask &= (undated | (self.day == day)) if day is not None else undated
+
+        if start_from is not None:
+            mask &= self.match_start >= start_from
+        if start_to is not None:
+            mask &= self.match_start <= start_to
+
+        if morethan is not None:
+            mask &= (self.home > morethan) & (self.away > morethan)
+
+        if anyonehas is not None:
+            max_odds = round(anyonehas + 0.09, 3)
+            in_range = np.zeros(len(self), dtype=bool)
+            for column in (self.home, self.draw, self.away):
+                in_range |= (column >= anyonehas) & (column <= max_odds)
+            mask &= in_range
+
+        return mask
+
+    def filter_ids(self, **filters):
+        """Return match ids selected by the filters, in (matchStart, matchId) order"""
+        return self.match_ids[self.mask(**filters)].tolist()
+
+
+def build_columns(snapshot):
+    """Build the columnar table for a snapshot, None when NumPy is not installed"""
+    if not NUMPY_AVAILABLE:
+        return None
+    return MatchColumns(snapshot)
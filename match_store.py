@@ -0,0 +1,533 @@
+"""
+Winamax Match State Store
+Author: Anass EL
+Description: Materialized match/odds state built once per capture reload from captured Socket.IO messages
+"""
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from capture_store import PAGE_KEY
+from compact_records import CompactRecord
+
+MAIN_SIDES = ('home', 'draw', 'away')
+# Outcome codes of 1X2 / head-to-head markets
+OUTCOME_CODE_SIDES = {'1': 'home', 'x': 'draw', 'X': 'draw', '2': 'away'}
+# Top-level catalogue counters pushed in sports frames
+COUNTER_KEYS = ('mainMatchCount', 'liveMatchCount', 'reallyLiveMatchCount', 'tvMatchCount')
+
+
+def parse_socketio_message(raw):
+    """Parse a raw '42["m",{...}]' Socket.IO frame, returns the payload dict or None"""
+    if not isinstance(raw, str) or not raw.startswith('42["m"'):
+        return None
+    try:
+        # Extract JSON after "42["m","
+        json_part = raw.split('42["m",', 1)[1].rstrip(']')
+        parsed = json.loads(json_part)
+    except Exception:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def classify_side(label, competitor1_name, competitor2_name):
+    """Return 'home', 'draw', 'away' or None for a main bet outcome label"""
+    # Home: matches competitor1Name
+    if competitor1_name and competitor1_name in label:
+        return 'home'
+    # Away: matches competitor2Name
+    if competitor2_name and competitor2_name in label:
+        return 'away'
+    # Draw: contains "nul" or "Match nul" (French for draw)
+    lowered = label.lower()
+    if 'nul' in lowered or 'draw' in lowered:
+        return 'draw'
+    return None
+
+
+def resolve_side(outcome_info, label, match_data):
+    """Side of a main bet outcome: by competitorId, then by 1/x/2 code, then by label"""
+    competitor_id = outcome_info.get('competitorId')
+    if competitor_id is not None:
+        if competitor_id == match_data.get('competitor1Id'):
+            return 'home'
+        if competitor_id == match_data.get('competitor2Id'):
+            return 'away'
+    side = OUTCOME_CODE_SIDES.get(outcome_info.get('code'))
+    if side is not None:
+        return side
+    return classify_side(label, match_data.get('competitor1Name'), match_data.get('competitor2Name'))
+
+
+class MarketOutcome:
+    """One outcome of a resolved main market, odds is None while no price was seen"""
+
+    __slots__ = ('outcome_id', 'label', 'code', 'side', 'odds')
+
+    def __init__(self, outcome_id, label, code, side, odds):
+        self.outcome_id = outcome_id
+        self.label = label
+        self.code = code
+        self.side = side
+        self.odds = odds
+
+
+class MainMarket:
+    """Main bet of a match with its outcomes in bet order, sides assigned once"""
+
+    __slots__ = ('bet_id', 'outcomes')
+
+    def __init__(self, bet_id, outcomes):
+        self.bet_id = bet_id
+        self.outcomes = outcomes
+
+    def priced(self):
+        """Outcomes that have odds"""
+        return [outcome for outcome in self.outcomes if outcome.odds is not None]
+
+    def sides(self):
+        """{side: odds} of the priced outcomes, a later outcome wins a side"""
+        return {outcome.side: outcome.odds for outcome in self.outcomes
+                if outcome.side is not None and outcome.odds is not None}
+
+
+def resolve_market(match_data, bets, outcomes, odds):
+    """Link match -> mainBetId -> bet -> outcomes -> current odds, None without a known main bet"""
+    if 'mainBetId' not in match_data:
+        return None
+    bet = bets.get(str(match_data['mainBetId']))
+    if not bet:
+        return None
+    market_outcomes = []
+    for outcome_id in bet.get('outcomes', []):
+        outcome_id_str = str(outcome_id)
+        outcome_info = outcomes.get(outcome_id_str, {})
+        label = outcome_info.get('label', f'Outcome {outcome_id}')
+        market_outcomes.append(MarketOutcome(outcome_id, label, outcome_info.get('code'),
+                                             resolve_side(outcome_info, label, match_data),
+                                             odds.get(outcome_id_str)))
+    return MainMarket(match_data['mainBetId'], market_outcomes)
+
+
+class MatchState:
+    """Mutable match/odds state that applies Socket.IO frames as deltas.
+
+    Winamax frames are partial updates keyed by id; a None value removes the
+    record. Records are replaced rather than mutated in place, so snapshots
+    taken with snapshot() stay valid while later frames keep being applied.
+    When history is given (an OddsHistoryStore), every odds delta is also
+    recorded with its frame timestamp. With compact=True, records are
+    stored as CompactRecord (shared key layouts, interned strings) instead
+    of dicts. metrics (a FrameMetrics) is told about every frame with its
+    parse time. Messages of a multi-page capture carry the page they were
+    captured from; match_pages/bet_pages map every match/bet id to the page
+    of the last frame that updated it.
+    """
+
+    def __init__(self, history=None, compact=False, metrics=None):
+        self.history = history
+        self.compact = compact
+        self.metrics = metrics
+        self.matches = {}
+        self.odds = {}
+        self.outcomes = {}
+        self.bets = {}
+        self.sports = {}
+        self.tournaments = {}
+        self.counters = {}
+        self.match_pages = {}
+        self.bet_pages = {}
+        self.frame_count = 0
+        self.last_frame_time = None
+
+    def _merge_records(self, target, updates):
+        """Merge a {id: {fields}} delta into target, None removes the record"""
+        for record_id, record in updates.items():
+            if record is None:
+                target.pop(record_id, None)
+            elif isinstance(record, dict):
+                previous = target.get(record_id)
+                if not self.compact:
+                    target[record_id] = {**previous, **record} if previous else dict(record)
+                elif previous:
+                    target[record_id] = previous.merge(record)
+                else:
+                    target[sys.intern(record_id)] = CompactRecord.from_dict(record)
+
+    @staticmethod
+    def _record_pages(pages, updates, page):
+        """Remember the page of every updated record, forget removed ones"""
+        for record_id, record in updates.items():
+            if record is None:
+                pages.pop(record_id, None)
+            else:
+                pages[record_id] = page
+
+    def apply_update(self, parsed, timestamp=None, page=None):
+        """Apply one parsed 'm' payload to the state, page is the page it was captured from if known"""
+        if isinstance(parsed.get('matches'), dict):
+            self._merge_records(self.matches, parsed['matches'])
+            if page is not None:
+                self._record_pages(self.match_pages, parsed['matches'], page)
+
+        if isinstance(parsed.get('odds'), dict):
+            for outcome_id, value in parsed['odds'].items():
+                if value is None:
+                    self.odds.pop(outcome_id, None)
+                elif self.compact:
+                    self.odds[sys.intern(outcome_id)] = value
+                else:
+                    self.odds[outcome_id] = value
+            if self.history is not None:
+                self.history.record_odds(parsed['odds'], timestamp)
+
+        if isinstance(parsed.get('outcomes'), dict):
+            self._merge_records(self.outcomes, parsed['outcomes'])
+
+        if isinstance(parsed.get('bets'), dict):
+            self._merge_records(self.bets, parsed['bets'])
+            if page is not None:
+                self._record_pages(self.bet_pages, parsed['bets'], page)
+
+        if isinstance(parsed.get('sports'), dict):
+            self._merge_records(self.sports, parsed['sports'])
+
+        if isinstance(parsed.get('tournaments'), dict):
+            self._merge_records(self.tournaments, parsed['tournaments'])
+
+        for key in COUNTER_KEYS:
+            if isinstance(parsed.get(key), int):
+                self.counters[key] = parsed[key]
+
+        self.frame_count += 1
+
+    def apply_frame(self, raw, timestamp=None, page=None):
+        """Apply a raw '42["m",...]' frame, returns True if it carried an update"""
+        if self.metrics is None:
+            parsed = parse_socketio_message(raw)
+        else:
+            started = time.perf_counter()
+            parsed = parse_socketio_message(raw)
+            self.metrics.record_frame(parsed, time.perf_counter() - started, timestamp)
+        if parsed is None:
+            return False
+        self.apply_update(parsed, timestamp, page)
+        if timestamp is not None:
+            self.last_frame_time = timestamp
+        return True
+
+    def apply_message(self, msg):
+        """Apply one captured message (as stored in the capture file, raw or decoded)"""
+        if not isinstance(msg, dict) or msg.get('event') != 'websocket_message':
+            return False
+        data = msg.get('data')
+        if not isinstance(data, dict):
+            return False
+        if 'raw' in data:
+            return self.apply_frame(data['raw'], msg.get('timestamp'), msg.get(PAGE_KEY))
+        # Decoded payload: {'packet': '42', 'payload': ['m', {...}]}
+        payload = data.get('payload')
+        if data.get('packet') != '42' or not isinstance(payload, list) or len(payload) < 2 \
+                or payload[0] != 'm' or not isinstance(payload[1], dict):
+            return False
+        if self.metrics is not None:
+            self.metrics.record_frame(payload[1], None, msg.get('timestamp'))
+        self.apply_update(payload[1], msg.get('timestamp'), msg.get(PAGE_KEY))
+        if msg.get('timestamp') is not None:
+            self.last_frame_time = msg['timestamp']
+        return True
+
+    def apply_messages(self, messages):
+        """Apply a batch of captured messages, returns how many frames were applied"""
+        applied = 0
+        for msg in messages:
+            if self.apply_message(msg):
+                applied += 1
+        return applied
+
+    def as_tuple(self):
+        """Return (matches, odds, outcomes, bets, sports)"""
+        return self.matches, self.odds, self.outcomes, self.bets, self.sports
+
+    def snapshot(self, url=None, timestamp=None, message_count=None):
+        """Freeze the current state into a MatchSnapshot (shallow copies, records are shared)"""
+        return MatchSnapshot(
+            dict(self.matches), dict(self.odds), dict(self.outcomes),
+            dict(self.bets), dict(self.sports),
+            url=url,
+            timestamp=timestamp if timestamp is not None else self.last_frame_time,
+            message_count=message_count if message_count is not None else self.frame_count,
+            counters=dict(self.counters),
+            tournaments=dict(self.tournaments),
+            match_pages=dict(self.match_pages),
+            bet_pages=dict(self.bet_pages)
+        )
+
+
+class LiveStatePublisher:
+    """Applies live batches to a MatchState and publishes it at most once every min_interval seconds.
+
+    A snapshot copies and re-indexes the whole state, so batches applied
+    within min_interval of the last publish only mark the state as changed;
+    a timer publishes them when the interval is over, so the last changes
+    of a quiet feed are not held back. publish(state) runs under the same
+    lock as apply_messages(), never while a batch is being applied.
+    """
+
+    def __init__(self, state, publish, min_interval=5.0):
+        self.state = state
+        self.publish = publish
+        self.min_interval = min_interval
+        self.last_publish = None
+        self.pending = False
+        self.closed = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def apply_messages(self, messages):
+        """Apply a batch, publishing now if the interval allows it; returns how many frames were applied"""
+        with self._lock:
+            applied = self.state.apply_messages(messages)
+            if applied:
+                self.pending = True
+                self._publish_if_due()
+        return applied
+
+    def _publish_if_due(self):
+        # Keep the previous snapshot until the state lists matches
+        if not self.pending or not self.state.matches or self.closed:
+            return
+        wait = 0 if self.last_publish is None else self.last_publish + self.min_interval - time.monotonic()
+        if wait <= 0:
+            self.pending = False
+            self.last_publish = time.monotonic()
+            self.publish(self.state)
+        elif self._timer is None:
+            self._timer = threading.Timer(wait, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._publish_if_due()
+
+    def close(self):
+        """Stop publishing; pending changes are left to the caller (e.g. the final reload)"""
+        with self._lock:
+            self.closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+def extract_all_data_from_messages(messages):
+    """Extract all data from captured messages including matches, odds, outcomes, etc."""
+    state = MatchState()
+    state.apply_messages(messages)
+    return state.as_tuple()
+
+
+class MatchSnapshot:
+    """Read-only match/odds state materialized from one capture.
+
+    Built once per reload and swapped in as a whole, so request handlers
+    only read prebuilt structures and never re-parse the capture.
+    """
+
+    def __init__(self, matches=None, odds=None, outcomes=None, bets=None, sports=None,
+                 url=None, timestamp=None, message_count=0, counters=None, tournaments=None,
+                 match_pages=None, bet_pages=None):
+        self.matches = matches if matches is not None else {}
+        self.odds = odds if odds is not None else {}
+        self.outcomes = outcomes if outcomes is not None else {}
+        self.bets = bets if bets is not None else {}
+        self.sports = sports if sports is not None else {}
+        self.url = url
+        self.timestamp = timestamp
+        self.message_count = message_count
+        self.counters = counters if counters is not None else {}
+        self.tournaments = tournaments if tournaments is not None else {}
+        self.match_pages = match_pages if match_pages is not None else {}  # match id -> captured page
+        self.bet_pages = bet_pages if bet_pages is not None else {}  # bet id -> captured page
+        self.columns = None  # Optional columnar table, attached when published
+        self.version = 0  # Assigned when published, increases monotonically
+        self.rendered = {}  # path -> serialized response body, filled once per snapshot
+        self._build_indexes()
+
+    def as_tuple(self):
+        """Return (matches, odds, outcomes, bets, sports)"""
+        return self.matches, self.odds, self.outcomes, self.bets, self.sports
+
+    @staticmethod
+    def sort_key(match_id, match_data):
+        """(matchStart, matchId) ordering, matches without matchStart go to the end"""
+        match_start = match_data.get('matchStart')
+        return (float(match_start) if match_start is not None else float('inf'), str(match_id))
+
+    def seconds_until_next_start(self, now):
+        """Seconds until the next listed matchStart after now, None if there is none"""
+        position = bisect_right(self.ordered_starts, float(now))
+        if position >= len(self.ordered_starts) or self.ordered_starts[position] == float('inf'):
+            return None
+        return self.ordered_starts[position] - now
+
+    def position_after(self, match_ids, key):
+        """Index of the first id in match_ids (sorted by sort_key) whose key is greater than key"""
+        lo, hi = 0, len(match_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            match_id = match_ids[mid]
+            if self.sort_key(match_id, self.matches[match_id]) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _build_indexes(self):
+        """Build the secondary indexes used by the /api/matches filters.
+
+        Only listed matches (both competitor names present) are indexed,
+        every bucket is kept in (matchStart, matchId) order with a parallel
+        list of start keys for bisect range lookups.
+        """
+        listed = []
+        for match_id, match_data in self.matches.items():
+            # Skip if no competitor names (tournament/outright bets)
+            if not match_data.get('competitor1Name') or not match_data.get('competitor2Name'):
+                continue
+            listed.append((self.sort_key(match_id, match_data), match_id, match_data))
+        listed.sort(key=lambda item: item[0])
+
+        self.ordered_ids = []
+        self.ordered_starts = []
+        self.by_sport = {}
+        self.by_day = {}
+        self.undated_ids = []
+        for (start_key, _), match_id, match_data in listed:
+            self.ordered_ids.append(match_id)
+            self.ordered_starts.append(start_key)
+
+            sport_bucket = self.by_sport.setdefault(match_data.get('sportId'), ([], []))
+            sport_bucket[0].append(match_id)
+            sport_bucket[1].append(start_key)
+
+            match_start = match_data.get('matchStart')
+            if match_start:
+                day = datetime.fromtimestamp(match_start, tz=timezone.utc).strftime('%d-%m-%Y')
+                day_bucket = self.by_day.setdefault(day, ([], []))
+                day_bucket[0].append(match_id)
+                day_bucket[1].append(start_key)
+            else:
+                self.undated_ids.append(match_id)
+
+        self._build_odds_index()
+
+    def page_match_counts(self):
+        """{page: listed match count} of a multi-page capture, {} when pages are unknown"""
+        counts = {}
+        for match_id in self.ordered_ids:
+            page = self.match_pages.get(match_id)
+            if page is not None:
+                counts[page] = counts.get(page, 0) + 1
+        return counts
+
+    def market(self, match_id):
+        """Resolved main market of a match, resolved on demand outside the listing"""
+        market = self.markets.get(match_id)
+        if market is None:
+            match_data = self.matches.get(match_id)
+            if match_data is not None:
+                market = resolve_market(match_data, self.bets, self.outcomes, self.odds)
+        return market
+
+    def _build_odds_index(self):
+        """Resolve the main market of every listed match and keep sides in sorted per-side arrays.
+
+        markets holds the MainMarket of every listed match, main_odds its
+        priced (outcome_id, label, odds) and main_sides the {side: odds};
+        side_prices/side_ids are parallel arrays sorted by price for bisect
+        range lookups.
+        """
+        self.markets = {}
+        self.main_odds = {}
+        self.main_sides = {}
+        entries = {side: [] for side in MAIN_SIDES}
+        for match_id in self.ordered_ids:
+            market = resolve_market(self.matches[match_id], self.bets, self.outcomes, self.odds)
+            if market is None:
+                self.main_odds[match_id] = []
+                self.main_sides[match_id] = {}
+                continue
+            self.markets[match_id] = market
+            self.main_odds[match_id] = [(outcome.outcome_id, outcome.label, outcome.odds)
+                                        for outcome in market.priced()]
+            sides = market.sides()
+            self.main_sides[match_id] = sides
+            for side, value in sides.items():
+                entries[side].append((value, match_id))
+
+        self.side_prices = {}
+        self.side_ids = {}
+        for side, side_entries in entries.items():
+            side_entries.sort(key=lambda item: item[0])
+            self.side_prices[side] = [value for value, _ in side_entries]
+            self.side_ids[side] = [match_id for _, match_id in side_entries]
+
+    def ids_with_any_side_between(self, low, high):
+        """Match ids where home, draw or away odds are within [low, high]"""
+        found = set()
+        for side in MAIN_SIDES:
+            prices = self.side_prices[side]
+            found.update(self.side_ids[side][bisect_left(prices, low):bisect_right(prices, high)])
+        return found
+
+    def ids_with_side_above(self, side, value):
+        """Match ids where the given side's odds are strictly greater than value"""
+        prices = self.side_prices[side]
+        return set(self.side_ids[side][bisect_right(prices, value):])
+
+    def ids_with_home_and_away_above(self, value):
+        """Match ids where both home and away odds are strictly greater than value"""
+        return self.ids_with_side_above('home', value) & self.ids_with_side_above('away', value)
+
+    def query_ids(self, sport_id=None, date=None, start_from=None, start_to=None):
+        """Return listed match ids matching the filters, in (matchStart, matchId) order.
+
+        date is DD-MM-YYYY (UTC); as before, matches without matchStart are
+        not excluded by it. start_from/start_to are inclusive matchStart bounds.
+        """
+        if date:
+            ids, starts = self.by_day.get(date, ([], []))
+            if self.undated_ids:
+                ids = ids + self.undated_ids
+                starts = starts + [float('inf')] * len(self.undated_ids)
+        elif sport_id is not None:
+            ids, starts = self.by_sport.get(sport_id, ([], []))
+        else:
+            ids, starts = self.ordered_ids, self.ordered_starts
+
+        if start_from is not None or start_to is not None:
+            lo = bisect_left(starts, float(start_from)) if start_from is not None else 0
+            # Matches without matchStart (sorted last as inf) never fall in a range
+            hi = bisect_right(starts, float(start_to)) if start_to is not None else bisect_left(starts, float('inf'))
+            ids = ids[lo:hi]
+
+        if date and sport_id is not None:
+            ids = [match_id for match_id in ids if self.matches[match_id].get('sportId') == sport_id]
+        return ids
+
+
+def build_snapshot(captured_data, history=None, compact=False, metrics=None):
+    """Build a MatchSnapshot from a loaded capture document, recording odds into history if given"""
+    messages = captured_data.get('messages', [])
+    state = MatchState(history, compact, metrics)
+    state.apply_messages(messages)
+    return state.snapshot(
+        url=captured_data.get('url'),
+        timestamp=captured_data.get('timestamp'),
+        message_count=captured_data.get('message_count', len(messages))
+    )
@@ -0,0 +1,188 @@
+"""
+Winamax Metrics
+Author: Anass EL
+Description: Lightweight Prometheus-style counters, gauges and histograms rendered in the text exposition format
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from capture_store import parse_timestamp
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+FRAME_PARSE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.05, 0.25)
+RELOAD_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CAPTURE_BUCKETS = (5, 15, 30, 60, 120, 180, 300, 600, 1200)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values):
+    """{name="value",...} with label values escaped, '' without labels"""
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Metric:
+    """A named metric family, with one series per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=(), function=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        # Collected at scrape time: a number, or {label values tuple: number}
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def collect(self):
+        """(label values, value) of every series"""
+        if self.function is None:
+            with self._lock:
+                return sorted(self._values.items())
+        value = self.function()
+        if isinstance(value, dict):
+            return sorted(value.items())
+        return [((), value)] if value is not None else []
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for label_values, value in self.collect():
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def inc_each(self, series):
+        """inc() every label values tuple of series under one lock acquisition"""
+        with self._lock:
+            values = self._values
+            for label_values in series:
+                values[label_values] = values.get(label_values, 0) + 1
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(Metric):
+    """Cumulative buckets, sum and count per series; observe() is a bisect and a few increments"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            series = sorted((label_values, (list(counts), total)) for label_values, (counts, total) in self._values.items())
+        names = self.labels + ('le',)
+        for label_values, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = format_labels(names, label_values + (format_value(float(bound)),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Metric families of one process, rendered together for a scrape"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=(), function=None):
+        return self.register(Counter(name, help_text, labels, function))
+
+    def gauge(self, name, help_text, labels=(), function=None):
+        return self.register(Gauge(name, help_text, labels, function))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing callback must not take the whole scrape down
+                lines.append(f'# {metric.name} unavailable: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+class FrameMetrics:
+    """Frame parse time, frames by top-level key and last frame timestamp of one ingestion source.
+
+    Handed to MatchState, which calls record_frame() for every frame it
+    applies (parse_seconds is None for frames stored decoded).
+    """
+
+    def __init__(self, frames, frame_keys, parse_seconds, source):
+        self.frames = frames
+        self.frame_keys = frame_keys
+        self.parse_seconds = parse_seconds
+        self.source = source
+        self.last_timestamp = None
+
+    def record_frame(self, parsed, parse_seconds, timestamp):
+        if parse_seconds is not None:
+            self.parse_seconds.observe(parse_seconds, self.source)
+        if parsed is None:
+            self.frames.inc(self.source, 'ignored')
+            return
+        self.frames.inc(self.source, 'applied')
+        source = self.source
+        self.frame_keys.inc_each([(source, key) for key in parsed])
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+    def last_frame_epoch(self):
+        return parse_timestamp(self.last_timestamp) if self.last_timestamp is not None else None
+
+
+def age_seconds(*epochs):
+    """Seconds since the most recent of epochs (None entries ignored), None if there is none"""
+    known = [epoch for epoch in epochs if epoch is not None]
+    return round(time.time() - max(known), 3) if known else None
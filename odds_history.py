@@ -0,0 +1,141 @@
+"""
+Winamax Odds History
+Author: Anass EL
+Description: Append-only per-outcome odds time series in compact array-backed columns
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from capture_store import parse_timestamp
+
+
+def downsample(timestamps, prices, resolution):
+    """Keep the last point of every resolution-seconds bucket, returns (timestamps, prices) lists"""
+    kept_times, kept_prices = [], []
+    last_bucket = None
+    for timestamp, price in zip(timestamps, prices):
+        bucket = timestamp // resolution
+        if bucket == last_bucket:
+            kept_times[-1] = timestamp
+            kept_prices[-1] = price
+        else:
+            kept_times.append(timestamp)
+            kept_prices.append(price)
+            last_bucket = bucket
+    return kept_times, kept_prices
+
+
+class OddsSeries:
+    """(timestamp, price) points of one outcome, only price changes are stored"""
+
+    __slots__ = ('timestamps', 'prices')
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.prices = array('d')
+
+    def append(self, timestamp, price):
+        """Append a point, returns False for replayed (not newer) points and unchanged prices"""
+        if self.timestamps:
+            if timestamp <= self.timestamps[-1] or price == self.prices[-1]:
+                return False
+        self.timestamps.append(timestamp)
+        self.prices.append(price)
+        return True
+
+    def compact(self, cutoff, max_points):
+        """Drop points older than cutoff (keeping the price in force at cutoff), then downsample
+        the older half until at most max_points remain"""
+        start = bisect_left(self.timestamps, cutoff)
+        if start > 1:
+            # The last point before the cutoff still tells the price at the cutoff
+            del self.timestamps[:start - 1]
+            del self.prices[:start - 1]
+        while len(self.timestamps) > max_points:
+            half = len(self.timestamps) // 2
+            older_times, older_prices = self.timestamps[:half], self.prices[:half]
+            span = older_times[-1] - older_times[0]
+            resolution = max(span / max(max_points // 4, 1), 1.0)
+            kept_times, kept_prices = downsample(older_times, older_prices, resolution)
+            if len(kept_times) == half:
+                break
+            self.timestamps = array('d', kept_times) + self.timestamps[half:]
+            self.prices = array('d', kept_prices) + self.prices[half:]
+
+    def points(self, since=None, resolution=None):
+        """Return [[timestamp, price], ...], optionally from since and downsampled"""
+        start = bisect_left(self.timestamps, since) if since is not None else 0
+        timestamps, prices = self.timestamps[start:], self.prices[start:]
+        if resolution:
+            timestamps, prices = downsample(timestamps, prices, resolution)
+        return [[timestamp, price] for timestamp, price in zip(timestamps, prices)]
+
+
+class OddsHistoryStore:
+    """Odds time series keyed by outcome id, fed from MatchState frames.
+
+    record_odds() takes the odds delta of one frame and costs one lock and
+    one array append per changed outcome. Series are compacted (retention
+    and downsampling of the older half) every compact_every appends.
+    """
+
+    def __init__(self, retention_seconds=86400, max_points=4096, compact_every=50000, clock=time.time):
+        self.retention_seconds = retention_seconds
+        self.max_points = max_points
+        self.compact_every = compact_every
+        self.clock = clock
+        self.series = {}
+        self.points = 0
+        self._appends_since_compact = 0
+        self._lock = threading.Lock()
+
+    def record_odds(self, odds, timestamp=None):
+        """Append the prices of one frame's odds delta, returns how many points were stored"""
+        # Frame timestamps are ISO strings, numbers are taken as epoch seconds
+        when = float(timestamp) if isinstance(timestamp, (int, float)) else parse_timestamp(timestamp)
+        if when is None:
+            when = self.clock()
+        stored = 0
+        with self._lock:
+            for outcome_id, price in odds.items():
+                if not isinstance(price, (int, float)):
+                    continue
+                series = self.series.get(outcome_id)
+                if series is None:
+                    series = self.series[outcome_id] = OddsSeries()
+                if series.append(when, float(price)):
+                    stored += 1
+            self.points += stored
+            self._appends_since_compact += stored
+            if self._appends_since_compact >= self.compact_every:
+                self._compact()
+        return stored
+
+    def _compact(self):
+        cutoff = self.clock() - self.retention_seconds
+        points = 0
+        for outcome_id in list(self.series):
+            series = self.series[outcome_id]
+            series.compact(cutoff, self.max_points)
+            if len(series.timestamps) == 1 and series.timestamps[0] < cutoff:
+                # Nothing moved within the retention window
+                del self.series[outcome_id]
+                continue
+            points += len(series.timestamps)
+        self.points = points
+        self._appends_since_compact = 0
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def history(self, outcome_id, since=None, resolution=None):
+        """Points of one outcome, [] when nothing was recorded"""
+        with self._lock:
+            series = self.series.get(str(outcome_id))
+            return series.points(since, resolution) if series is not None else []
+
+    def stats(self):
+        return {'outcomes': len(self.series), 'points': self.points}
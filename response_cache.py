@@ -0,0 +1,128 @@
+"""
+Winamax Response Cache
+Author: Anass EL
+Description: Snapshot-versioned ETags and a bounded LRU of rendered API responses
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+MIN_COMPRESS_SIZE = 1024  # Smaller bodies are always sent uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def normalize_args(args):
+    """Return query args as a sorted tuple of (key, value) pairs"""
+    return tuple(sorted(args.items(multi=True)))
+
+
+def make_cache_key(version, path, args):
+    """Cache key for a rendered response: snapshot version, path and normalized args"""
+    return (version, path, normalize_args(args))
+
+
+ENCODING_SUFFIXES = {'gzip': '-gz', 'br': '-br'}
+
+
+def make_etag(cache_key, encoding=None):
+    """Derive a stable ETag value from a cache key and the negotiated Content-Encoding.
+
+    Identity, gzip and brotli bodies are different byte representations, so
+    each gets its own strong validator.
+    """
+    version, path, args = cache_key
+    digest = hashlib.sha1(repr((path, args)).encode('utf-8')).hexdigest()[:16]
+    return f'v{version}-{digest}{ENCODING_SUFFIXES.get(encoding, "")}'
+
+
+def choose_encoding(accept_encodings):
+    """Pick the best supported Content-Encoding from a werkzeug Accept-Encoding header"""
+    if BROTLI_AVAILABLE and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class RenderedBody:
+    """A serialized response body with lazily built compressed variants"""
+
+    __slots__ = ('identity', 'status', '_encoded', '_lock')
+
+    def __init__(self, identity, status=200):
+        self.identity = identity
+        self.status = status
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """Return (body, encoding) for the requested encoding, compressing once on first use"""
+        if encoding is None or len(self.identity) < MIN_COMPRESS_SIZE:
+            return self.identity, None
+        body = self._encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    if encoding == 'br':
+                        body = brotli.compress(self.identity, quality=BROTLI_QUALITY)
+                    else:
+                        body = gzip.compress(self.identity, compresslevel=GZIP_LEVEL)
+                    self._encoded[encoding] = body
+        return body, encoding
+
+    def precompress(self):
+        """Build every supported compressed variant ahead of the first request"""
+        self.encoded('gzip')
+        if BROTLI_AVAILABLE:
+            self.encoded('br')
+        return self
+
+
+class ResponseCache:
+    """Thread-safe LRU of rendered response bodies keyed by make_cache_key().
+
+    Entries of older snapshot versions are never hit again and simply age
+    out of the LRU.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached entry for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry, evicting the least recently used ones beyond max_entries"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
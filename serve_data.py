@@ -3,87 +3,483 @@ Winamax Football Matches API
 Author: Anass EL
 Description: Flask REST API to serve captured Winamax Socket.IO data with filters
 """
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from functools import wraps
+import base64
 import json
+import sqlite3
 import threading
 import time
-from datetime import datetime, timezone
-from analyze_winamax_socketio import SocketIOCapture
+from datetime import datetime
+from analyze_winamax_socketio import PersistentCaptureWorker, SocketIOCapture
+from capture_pool import CapturePool
+from engineio_client import SocketIOClientCapture
+from compact_records import CompactRecord, as_dict
+from match_store import LiveStatePublisher, MatchSnapshot, MatchState, build_snapshot
+from metrics import (CAPTURE_BUCKETS, CONTENT_TYPE as METRICS_CONTENT_TYPE, FRAME_PARSE_BUCKETS, RELOAD_BUCKETS,
+                     SIZE_BUCKETS, FrameMetrics, MetricsRegistry, age_seconds)
+from odds_history import OddsHistoryStore
+from match_columns import build_columns
+from change_stream import ChangeBroadcaster
+from capture_scheduler import AdaptiveCaptureScheduler
+from capture_store import CAPTURE_FILE
+from capture_segments import SegmentedCaptureReader, manifest_path
+from capture_watcher import CaptureWatcher
+from sqlite_store import SQLiteMatchStore, SQLiteSnapshot, SQLiteSnapshotReader
+from shared_snapshot import MappedSnapshot, SharedSnapshotReader, read_header, write_snapshot_file
+from response_cache import RenderedBody, ResponseCache, choose_encoding, make_cache_key, make_etag
+from werkzeug.datastructures import ImmutableMultiDict
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """Serializes CompactRecords (sport info, nested match fields) like the dicts they replace"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, CompactRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
 
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app)
 
 # Configuration
 CAPTURE_INTERVAL_MINUTES = 1  # Default: capture every 1 minute
 AUTO_CAPTURE_ENABLED = True  # Enable/disable automatic capture
 CAPTURE_DURATION_SECONDS = 180  # Duration for each capture (3 minutes)
+ADAPTIVE_SCHEDULING_ENABLED = True  # Pick capture delay/duration from live counts, frame rate and next kick-off
+CAPTURE_BACKEND = 'browser'  # 'browser' (Selenium) or 'socketio' (direct Engine.IO client, falls back to browser)
+CAPTURE_MODE = 'cycle'  # 'cycle' (new capture every interval) or 'persistent' (one long-lived browser session)
+CAPTURE_PAGES = ['https://www.winamax.fr/paris-sportifs/sports/1']  # Sport/tournament pages captured by the browser backend
+CAPTURE_POOL_SIZE = 4  # Browser worker processes capturing CAPTURE_PAGES concurrently (persistent mode uses the first page)
+CAPTURE_FORMAT = 'json'  # 'json' (one capture file) or 'segments' (append-only gzip NDJSON in CAPTURE_SEGMENT_DIR)
+CAPTURE_SEGMENT_DIR = 'captures'
+CAPTURE_DECODED_PAYLOADS = False  # Store frames as decoded JSON instead of escaped raw strings (smaller files, faster reload)
+SOCKETIO_SUBSCRIBE_PACKETS = []  # Raw packets the direct client emits after connecting, e.g. '42["m",{...}]'
+COMPACT_RECORDS_ENABLED = False  # Store records as __slots__ CompactRecords with interned strings (about 30% less memory, state builds about 1.6-1.8x slower)
+COLUMNAR_BACKEND_ENABLED = True  # Use NumPy columnar filtering when numpy is installed
+RESPONSE_CACHE_SIZE = 256  # Rendered responses kept per process (LRU)
+LIVE_PUBLISH_INTERVAL = 5.0  # Minimum seconds between snapshots published from live frames (each one copies and re-indexes the whole state)
+PRERENDER_ON_RELOAD = True  # Serialize and compress unfiltered match lists when a capture is reloaded (live snapshots render them on first request)
+DEFAULT_PAGE_SIZE = 100  # Page size when a cursor is given without limit
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_IDS = 200  # Match ids resolved by one /api/matches/batch or ?ids= request
+STREAM_KEEPALIVE_SECONDS = 15  # Comment line sent to idle /api/stream clients
+STREAM_BUFFER_BATCHES = 64  # Snapshot publications kept for Last-Event-ID resume
+CAPTURE_WATCH_ENABLED = True  # Reload when a new capture file generation is published (file notifications or polling)
+CAPTURE_POLL_INTERVAL = 1.0  # Seconds between checks when file notifications are unavailable
+ODDS_HISTORY_RETENTION_HOURS = 24  # Odds movement kept per outcome
+ODDS_HISTORY_MAX_POINTS = 4096  # Points per outcome before older ones are downsampled
+SQLITE_STORE_PATH = None  # e.g. 'winamax.sqlite3': python serve_data.py writes every snapshot there, WSGI workers importing this module serve from it read-only
+SHARED_SNAPSHOT_PATH = None  # e.g. 'winamax.snapshot': same as SQLITE_STORE_PATH with a memory-mapped snapshot file (used by workers if both are set)
+METRICS_ENABLED = True  # Time every request and frame for /metrics (reloads and captures are always recorded)
 
 # Global state
 captured_data = {"messages": []}
+loaded_generation = 0  # Capture file generation currently published
+reload_lock = threading.Lock()
+segment_replay = {'start': None, 'position': 0, 'state': None}  # Incremental state of the segmented capture
+current_snapshot = MatchSnapshot()  # Materialized state, swapped in whole on each reload
+snapshot_version = 0  # Incremented on every publish, used for ETags and response caching
+snapshot_version_lock = threading.Lock()
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_SIZE)
+prerendered_views = {}  # path -> payload builder, rendered once per snapshot without query args
+change_broadcaster = ChangeBroadcaster(max_batches=STREAM_BUFFER_BATCHES)
+odds_history = OddsHistoryStore(retention_seconds=ODDS_HISTORY_RETENTION_HOURS * 3600,
+                                max_points=ODDS_HISTORY_MAX_POINTS)
 capture_in_progress = False
 last_capture_time = None
 capture_thread = None
+capture_worker = None  # PersistentCaptureWorker when CAPTURE_MODE == 'persistent'
+capture_pool_status = None  # Per-page results of the last multi-page capture
+capture_watcher = None  # CaptureWatcher reloading new capture generations
+sqlite_store = None  # SQLiteMatchStore written by the capture process
+shared_snapshot_generation = None  # Generation of the last snapshot file written by the capture process
+snapshot_reader = None  # SQLiteSnapshotReader or SharedSnapshotReader of API worker processes
+capture_scheduler = AdaptiveCaptureScheduler(base_delay=CAPTURE_INTERVAL_MINUTES * 60,
+                                             base_duration=CAPTURE_DURATION_SECONDS)
+
+# Prometheus-style metrics of this process, served on /metrics
+metrics_registry = MetricsRegistry()
+request_seconds = metrics_registry.histogram('winamax_http_request_duration_seconds', 'API request latency',
+                                             ('endpoint', 'method'))
+requests_total = metrics_registry.counter('winamax_http_requests_total', 'API requests by status',
+                                          ('endpoint', 'method', 'status'))
+response_bytes = metrics_registry.histogram('winamax_http_response_size_bytes', 'API response body size as sent',
+                                            ('endpoint',), SIZE_BUCKETS)
+reload_seconds = metrics_registry.histogram('winamax_snapshot_reload_duration_seconds',
+                                            'Capture reload duration (read, state build and publish)',
+                                            buckets=RELOAD_BUCKETS)
+reloads_total = metrics_registry.counter('winamax_snapshot_reloads_total', 'Capture reloads by result', ('result',))
+publish_seconds = metrics_registry.histogram('winamax_snapshot_publish_duration_seconds',
+                                             'Snapshot publish duration (columns, prerender, stream, stores)',
+                                             buckets=RELOAD_BUCKETS)
+frames_total = metrics_registry.counter('winamax_frames_total', 'Socket.IO frames applied or ignored',
+                                        ('source', 'result'))
+frame_keys_total = metrics_registry.counter('winamax_frame_keys_total', 'Applied frames by top-level payload key',
+                                            ('source', 'key'))
+frame_parse_seconds = metrics_registry.histogram('winamax_frame_parse_duration_seconds', 'Frame JSON parse time',
+                                                 ('source',), FRAME_PARSE_BUCKETS)
+capture_seconds = metrics_registry.histogram('winamax_capture_duration_seconds', 'Capture run duration',
+                                             buckets=CAPTURE_BUCKETS)
+captures_total = metrics_registry.counter('winamax_captures_total', 'Capture runs by result', ('result',))
+# Live frames come from captures, reload frames from capture files and segments
+live_frame_metrics = FrameMetrics(frames_total, frame_keys_total, frame_parse_seconds, 'live') if METRICS_ENABLED else None
+reload_frame_metrics = FrameMetrics(frames_total, frame_keys_total, frame_parse_seconds, 'reload') if METRICS_ENABLED else None
+
+
+def publish_snapshot(snapshot, prerender=False):
+    """Swap in a new materialized snapshot for request handlers, rendering the unfiltered lists first if prerender"""
+    global current_snapshot, snapshot_version
+    started = time.perf_counter()
+    snapshot.columns = build_columns(snapshot) if COLUMNAR_BACKEND_ENABLED else None
+    if prerender:
+        prerender_snapshot(snapshot)
+    with snapshot_version_lock:
+        previous = current_snapshot
+        snapshot_version += 1
+        snapshot.version = snapshot_version
+        current_snapshot = snapshot
+        # Push match/odds changes to /api/stream clients
+        change_broadcaster.publish(previous, snapshot)
+        if sqlite_store is not None:
+            try:
+                sqlite_store.write_snapshot(snapshot)
+            except sqlite3.Error as e:
+                print(f"⚠ Could not write snapshot {snapshot.version} to {SQLITE_STORE_PATH}: {e}")
+        if shared_snapshot_generation is not None:
+            write_shared_snapshot(snapshot)
+    publish_seconds.observe(time.perf_counter() - started)
+
 
-def load_captured_data():
-    """Load captured data from JSON file (thread-safe)"""
-    global captured_data
+def write_shared_snapshot(snapshot):
+    """Publish a snapshot as the next generation of the memory-mapped snapshot file"""
+    global shared_snapshot_generation
     try:
-        # Small delay to ensure file is fully written
-        time.sleep(0.5)
+        write_snapshot_file(snapshot, SHARED_SNAPSHOT_PATH, shared_snapshot_generation + 1)
+        shared_snapshot_generation += 1
+    except OSError as e:
+        print(f"⚠ Could not write snapshot {snapshot.version} to {SHARED_SNAPSHOT_PATH}: {e}")
+
+
+def render_payload(payload, status=200):
+    """Serialize a payload exactly like jsonify() would"""
+    with app.app_context():
+        return RenderedBody(app.json.response(payload).get_data(), status)
+
+
+def prerender_snapshot(snapshot):
+    """Serialize and compress the unfiltered match lists of a snapshot once"""
+    for path, build_payload in prerendered_views.items():
+        try:
+            snapshot.rendered[path] = render_payload(build_payload(snapshot, ImmutableMultiDict())).precompress()
+        except Exception as e:
+            print(f"⚠ Could not prerender {path}: {e}")
+
+
+def request_snapshot():
+    """Snapshot pinned for the current request, the same one its ETag is derived from"""
+    if 'snapshot' not in g:
+        g.snapshot = current_snapshot
+        if snapshot_reader is not None:
+            try:
+                g.snapshot = snapshot_reader.snapshot()
+            except (OSError, ValueError, sqlite3.Error) as e:
+                # The capture process has not written the store yet
+                print(f"⚠ Shared snapshot unavailable: {e}")
+    return g.snapshot
+
+
+@app.teardown_request
+def release_snapshot(exc):
+    """End the read transaction a SQLite snapshot was pinned to, or the hold on a mapped snapshot"""
+    snapshot = g.pop('snapshot', None)
+    if isinstance(snapshot, (SQLiteSnapshot, MappedSnapshot)):
+        snapshot.release()
+
+
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Latency, status and size of the request, labelled by route (not by path, to bound cardinality)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - started, endpoint, request.method)
+        requests_total.inc(endpoint, request.method, str(response.status_code))
+        if not response.is_streamed:
+            response_bytes.observe(response.calculate_content_length() or 0, endpoint)
+    return response
+
+
+def cached_response(view):
+    """Serve a view with a snapshot-versioned ETag and an LRU of rendered bodies.
+
+    Answers 304 when If-None-Match carries the current ETag, and serves
+    identical queries within one snapshot version from memory, gzip or
+    brotli compressed according to Accept-Encoding.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        snapshot = request_snapshot()
+        key = make_cache_key(snapshot.version, request.path, request.args)
+        accepted = choose_encoding(request.accept_encodings)
+        # One strong ETag per byte representation (identity, gzip, br)
+        etag = make_etag(key, accepted)
         
-        with open('winamax_socketio_analysis.json', 'r', encoding='utf-8') as f:
-            new_data = json.load(f)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            # Unfiltered lists live on the snapshot itself, everything else in the LRU
+            pinned = not request.args and request.path in prerendered_views
+            rendered = snapshot.rendered.get(request.path) if pinned else response_cache.get(key)
+            if rendered is None:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code not in (200, 404):
+                    return response
+                rendered = RenderedBody(response.get_data(), response.status_code)
+                if pinned:
+                    snapshot.rendered[request.path] = rendered
+                else:
+                    response_cache.put(key, rendered)
+            
+            body, encoding = rendered.encoded(accepted)
+            response = Response(body, status=rendered.status, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    return wrapper
+
+
+def attach_capture_info(snapshot, new_data):
+    """Stamp a live snapshot with the capture information of the saved capture"""
+    snapshot.url = new_data.get('url', snapshot.url)
+    snapshot.timestamp = new_data.get('timestamp', snapshot.timestamp)
+    snapshot.message_count = new_data.get('message_count', snapshot.message_count)
+    return snapshot
+
+
+def read_capture_file(snapshot=None):
+    """Read the capture file, returns (data, snapshot) or None if its generation is already loaded"""
+    with open(CAPTURE_FILE, 'r', encoding='utf-8') as f:
+        new_data = json.load(f)
+    generation = new_data.get('generation', 0)
+    if generation and generation <= loaded_generation:
+        return None
+    # Build the snapshot before publishing so readers never see a half-built state
+    if snapshot is not None:
+        return new_data, attach_capture_info(snapshot, new_data)
+    return new_data, build_snapshot(new_data, odds_history, COMPACT_RECORDS_ENABLED, reload_frame_metrics)
+
+
+def read_capture_segments(snapshot=None):
+    """Read new frames of the segmented capture, returns (info, snapshot) or None if already loaded.
+
+    Only the last session is replayed, and within a session only the frames
+    appended since the previous reload are applied to the kept state.
+    """
+    reader = SegmentedCaptureReader(CAPTURE_SEGMENT_DIR)
+    if reader.generation <= loaded_generation:
+        return None
+    new_data = reader.metadata()
+    if snapshot is not None:
+        # Published from live frames, rebuild from the session start on the next file reload
+        segment_replay['state'] = None
+        return new_data, attach_capture_info(snapshot, new_data)
+    
+    start = reader.last_session_start()
+    if segment_replay['state'] is None or segment_replay['start'] != start:
+        state = MatchState(odds_history, COMPACT_RECORDS_ENABLED, reload_frame_metrics)
+        segment_replay.update(start=start, position=start, state=state)
+    state = segment_replay['state']
+    state.apply_messages(reader.iter_messages(segment_replay['position']))
+    segment_replay['position'] = reader.message_count
+    return new_data, state.snapshot(url=new_data['url'], timestamp=new_data['timestamp'],
+                                    message_count=new_data['message_count'])
+
+
+def capture_segment_dir():
+    """Segment directory captures append to, None when they write the capture file"""
+    return CAPTURE_SEGMENT_DIR if CAPTURE_FORMAT == 'segments' else None
+
+
+def captured_message_count():
+    """Number of messages of the loaded capture"""
+    return captured_data.get('message_count', len(captured_data.get('messages', [])))
+
+
+def load_captured_data(snapshot=None):
+    """Load captured data from JSON file and materialize a new snapshot (thread-safe)
+
+    If snapshot is given (already built from live frames), it is published
+    as-is instead of rebuilding the state from the file. Capture files are
+    published atomically; a generation that is already loaded is skipped.
+    With CAPTURE_FORMAT = 'segments', captured_data only holds the capture
+    information and the messages stay on disk.
+    """
+    global captured_data, loaded_generation
+    with reload_lock:
+        started = time.perf_counter()
+        try:
+            if CAPTURE_FORMAT == 'segments':
+                loaded = read_capture_segments(snapshot)
+            else:
+                loaded = read_capture_file(snapshot)
+            if loaded is None:
+                # Already picked up (watcher and capture thread both reload)
+                return True
+            new_data, new_snapshot = loaded
+            generation = new_data.get('generation', 0)
             captured_data = new_data
-            message_count = len(captured_data.get('messages', []))
+            loaded_generation = generation
+            publish_snapshot(new_snapshot, prerender=PRERENDER_ON_RELOAD)
+            reload_seconds.observe(time.perf_counter() - started)
+            reloads_total.inc('success')
+            message_count = captured_message_count()
             timestamp = captured_data.get('timestamp', 'Unknown')
-            print(f"✓ Reloaded {message_count} messages from capture file (timestamp: {timestamp})")
+            print(f"✓ Reloaded {message_count} messages from capture file (timestamp: {timestamp}, "
+                  f"generation {generation}, {len(new_snapshot.matches)} matches)")
             return True
-    except FileNotFoundError:
-        print("⚠ No capture file found. Starting with empty data. Run capture manually or wait for auto-capture.")
-        captured_data = {"messages": []}
-        return False
-    except json.JSONDecodeError as e:
-        print(f"⚠ Error parsing JSON file: {e} - File may be incomplete, keeping existing data")
-        return False
-    except Exception as e:
-        print(f"⚠ Error loading data: {e} - Keeping existing data")
-        return False
+        except FileNotFoundError:
+            print("⚠ No capture file found. Starting with empty data. Run capture manually or wait for auto-capture.")
+            captured_data = {"messages": []}
+            publish_snapshot(MatchSnapshot())
+            reloads_total.inc('missing')
+            return False
+        except json.JSONDecodeError as e:
+            print(f"⚠ Error parsing JSON file: {e} - File may be incomplete, keeping existing data")
+            reloads_total.inc('failure')
+            return False
+        except Exception as e:
+            print(f"⚠ Error loading data: {e} - Keeping existing data")
+            reloads_total.inc('failure')
+            return False
+
+
+def on_capture_generation(generation):
+    """Capture watcher callback: reload a capture file published by another process"""
+    # Captures of this process already published their frames live and record the
+    # generation they wrote themselves (run_capture reload, persistent on_save); the
+    # file is written before that, and reparsing it would replace the live snapshot
+    if capture_in_progress or capture_worker is not None:
+        return
+    if generation > loaded_generation:
+        print(f"📥 Capture generation {generation} published, reloading...")
+        load_captured_data()
+
 
-# Load data on startup
-load_captured_data()
+def start_capture_watcher():
+    """Reload new capture generations as soon as they are published"""
+    global capture_watcher
+    if CAPTURE_WATCH_ENABLED and capture_watcher is None:
+        watched = manifest_path(CAPTURE_SEGMENT_DIR) if CAPTURE_FORMAT == 'segments' else CAPTURE_FILE
+        capture_watcher = CaptureWatcher(on_capture_generation, filename=watched,
+                                         poll_interval=CAPTURE_POLL_INTERVAL)
+        capture_watcher.start(last_generation=loaded_generation)
+        print(f"👀 Watching for new capture generations ({capture_watcher.backend})")
 
 
-def run_capture():
-    """Run Selenium capture in background and reload data"""
-    global capture_in_progress, last_capture_time, captured_data
+def open_snapshot_stores():
+    """Open the shared stores: written by the capture process, read-only in imported (WSGI) workers"""
+    global sqlite_store, snapshot_reader, snapshot_version, shared_snapshot_generation
+    if __name__ == '__main__':
+        if SQLITE_STORE_PATH:
+            sqlite_store = SQLiteMatchStore(SQLITE_STORE_PATH)
+            # Versions keep increasing across restarts, workers cache responses by version
+            snapshot_version = max(snapshot_version, sqlite_store.stored_version())
+            print(f"🗄 Writing snapshots to {SQLITE_STORE_PATH}")
+        if SHARED_SNAPSHOT_PATH:
+            try:
+                shared_snapshot_generation, stored_version = read_header(SHARED_SNAPSHOT_PATH)
+                snapshot_version = max(snapshot_version, stored_version)
+            except (OSError, ValueError):
+                shared_snapshot_generation = 0
+            print(f"🗄 Writing snapshots to {SHARED_SNAPSHOT_PATH}")
+    elif SQLITE_STORE_PATH:
+        snapshot_reader = SQLiteSnapshotReader(SQLITE_STORE_PATH)
+        print(f"🗄 Serving snapshots from {SQLITE_STORE_PATH} (read-only)")
+    elif SHARED_SNAPSHOT_PATH:
+        snapshot_reader = SharedSnapshotReader(SHARED_SNAPSHOT_PATH)
+        print(f"🗄 Serving snapshots from {SHARED_SNAPSHOT_PATH} (memory-mapped)")
+
+open_snapshot_stores()
+
+# Load data on startup (read-only workers get their data from the shared store)
+if snapshot_reader is None:
+    load_captured_data()
+
+
+def run_capture(duration=CAPTURE_DURATION_SECONDS):
+    """Run Selenium capture in background and reload data, returns True when frames were captured"""
+    global capture_in_progress, last_capture_time, captured_data, capture_pool_status
     
     if capture_in_progress:
         print("⚠ Capture already in progress, skipping...")
-        return
+        return False
     
     capture_in_progress = True
     print(f"\n{'='*80}")
     print(f"🔄 Starting automatic data capture...")
     print(f"{'='*80}")
     
+    success = False
+    started = time.time()
+    live_state = MatchState(odds_history, COMPACT_RECORDS_ENABLED, live_frame_metrics)
+    # Apply frames as deltas while the capture runs, publishing at most every LIVE_PUBLISH_INTERVAL seconds
+    live_publisher = LiveStatePublisher(live_state, lambda state: publish_snapshot(state.snapshot(url=capture.url)),
+                                        LIVE_PUBLISH_INTERVAL)
+    on_messages = live_publisher.apply_messages
     try:
         # Store previous message count for comparison
-        previous_count = len(captured_data.get('messages', []))
+        previous_count = captured_message_count()
         
-        # Run Selenium capture (this saves to winamax_socketio_analysis.json)
-        capture = SocketIOCapture()
-        capture.run(duration=CAPTURE_DURATION_SECONDS)
+        # Run capture (this saves to winamax_socketio_analysis.json)
+        capture = None
+        if CAPTURE_BACKEND == 'socketio':
+            capture = SocketIOClientCapture(on_messages=on_messages,
+                                            subscribe_packets=SOCKETIO_SUBSCRIBE_PACKETS,
+                                            decoded_payloads=CAPTURE_DECODED_PAYLOADS,
+                                            segment_dir=capture_segment_dir())
+            if not capture.run(duration=duration):
+                print("⚠ Direct Socket.IO capture received no frames, falling back to browser capture")
+                capture = None
+        if capture is None and len(CAPTURE_PAGES) > 1:
+            # One browser process per page, frames from every page feed the same live state
+            capture = CapturePool(CAPTURE_PAGES, max_workers=CAPTURE_POOL_SIZE, on_messages=on_messages,
+                                  decoded_payloads=CAPTURE_DECODED_PAYLOADS, segment_dir=capture_segment_dir())
+            capture.run(duration=duration)
+            capture_pool_status = capture.status()
+        elif capture is None:
+            capture = SocketIOCapture(on_messages=on_messages, decoded_payloads=CAPTURE_DECODED_PAYLOADS,
+                                      segment_dir=capture_segment_dir(), url=CAPTURE_PAGES[0])
+            capture.run(duration=duration)
         
         # Update timestamp
         last_capture_time = datetime.now().isoformat()
+        live_publisher.close()
         
-        # Reload fresh data from file (thread-safe)
+        # Reload fresh data from file (thread-safe), reusing the live state instead of a full rebuild
         print("📥 Reloading fresh data from capture file...")
-        reload_success = load_captured_data()
+        if live_state.matches:
+            reload_success = load_captured_data(snapshot=live_state.snapshot(url=capture.url))
+        else:
+            reload_success = load_captured_data()
         
         if reload_success:
-            new_count = len(captured_data.get('messages', []))
+            new_count = captured_message_count()
             diff = new_count - previous_count
             if diff > 0:
                 print(f"✅ Data reloaded! {new_count} messages (+{diff} new)")
@@ -93,6 +489,7 @@ def run_capture():
                 print(f"✅ Data reloaded! {new_count} messages (no change)")
         else:
             print("⚠ Data reload failed, but capture completed")
+        success = live_state.frame_count > 0
         
         print(f"{'='*80}\n")
         
@@ -101,33 +498,78 @@ def run_capture():
         import traceback
         traceback.print_exc()
     finally:
+        live_publisher.close()
         capture_in_progress = False
+        capture_scheduler.record_capture(success, live_state.frame_count, time.time() - started)
+        capture_seconds.observe(time.time() - started)
+        captures_total.inc('success' if success else 'failure')
+    return success
 
 
 def background_capture_loop():
     """Background thread that periodically captures data"""
     global AUTO_CAPTURE_ENABLED
     
-    # Wait for initial interval before first capture
-    print(f"⏳ Background capture will start in {CAPTURE_INTERVAL_MINUTES} minutes...")
-    
     while AUTO_CAPTURE_ENABLED:
         try:
-            # Wait for the interval
-            time.sleep(CAPTURE_INTERVAL_MINUTES * 60)
+            if ADAPTIVE_SCHEDULING_ENABLED:
+                decision = capture_scheduler.next_decision(current_snapshot)
+                delay, duration = decision.delay, decision.duration
+                print(f"⏳ Next capture in {delay:.0f}s for {duration:.0f}s ({decision.reason})")
+            else:
+                delay, duration = CAPTURE_INTERVAL_MINUTES * 60, CAPTURE_DURATION_SECONDS
+                print(f"⏳ Next capture in {CAPTURE_INTERVAL_MINUTES} minutes...")
+            time.sleep(delay)
             
             if AUTO_CAPTURE_ENABLED:
-                run_capture()
+                run_capture(duration=duration)
         except Exception as e:
             print(f"❌ Error in background capture loop: {e}")
             time.sleep(60)  # Wait 1 minute before retrying
 
 
+def start_persistent_capture():
+    """Start the long-lived browser capture worker feeding live snapshots"""
+    global capture_worker
+    
+    def new_publisher():
+        state = MatchState(odds_history, COMPACT_RECORDS_ENABLED, live_frame_metrics)
+        return LiveStatePublisher(state, lambda state: publish_snapshot(state.snapshot(url=capture_worker.capture.url)),
+                                  LIVE_PUBLISH_INTERVAL)
+    
+    live = {'publisher': new_publisher()}
+    
+    def on_session_start():
+        # A new page load starts over with a full initial frame; the previous snapshot
+        # stays published until the new session has listed matches
+        live['publisher'].close()
+        live['publisher'] = new_publisher()
+    
+    def on_messages(messages):
+        live['publisher'].apply_messages(messages)
+    
+    def on_save(document):
+        global captured_data, last_capture_time, loaded_generation
+        captured_data = document
+        # Already published live, the watcher must not rebuild it from the file
+        loaded_generation = max(loaded_generation, document.get('generation', 0))
+        last_capture_time = datetime.now().isoformat()
+    
+    print("🚀 Starting persistent capture worker (one long-lived browser session)")
+    capture_worker = PersistentCaptureWorker(on_messages=on_messages, on_session_start=on_session_start,
+                                             on_save=on_save, decoded_payloads=CAPTURE_DECODED_PAYLOADS,
+                                             segment_dir=capture_segment_dir(), url=CAPTURE_PAGES[0])
+    capture_worker.start()
+
+
 def start_background_capture():
     """Start the background capture thread"""
     global capture_thread, AUTO_CAPTURE_ENABLED
     
-    if AUTO_CAPTURE_ENABLED and capture_thread is None:
+    if AUTO_CAPTURE_ENABLED and CAPTURE_MODE == 'persistent' and CAPTURE_BACKEND == 'browser':
+        if capture_worker is None:
+            start_persistent_capture()
+    elif AUTO_CAPTURE_ENABLED and capture_thread is None:
         print(f"🚀 Starting background capture task (interval: {CAPTURE_INTERVAL_MINUTES} minutes)")
         capture_thread = threading.Thread(target=background_capture_loop, daemon=True)
         capture_thread.start()
@@ -135,60 +577,6 @@ def start_background_capture():
         print("⚠ Automatic capture is disabled")
 
 
-def extract_all_data_from_messages():
-    """Extract all data from captured messages including matches, odds, outcomes, etc."""
-    matches = {}
-    odds = {}
-    outcomes = {}
-    bets = {}
-    sports = {}
-    
-    for msg in captured_data.get('messages', []):
-        if msg.get('event') == 'websocket_message':
-            data = msg.get('data', {})
-            if isinstance(data, dict) and 'raw' in data:
-                raw = data['raw']
-                if raw.startswith('42["m"'):
-                    # Parse Socket.IO message
-                    try:
-                        # Extract JSON after "42["m","
-                        json_part = raw.split('42["m",', 1)[1].rstrip(']')
-                        parsed = json.loads(json_part)
-                        
-                        # Extract all data types
-                        if isinstance(parsed, dict):
-                            if 'matches' in parsed:
-                                for match_id, match_data in parsed['matches'].items():
-                                    if isinstance(match_data, dict):
-                                        if match_id not in matches:
-                                            matches[match_id] = match_data.copy()
-                                        else:
-                                            matches[match_id].update(match_data)
-                            
-                            if 'odds' in parsed:
-                                odds.update(parsed['odds'])
-                            
-                            if 'outcomes' in parsed:
-                                for outcome_id, outcome_data in parsed['outcomes'].items():
-                                    if isinstance(outcome_data, dict):
-                                        if outcome_id not in outcomes:
-                                            outcomes[outcome_id] = outcome_data.copy()
-                                        else:
-                                            outcomes[outcome_id].update(outcome_data)
-                            
-                            if 'bets' in parsed:
-                                for bet_id, bet_data in parsed['bets'].items():
-                                    if isinstance(bet_data, dict):
-                                        bets[bet_id] = bet_data.copy()
-                            
-                            if 'sports' in parsed:
-                                sports.update(parsed['sports'])
-                    except Exception as e:
-                        pass
-    
-    return matches, odds, outcomes, bets, sports
-
-
 @app.route('/')
 def index():
     """API documentation"""
@@ -205,15 +593,23 @@ def index():
             'GET /api/matches': 'Get all matches (simplified)',
             'GET /api/matches?sportId=1': 'Filter by sport (1=Football)',
             'GET /api/matches?date=DD-MM-YYYY': 'Filter by date',
+            'GET /api/matches?from=<ts>&to=<ts>': 'Filter by matchStart range (Unix timestamps, inclusive)',
             'GET /api/matches?morethan=2': 'Filter matches where both home & away odds > 2',
             'GET /api/matches?anyonehas=1.4': 'Filter matches where any outcome (home/draw/away) has odds 1.400-1.490',
             'GET /api/matches?sportId=1&date=DD-MM-YYYY&morethan=2&anyonehas=1.4': 'Combine filters',
+            'GET /api/matches?limit=50&cursor=<next_cursor>': 'Paginate results (cursor from previous page)',
+            'GET /api/matches?fields=title,odds': 'Only return the listed fields (matchId is always included)',
             'GET /api/matches/verbose': 'Get all matches (full details)',
             'GET /api/matches/<id>': 'Get specific match',
+            'GET /api/matches?ids=<id>,<id>': 'Get many matches by id (odds, outcomes, sport info, missing ids)',
+            'POST /api/matches/batch': 'Same as ?ids= with a JSON body {"ids": [...]}',
+            'GET /api/matches/<id>/history?resolution=60&since=<ts>': 'Odds movement of the match main bet',
+            'GET /api/stream': 'Server-Sent Events of odds/status changes and added/removed matches (accepts /api/matches filters, Last-Event-ID resume)',
             'GET /api/status': 'Get API status',
             'GET /api/info': 'Get capture information',
             'POST /api/capture/trigger': 'Manually trigger a capture',
-            'GET /api/capture/status': 'Get capture status'
+            'GET /api/capture/status': 'Get capture status',
+            'GET /metrics': 'Prometheus metrics (request latency and size, frames, reloads, captures, data age)'
         }
     })
 
@@ -221,9 +617,17 @@ def index():
 @app.route('/api/status')
 def status():
     """Get API status"""
+    snapshot = request_snapshot()
+    if snapshot_reader is not None:
+        filter_backend = snapshot_reader.backend
+    else:
+        filter_backend = 'numpy' if snapshot.columns is not None else 'index'
     return jsonify({
         'status': 'running',
-        'messages_count': len(captured_data.get('messages', [])),
+        'messages_count': snapshot.message_count if snapshot_reader is not None else captured_message_count(),
+        'filter_backend': filter_backend,
+        'snapshot_version': snapshot.version,
+        'odds_history': odds_history.stats(),
         'server': 'Winamax Data Server'
     })
 
@@ -235,6 +639,7 @@ def info():
         'url': captured_data.get('url'),
         'timestamp': captured_data.get('timestamp'),
         'message_count': captured_data.get('message_count', 0),
+        'generation': captured_data.get('generation'),
         'last_capture_time': last_capture_time
     })
 
@@ -244,10 +649,18 @@ def capture_status():
     """Get capture status"""
     return jsonify({
         'auto_capture_enabled': AUTO_CAPTURE_ENABLED,
+        'capture_backend': CAPTURE_BACKEND,
+        'capture_mode': CAPTURE_MODE,
         'capture_in_progress': capture_in_progress,
         'interval_minutes': CAPTURE_INTERVAL_MINUTES,
         'last_capture_time': last_capture_time,
-        'message_count': len(captured_data.get('messages', []))
+        'message_count': captured_message_count(),
+        'capture_generation': loaded_generation,
+        'file_watcher': capture_watcher.backend if capture_watcher else None,
+        'scheduler': capture_scheduler.status() if ADAPTIVE_SCHEDULING_ENABLED else None,
+        'worker': capture_worker.status() if capture_worker else None,
+        'pool': capture_pool_status,
+        'match_sources': request_snapshot().page_match_counts()
     })
 
 
@@ -256,6 +669,14 @@ def trigger_capture():
     """Manually trigger a capture"""
     global capture_thread
     
+    if capture_worker is not None:
+        # Persistent worker: start a fresh page session instead of a new browser
+        capture_worker.request_reload()
+        return jsonify({
+            'success': True,
+            'message': 'Persistent capture worker will reload the page'
+        })
+    
     if capture_in_progress:
         return jsonify({
             'success': False,
@@ -272,346 +693,487 @@ def trigger_capture():
     })
 
 
-@app.route('/api/matches')
-def get_matches():
-    """Get all matches - simplified version"""
-    matches, odds, outcomes, bets, sports = extract_all_data_from_messages()
-    
+def filter_match_ids(snapshot, args):
+    """Resolve the /api/matches filters against the snapshot indexes.
+
+    Returns listed match ids in (matchStart, matchId) order.
+    """
     # Get filter parameters
-    sport_id = request.args.get('sportId', type=int)
-    date_filter = request.args.get('date')
-    morethan = request.args.get('morethan', type=float)
-    anyonehas = request.args.get('anyonehas', type=float)
+    sport_id = args.get('sportId', type=int)
+    date_filter = args.get('date')
+    start_from = args.get('from', type=float)
+    start_to = args.get('to', type=float)
+    morethan = args.get('morethan', type=float)
+    anyonehas = args.get('anyonehas', type=float)
+    
+    # Columnar backend: all filters as one vectorized boolean mask
+    if snapshot.columns is not None:
+        return snapshot.columns.filter_ids(sport_id=sport_id, date=date_filter,
+                                           start_from=start_from, start_to=start_to,
+                                           morethan=morethan, anyonehas=anyonehas)
+    
+    # Sport/date/time-range filters are index lookups, ids come back sorted by matchStart
+    match_ids = snapshot.query_ids(sport_id=sport_id, date=date_filter,
+                                   start_from=start_from, start_to=start_to)
+    
+    # Filter by morethan: both home and away odds must be > morethan
+    if morethan is not None:
+        allowed = snapshot.ids_with_home_and_away_above(morethan)
+        match_ids = [match_id for match_id in match_ids if match_id in allowed]
+    
+    # Filter by anyonehas: check if ANY of the three main outcomes (home, draw, away)
+    # has odds in range [value, value+0.09]
+    # Example: anyonehas=1.4 matches odds from 1.400 to 1.490 (inclusive)
+    # Example match: home=3.0, draw=2.0, away=1.42 → INCLUDED (away 1.42 is in range 1.400-1.490)
+    if anyonehas is not None:
+        max_odds = round(anyonehas + 0.09, 3)  # Ensure precision (e.g., 1.4 + 0.09 = 1.490)
+        allowed = snapshot.ids_with_any_side_between(anyonehas, max_odds)
+        match_ids = [match_id for match_id in match_ids if match_id in allowed]
+    
+    return match_ids
+
+
+def encode_cursor(snapshot, match_id):
+    """Opaque cursor pointing after match_id, keyed on (matchStart, matchId) so it survives reloads"""
+    match_start = snapshot.matches[match_id].get('matchStart')
+    raw = json.dumps([snapshot.version, match_start, str(match_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into a snapshot sort key, raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        _, match_start, match_id = json.loads(raw)
+        return (float(match_start) if match_start is not None else float('inf'), str(match_id))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def paginate(snapshot, match_ids, args):
+    """Apply limit/cursor pagination, returns (page_ids, next_cursor, paginated).
+
+    Without limit or cursor every id is returned unpaginated; limit must be
+    a positive integer and is clamped to MAX_PAGE_SIZE.
+    """
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+    if limit is None and not cursor:
+        return match_ids, None, False
+    
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        # A malformed limit must not fall back to the unpaginated list
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValueError('limit must be a positive integer')
+    limit = min(limit, MAX_PAGE_SIZE)
     
+    start = snapshot.position_after(match_ids, decode_cursor(cursor)) if cursor else 0
+    page_ids = match_ids[start:start + limit]
+    next_cursor = None
+    if page_ids and start + limit < len(match_ids):
+        next_cursor = encode_cursor(snapshot, page_ids[-1])
+    return page_ids, next_cursor, True
+
+
+def parse_fields(args):
+    """Return the set of fields requested with fields=a,b,c, or None for every field"""
+    fields = args.get('fields')
+    if not fields:
+        return None
+    # matchId is always returned so items stay identifiable
+    return {field.strip() for field in fields.split(',') if field.strip()} | {'matchId'}
+
+
+def list_payload(snapshot, result, total, next_cursor, paginated):
+    """Common envelope for match list responses"""
+    payload = {
+        'success': True,
+        'matches': result,
+        'count': len(result)
+    }
+    if paginated:
+        payload['total'] = total
+        payload['next_cursor'] = next_cursor
+        payload['snapshot_version'] = snapshot.version
+    return payload
+
+
+def outcome_item(outcome_info, odds, outcome_id):
+    """{'odds', 'outcomeId', **outcome_info} without spreading the record key by key"""
+    item = as_dict(outcome_info)
+    item.setdefault('odds', odds)
+    item.setdefault('outcomeId', outcome_id)
+    return item
+
+
+def parse_match_ids(values):
+    """Normalize requested match ids (strings or numbers) to unique strings in request order"""
+    if not isinstance(values, list):
+        raise ValueError('ids must be a list of match ids')
+    match_ids = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (str, int)):
+            raise ValueError(f'Invalid match id: {value!r}')
+        match_id = str(value).strip()
+        if match_id and match_id not in match_ids:
+            match_ids.append(match_id)
+    if not match_ids:
+        raise ValueError('No match ids given')
+    if len(match_ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} match ids per request')
+    return match_ids
+
+
+def build_match_detail(snapshot, match_id):
+    """Match record with the odds of its main bet outcomes, None if the match is unknown"""
+    match_data = snapshot.matches.get(match_id)
+    if match_data is None:
+        return None
+    match_data = as_dict(match_data)
+    match_data['matchId'] = match_id
+    
+    # Try to find associated odds
+    if 'mainBetId' in match_data:
+        bet = snapshot.bets.get(str(match_data['mainBetId']))
+        if bet:
+            match_odds = {}
+            for outcome_id in bet.get('outcomes', []):
+                outcome_id_str = str(outcome_id)
+                if outcome_id_str in snapshot.odds:
+                    outcome_info = snapshot.outcomes.get(outcome_id_str, {})
+                    label = outcome_info.get('label', f'Outcome {outcome_id}')
+                    match_odds[label] = outcome_item(outcome_info, snapshot.odds[outcome_id_str], outcome_id)
+            
+            if match_odds:
+                match_data['odds'] = match_odds
+    return match_data
+
+
+def build_batch_payload(snapshot, match_ids):
+    """Resolve many match ids in one pass over the id-keyed snapshot, in request order"""
     result = []
-    for match_id, match_data in matches.items():
-        # Filter by sport if specified
-        if sport_id is not None:
-            if match_data.get('sportId') != sport_id:
-                continue
-        
-        # Skip if no competitor names (tournament/outright bets)
-        if not match_data.get('competitor1Name') or not match_data.get('competitor2Name'):
+    missing = []
+    for match_id in match_ids:
+        match_item = build_match_detail(snapshot, match_id)
+        if match_item is None:
+            missing.append(match_id)
             continue
-        
-        # Filter by date if specified
-        if date_filter:
-            match_start = match_data.get('matchStart')
-            if match_start:
-                match_date = datetime.fromtimestamp(match_start, tz=timezone.utc).strftime('%d-%m-%Y')
-                if match_date != date_filter:
-                    continue
+        sport_info = snapshot.sports.get(str(match_item.get('sportId')))
+        if sport_info is not None:
+            match_item['sportInfo'] = sport_info
+        result.append(match_item)
+    return {
+        'success': True,
+        'matches': result,
+        'count': len(result),
+        'missing': missing,
+        'snapshot_version': snapshot.version
+    }
+
+
+SIMPLE_MATCH_FIELDS = ('title', 'status', 'competitor1Name', 'competitor2Name', 'matchStart')
+
+
+def build_matches_payload(snapshot, args):
+    """Build the /api/matches response payload"""
+    match_ids = filter_match_ids(snapshot, args)
+    # Paginate and project before building any per-match dict
+    page_ids, next_cursor, paginated = paginate(snapshot, match_ids, args)
+    fields = parse_fields(args)
+    item_fields = [field for field in SIMPLE_MATCH_FIELDS if fields is None or field in fields]
+    include_odds = fields is None or 'odds' in fields
+    
+    result = []
+    for match_id in page_ids:
+        match_data = snapshot.matches[match_id]
         
         # Simplified match item with only essential fields
-        match_item = {
-            'matchId': match_id,
-            'title': match_data.get('title'),
-            'status': match_data.get('status'),
-            'competitor1Name': match_data.get('competitor1Name'),
-            'competitor2Name': match_data.get('competitor2Name'),
-            'matchStart': match_data.get('matchStart')
-        }
+        match_item = {'matchId': match_id}
+        for field in item_fields:
+            match_item[field] = match_data.get(field)
         
-        # Try to find associated odds for this match
+        # Simplified odds for each main bet outcome, prebuilt in the snapshot
+        if include_odds:
+            match_odds = {label: value for _, label, value in snapshot.main_odds[match_id]}
+            if match_odds:
+                match_item['odds'] = match_odds
+        
+        result.append(match_item)
+    
+    # No sort needed: the index already yields matches by matchStart (earliest first),
+    # then matchId, with matches without matchStart at the end
+    
+    return list_payload(snapshot, result, len(match_ids), next_cursor, paginated)
+
+
+def build_matches_verbose_payload(snapshot, args):
+    """Build the /api/matches/verbose response payload"""
+    matches, odds, outcomes, bets, sports = snapshot.as_tuple()
+    match_ids = filter_match_ids(snapshot, args)
+    # Paginate and project before building any per-match dict
+    page_ids, next_cursor, paginated = paginate(snapshot, match_ids, args)
+    fields = parse_fields(args)
+    include_odds = fields is None or 'odds' in fields
+    include_sport_info = fields is None or 'sportInfo' in fields
+    # Page of a multi-page capture each match came from
+    match_pages = snapshot.match_pages if fields is None or 'sourcePage' in fields else {}
+    
+    result = []
+    for match_id in page_ids:
+        match_data = matches[match_id]
+        
+        if fields is None:
+            # Fields of the record win over matchId, like {'matchId': ..., **match_data}
+            match_item = as_dict(match_data)
+            match_item.setdefault('matchId', match_id)
+        else:
+            match_item = {'matchId': match_id}
+            for field in fields:
+                if field in match_data:
+                    match_item[field] = match_data[field]
+        
+        # Get odds for each main bet outcome
         match_odds = {}
-        if 'mainBetId' in match_data:
-            bet_id = str(match_data['mainBetId'])
-            if bet_id in bets:
-                bet = bets[bet_id]
-                bet_outcomes = bet.get('outcomes', [])
-                
-                # Get simplified odds for each outcome
-                for outcome_id in bet_outcomes:
-                    outcome_id_str = str(outcome_id)
-                    if outcome_id_str in odds:
-                        outcome_info = outcomes.get(outcome_id_str, {})
-                        label = outcome_info.get('label', f'Outcome {outcome_id}')
-                        
-                        match_odds[label] = odds[outcome_id_str]
-                
-                if match_odds:
-                    match_item['odds'] = match_odds
+        for outcome_id, label, value in (snapshot.main_odds[match_id] if include_odds else ()):
+            # Get outcome info if available
+            outcome_info = outcomes.get(str(outcome_id), {})
+            match_odds[label] = outcome_item(outcome_info, value, outcome_id)
+        if match_odds:
+            match_item['odds'] = match_odds
         
-        # Filter by morethan: both home and away odds must be > morethan
-        if morethan is not None:
-            competitor1_name = match_data.get('competitor1Name')
-            competitor2_name = match_data.get('competitor2Name')
-            
-            # Find odds for home and away teams
-            home_odds = None
-            away_odds = None
-            
-            for label, odds_value in match_odds.items():
-                if competitor1_name in label or label == competitor1_name:
-                    home_odds = odds_value
-                elif competitor2_name in label or label == competitor2_name:
-                    away_odds = odds_value
-            
-            # Both odds must exist and be > morethan
-            if home_odds is None or away_odds is None:
-                continue
-            if home_odds <= morethan or away_odds <= morethan:
-                continue
+        # Add sport info if available
+        if include_sport_info and 'sportId' in match_data:
+            # sports is keyed by the string id, sportId is an int
+            sport_info = sports.get(str(match_data['sportId']))
+            if sport_info is not None:
+                match_item['sportInfo'] = sport_info
         
-        # Filter by anyonehas: check if ANY of the three main outcomes (home, draw, away) 
-        # has odds in range [value, value+0.09]
-        # Example: anyonehas=1.4 matches odds from 1.400 to 1.490 (inclusive)
-        # Example match: home=3.0, draw=2.0, away=1.42 → INCLUDED (away 1.42 is in range 1.400-1.490)
-        if anyonehas is not None:
-            # Calculate the range: [value, value+0.09]
-            # For anyonehas=1.4: range is [1.400, 1.490] inclusive
-            min_odds = anyonehas
-            max_odds = round(anyonehas + 0.09, 3)  # Ensure precision (e.g., 1.4 + 0.09 = 1.490)
-            
-            # Must have odds to check this filter
-            if not match_odds:
-                continue
-            
-            # Check if any of the three main outcomes (home, draw, away) has odds in range
-            found_match = False
-            competitor1_name = match_data.get('competitor1Name')
-            competitor2_name = match_data.get('competitor2Name')
-            
-            for label, odds_value in match_odds.items():
-                # Identify if this is home, draw, or away
-                is_main_outcome = False
-                
-                # Home: matches competitor1Name
-                if competitor1_name and (competitor1_name in label or label == competitor1_name):
-                    is_main_outcome = True
-                # Away: matches competitor2Name
-                elif competitor2_name and (competitor2_name in label or label == competitor2_name):
-                    is_main_outcome = True
-                # Draw: contains "nul" or "Match nul" (French for draw)
-                elif 'nul' in label.lower() or 'draw' in label.lower():
-                    is_main_outcome = True
-                
-                # If it's a main outcome AND odds are in range, match found
-                # Example: away odds = 1.42, range = [1.400, 1.490] → 1.400 <= 1.42 <= 1.490 → True
-                if is_main_outcome and min_odds <= odds_value <= max_odds:
-                    found_match = True
-                    break
-            
-            # If no main outcome found in range, exclude this match
-            if not found_match:
-                continue
+        source_page = match_pages.get(match_id)
+        if source_page is not None:
+            match_item['sourcePage'] = source_page
         
         result.append(match_item)
     
-    # Sort matches by matchStart timestamp (ascending - earliest first)
-    # Matches without matchStart go to the end
-    # Secondary sort by matchId for matches with same timestamp
-    result.sort(key=lambda x: (
-        float(x.get('matchStart')) if x.get('matchStart') is not None else float('inf'),
-        str(x.get('matchId', ''))
-    ))
+    # No sort needed: the index already yields matches by matchStart (earliest first),
+    # then matchId, with matches without matchStart at the end
     
-    return jsonify({
-        'success': True,
-        'matches': result,
-        'count': len(result)
-    })
+    payload = list_payload(snapshot, result, len(match_ids), next_cursor, paginated)
+    payload['total_odds'] = len(odds)
+    payload['total_outcomes'] = len(outcomes)
+    return payload
+
+
+@app.route('/api/matches')
+@cached_response
+def get_matches():
+    """Get all matches - simplified version"""
+    try:
+        if 'ids' in request.args:
+            # Batch lookup: ids=1,2,3 (filters do not apply)
+            match_ids = parse_match_ids(request.args['ids'].split(','))
+            return jsonify(build_batch_payload(request_snapshot(), match_ids))
+        return jsonify(build_matches_payload(request_snapshot(), request.args))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
 
 @app.route('/api/matches/verbose')
+@cached_response
 def get_matches_verbose():
     """Get all matches with full details"""
-    matches, odds, outcomes, bets, sports = extract_all_data_from_messages()
-    
-    # Get filter parameters
-    sport_id = request.args.get('sportId', type=int)
-    morethan = request.args.get('morethan', type=float)
-    anyonehas = request.args.get('anyonehas', type=float)
+    try:
+        return jsonify(build_matches_verbose_payload(request_snapshot(), request.args))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+
+
+# Unfiltered lists are serialized and compressed once per snapshot
+prerendered_views['/api/matches'] = build_matches_payload
+prerendered_views['/api/matches/verbose'] = build_matches_verbose_payload
+prerender_snapshot(current_snapshot)
+
+
+@app.route('/api/stream')
+def stream_changes():
+    """Server-Sent Events stream of odds, status and added/removed match changes"""
+    if snapshot_reader is not None:
+        # Changes are broadcast by the process that publishes snapshots, workers would only send keep-alives
+        return jsonify({
+            'success': False,
+            'message': 'The change stream is only served by the capture process'
+        }), 503
+    # Same filters as /api/matches, copied out of the request context for the generator
+    args = request.args.copy()
+    filtered = any(name in args for name in ('sportId', 'date', 'from', 'to', 'morethan', 'anyonehas'))
+    resume_from = request.headers.get('Last-Event-ID') or args.get('lastEventId')
     
-    result = []
-    for match_id, match_data in matches.items():
-        # Filter by sport if specified
-        if sport_id is not None:
-            if match_data.get('sportId') != sport_id:
-                continue
-        
-        # Skip if no competitor names (tournament/outright bets)
-        if not match_data.get('competitor1Name') or not match_data.get('competitor2Name'):
-            continue
+    def generate():
+        last_id = change_broadcaster.last_id
+        yield 'retry: 3000\n\n'
         
-        match_item = {
-            'matchId': match_id,
-            **match_data
-        }
-        
-        # Try to find associated odds for this match
-        match_odds = {}
-        if 'mainBetId' in match_data:
-            bet_id = str(match_data['mainBetId'])
-            if bet_id in bets:
-                bet = bets[bet_id]
-                bet_outcomes = bet.get('outcomes', [])
-                
-                # Get odds for each outcome
-                for outcome_id in bet_outcomes:
-                    outcome_id_str = str(outcome_id)
-                    if outcome_id_str in odds:
-                        # Get outcome info if available
-                        outcome_info = outcomes.get(outcome_id_str, {})
-                        label = outcome_info.get('label', f'Outcome {outcome_id}')
-                        
-                        match_odds[label] = {
-                            'odds': odds[outcome_id_str],
-                            'outcomeId': outcome_id,
-                            **outcome_info
-                        }
-                
-                if match_odds:
-                    match_item['odds'] = match_odds
-        
-        # Filter by morethan: both home and away odds must be > morethan
-        if morethan is not None:
-            competitor1_name = match_data.get('competitor1Name')
-            competitor2_name = match_data.get('competitor2Name')
-            
-            # Find odds for home and away teams
-            home_odds = None
-            away_odds = None
-            
-            for label, odds_data in match_odds.items():
-                # Handle both dict format (verbose) and numeric format
-                if isinstance(odds_data, dict):
-                    odds_value = odds_data.get('odds')
-                else:
-                    odds_value = odds_data
-                
-                if competitor1_name in label or label == competitor1_name:
-                    home_odds = odds_value
-                elif competitor2_name in label or label == competitor2_name:
-                    away_odds = odds_value
-            
-            # Both odds must exist and be > morethan
-            if home_odds is None or away_odds is None:
-                continue
-            if home_odds <= morethan or away_odds <= morethan:
-                continue
+        if resume_from is not None:
+            try:
+                resume_id = int(resume_from)
+            except ValueError:
+                resume_id = -1
+            if 0 <= resume_id <= change_broadcaster.last_id:
+                last_id = resume_id
+            else:
+                yield f"event: reset\ndata: {json.dumps({'reason': 'unknown event id'})}\n\n"
         
-        # Filter by anyonehas: check if ANY of the three main outcomes (home, draw, away) 
-        # has odds in range [value, value+0.09]
-        # Example: anyonehas=1.4 matches odds from 1.400 to 1.490 (inclusive)
-        # Example match: home=3.0, draw=2.0, away=1.42 → INCLUDED (away 1.42 is in range 1.400-1.490)
-        if anyonehas is not None:
-            # Calculate the range: [value, value+0.09]
-            # For anyonehas=1.4: range is [1.400, 1.490] inclusive
-            min_odds = anyonehas
-            max_odds = round(anyonehas + 0.09, 3)  # Ensure precision (e.g., 1.4 + 0.09 = 1.490)
-            
-            # Must have odds to check this filter
-            if not match_odds:
+        while True:
+            batches, missed = change_broadcaster.wait_for_batches(last_id, STREAM_KEEPALIVE_SECONDS)
+            if missed:
+                # Resume point fell out of the buffer: client should refetch /api/matches
+                yield f"event: reset\ndata: {json.dumps({'reason': 'events expired'})}\n\n"
+            if not batches:
+                yield ': keep-alive\n\n'
                 continue
             
-            # Check if any of the three main outcomes (home, draw, away) has odds in range
-            found_match = False
-            competitor1_name = match_data.get('competitor1Name')
-            competitor2_name = match_data.get('competitor2Name')
-            
-            for label, odds_data in match_odds.items():
-                # Handle both dict format (verbose) and numeric format
-                if isinstance(odds_data, dict):
-                    odds_value = odds_data.get('odds')
-                else:
-                    odds_value = odds_data
-                
-                # Identify if this is home, draw, or away
-                is_main_outcome = False
-                
-                # Home: matches competitor1Name
-                if competitor1_name and (competitor1_name in label or label == competitor1_name):
-                    is_main_outcome = True
-                # Away: matches competitor2Name
-                elif competitor2_name and (competitor2_name in label or label == competitor2_name):
-                    is_main_outcome = True
-                # Draw: contains "nul" or "Match nul" (French for draw)
-                elif 'nul' in label.lower() or 'draw' in label.lower():
-                    is_main_outcome = True
-                
-                # If it's a main outcome AND odds are in range, match found
-                # Example: away odds = 1.42, range = [1.400, 1.490] → 1.400 <= 1.42 <= 1.490 → True
-                if is_main_outcome and min_odds <= odds_value <= max_odds:
-                    found_match = True
-                    break
-            
-            # If no main outcome found in range, exclude this match
-            if not found_match:
-                continue
-        
-        # Add sport info if available
-        if 'sportId' in match_data:
-            sport_id_match = match_data['sportId']
-            if sport_id_match in sports:
-                match_item['sportInfo'] = sports[sport_id_match]
-        
-        result.append(match_item)
+            for batch in batches:
+                allowed = None
+                if filtered:
+                    # A change is relevant if the match passes the filters before or after it
+                    allowed = set(filter_match_ids(batch.old, args)) | set(filter_match_ids(batch.new, args))
+                for event in batch.events:
+                    if event.id <= last_id:
+                        continue
+                    if allowed is None or event.match_id in allowed:
+                        yield event.to_sse(batch.new.version)
+                last_id = batch.last_id
     
-    # Sort matches by matchStart timestamp (ascending - earliest first)
-    # Matches without matchStart go to the end
-    # Secondary sort by matchId for matches with same timestamp
-    result.sort(key=lambda x: (
-        float(x.get('matchStart')) if x.get('matchStart') is not None else float('inf'),
-        str(x.get('matchId', ''))
-    ))
-    
-    return jsonify({
-        'success': True,
-        'matches': result,
-        'count': len(result),
-        'total_odds': len(odds),
-        'total_outcomes': len(outcomes)
-    })
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @app.route('/api/matches/<match_id>')
+@cached_response
 def get_match(match_id):
     """Get specific match by ID with odds"""
-    matches, odds, outcomes, bets, sports = extract_all_data_from_messages()
+    match_data = build_match_detail(request_snapshot(), match_id)
+    if match_data is None:
+        return jsonify({
+            'success': False,
+            'message': 'Match not found'
+        }), 404
     
-    if match_id in matches:
-        match_data = matches[match_id].copy()
-        match_data['matchId'] = match_id
-        
-        # Try to find associated odds
-        if 'mainBetId' in match_data:
-            bet_id = str(match_data['mainBetId'])
-            if bet_id in bets:
-                bet = bets[bet_id]
-                bet_outcomes = bet.get('outcomes', [])
-                
-                match_odds = {}
-                for outcome_id in bet_outcomes:
-                    outcome_id_str = str(outcome_id)
-                    if outcome_id_str in odds:
-                        outcome_info = outcomes.get(outcome_id_str, {})
-                        label = outcome_info.get('label', f'Outcome {outcome_id}')
-                        match_odds[label] = {
-                            'odds': odds[outcome_id_str],
-                            'outcomeId': outcome_id,
-                            **outcome_info
-                        }
-                
-                if match_odds:
-                    match_data['odds'] = match_odds
-        
+    return jsonify({
+        'success': True,
+        'match': match_data
+    })
+
+
+@app.route('/api/matches/batch', methods=['POST'])
+def get_matches_batch():
+    """Get many matches by ID with odds, outcomes and sport info"""
+    body = request.get_json(silent=True)
+    try:
+        if not isinstance(body, dict):
+            raise ValueError('Expected a JSON body like {"ids": ["63369817", ...]}')
+        match_ids = parse_match_ids(body.get('ids'))
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'match': match_data
-        })
-    else:
+            'success': False,
+            'message': str(e)
+        }), 400
+    return jsonify(build_batch_payload(request_snapshot(), match_ids))
+
+
+@app.route('/api/matches/<match_id>/history')
+def get_match_history(match_id):
+    """Get odds movement of a match's main bet"""
+    if snapshot_reader is not None:
+        # History is recorded from frames, only the capture process applies them
+        return jsonify({
+            'success': False,
+            'message': 'Odds history is only served by the capture process'
+        }), 503
+    snapshot = request_snapshot()
+    match_data = snapshot.matches.get(match_id)
+    if match_data is None:
         return jsonify({
             'success': False,
             'message': 'Match not found'
         }), 404
+    
+    since = request.args.get('since', type=float)
+    resolution = request.args.get('resolution', type=float)
+    if resolution is not None and resolution <= 0:
+        return jsonify({'success': False, 'message': 'resolution must be a positive number of seconds'}), 400
+    
+    market = snapshot.market(match_id)
+    outcome_history = []
+    for outcome in (market.outcomes if market is not None else ()):
+        outcome_history.append({
+            'outcomeId': outcome.outcome_id,
+            'label': outcome.label,
+            'side': outcome.side,
+            'odds': outcome.odds,
+            'history': odds_history.history(outcome.outcome_id, since=since, resolution=resolution)
+        })
+    
+    return jsonify({
+        'success': True,
+        'matchId': match_id,
+        'title': match_data.get('title'),
+        'betId': match_data.get('mainBetId'),
+        'since': since,
+        'resolution': resolution,
+        'outcomes': outcome_history
+    })
 
 
 @app.route('/api/data/raw')
 def get_raw_data():
     """Get raw captured data"""
+    if CAPTURE_FORMAT == 'segments':
+        try:
+            return jsonify(SegmentedCaptureReader(CAPTURE_SEGMENT_DIR).document())
+        except FileNotFoundError:
+            pass
     return jsonify(captured_data)
 
 
+def data_age_seconds():
+    """Seconds since the newest frame timestamp applied by this process, None before the first frame"""
+    sources = [frame_metrics for frame_metrics in (live_frame_metrics, reload_frame_metrics) if frame_metrics is not None]
+    return age_seconds(*(frame_metrics.last_frame_epoch() for frame_metrics in sources))
+
+
+metrics_registry.gauge('winamax_data_age_seconds', 'Seconds since the last captured frame',
+                       function=data_age_seconds)
+metrics_registry.gauge('winamax_snapshot_version', 'Version of the served snapshot',
+                       function=lambda: request_snapshot().version)
+metrics_registry.gauge('winamax_snapshot_matches', 'Matches in the served snapshot',
+                       function=lambda: len(request_snapshot().matches))
+metrics_registry.gauge('winamax_capture_in_progress', '1 while a capture cycle runs',
+                       function=lambda: int(capture_in_progress))
+metrics_registry.counter('winamax_driver_restarts_total', 'Browser driver restarts of the persistent capture worker',
+                         function=lambda: capture_worker.driver_restarts if capture_worker is not None else 0)
+metrics_registry.counter('winamax_response_cache_requests_total', 'Response cache lookups by result', ('result',),
+                         function=lambda: {('hit',): response_cache.hits, ('miss',): response_cache.misses})
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of this process' metrics"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
 if __name__ == '__main__':
     print("Starting Winamax Data API...")
     print("="*80)
@@ -621,8 +1183,11 @@ if __name__ == '__main__':
     print("  http://localhost:5000/api/info - Capture info")
     print("  http://localhost:5000/api/capture/status - Capture status")
     print("  POST http://localhost:5000/api/capture/trigger - Trigger capture")
+    print("  http://localhost:5000/metrics - Prometheus metrics")
     print("="*80)
     
+    start_capture_watcher()
+    
     # Start background capture if enabled
     if AUTO_CAPTURE_ENABLED:
         start_background_capture()
@@ -0,0 +1,263 @@
+"""
+Winamax Shared Snapshot
+Author: Anass EL
+Description: Materialized snapshot serialized into a memory-mapped file shared read-only by API worker processes
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+
+from capture_store import atomic_write
+from compact_records import json_default
+from match_store import MatchSnapshot
+
+MAGIC = b'WMXSNAP1'
+HEADER = struct.Struct('<8sIIQQ')  # magic, layout, section count, generation, snapshot version
+SECTION = struct.Struct('<16sQQ')  # name, offset, entry count (records) or byte length (blobs)
+ENTRY = struct.Struct('<QQQQ')  # key offset, key length, value offset, value length
+RECORD_SECTIONS = ('matches', 'bets', 'outcomes', 'odds', 'sports', 'tournaments')
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+
+def _index_document(snapshot):
+    """Listed-match indexes of a snapshot, so workers do not rebuild them from the records"""
+    return {
+        'ordered_ids': snapshot.ordered_ids,
+        'ordered_starts': snapshot.ordered_starts,
+        'by_sport': [[sport_id, ids, starts] for sport_id, (ids, starts) in snapshot.by_sport.items()],
+        'by_day': snapshot.by_day,
+        'undated_ids': snapshot.undated_ids,
+        'main_odds': snapshot.main_odds,
+        'main_sides': snapshot.main_sides,
+        'side_prices': snapshot.side_prices,
+        'side_ids': snapshot.side_ids
+    }
+
+
+def read_header(path):
+    """(generation, version) of a snapshot file, raises ValueError if it is not one"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file")
+    _, _, _, generation, version = HEADER.unpack(header)
+    return generation, version
+
+
+def write_snapshot_file(snapshot, path, generation):
+    """Atomically replace path with a serialized snapshot, returns the file size.
+
+    Layout: header, section directory, one sorted (key, value) offset table
+    per record section, then the JSON-encoded keys and values. Readers
+    binary-search the tables in the mapping and only decode the records
+    they look up.
+    """
+    sections = []
+    for name in RECORD_SECTIONS:
+        records = sorted((str(key).encode('utf-8'), _encode(value))
+                         for key, value in getattr(snapshot, name).items())
+        sections.append((name, records))
+    meta = {
+        'url': snapshot.url,
+        'timestamp': snapshot.timestamp,
+        'message_count': snapshot.message_count,
+        'counters': snapshot.counters,
+        'match_pages': snapshot.match_pages
+    }
+    sections.append(('meta', _encode(meta)))
+    sections.append(('index', _encode(_index_document(snapshot))))
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory, tables = [], []
+    data_offset = offset + sum(ENTRY.size * len(content) for name, content in sections if name in RECORD_SECTIONS)
+    data = []
+    for name, content in sections:
+        if name in RECORD_SECTIONS:
+            directory.append(SECTION.pack(name.encode('ascii'), offset, len(content)))
+            offset += ENTRY.size * len(content)
+            for key, value in content:
+                tables.append(ENTRY.pack(data_offset, len(key), data_offset + len(key), len(value)))
+                data.append(key)
+                data.append(value)
+                data_offset += len(key) + len(value)
+        else:
+            directory.append(SECTION.pack(name.encode('ascii'), data_offset, len(content)))
+            data.append(content)
+            data_offset += len(content)
+
+    header = HEADER.pack(MAGIC, 1, len(sections), generation, snapshot.version)
+    atomic_write(path, lambda f: f.writelines([header, *directory, *tables, *data]), binary=True)
+    return data_offset
+
+
+class MappedRecords:
+    """Read-only mapping over one record section, looked up by binary search in the mapping"""
+
+    def __init__(self, buffer, offset, count):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+
+    def _entry(self, position):
+        return ENTRY.unpack_from(self.buffer, self.offset + position * ENTRY.size)
+
+    def _key(self, position):
+        key_offset, key_length, _, _ = self._entry(position)
+        return self.buffer[key_offset:key_offset + key_length]
+
+    def _value(self, position):
+        _, _, value_offset, value_length = self._entry(position)
+        return json.loads(self.buffer[value_offset:value_offset + value_length])
+
+    def get(self, key, default=None):
+        # Keys are strings like in the in-memory snapshot, an int key is never found
+        if not isinstance(key, str):
+            return default
+        target = key.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == target:
+            return self._value(lo)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self.count
+
+    def keys(self):
+        return (self._key(position).decode('utf-8') for position in range(self.count))
+
+    def values(self):
+        return (self._value(position) for position in range(self.count))
+
+    def items(self):
+        return ((self._key(position).decode('utf-8'), self._value(position)) for position in range(self.count))
+
+    def __iter__(self):
+        return self.keys()
+
+
+_MISSING = object()
+
+
+class MappedSnapshot(MatchSnapshot):
+    """MatchSnapshot interface over a memory-mapped snapshot file.
+
+    Records stay in the (shared, read-only) page cache and are decoded on
+    lookup; only the small listed-match index is parsed when the file is
+    opened. SharedSnapshotReader.snapshot() counts every request holding the
+    snapshot until its release(); once a newer generation is mapped, the
+    mapping is closed as soon as no request holds it anymore.
+    """
+
+    def __init__(self, path):
+        self.holders = 0
+        self.retired = False
+        self._hold_lock = threading.Lock()
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, section_count, self.generation, self.version = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        sections = {}
+        for position in range(section_count):
+            name, offset, count = SECTION.unpack_from(self.buffer, HEADER.size + position * SECTION.size)
+            sections[name.rstrip(b'\0').decode('ascii')] = (offset, count)
+        for name in RECORD_SECTIONS:
+            setattr(self, name, MappedRecords(self.buffer, *sections[name]))
+
+        meta = self._blob(sections['meta'])
+        self.url = meta['url']
+        self.timestamp = meta['timestamp']
+        self.message_count = meta['message_count']
+        self.counters = meta['counters']
+        self.match_pages = meta.get('match_pages', {})
+        self.bet_pages = {}
+
+        index = self._blob(sections['index'])
+        self.ordered_ids = index['ordered_ids']
+        self.ordered_starts = index['ordered_starts']
+        self.by_sport = {sport_id: (ids, starts) for sport_id, ids, starts in index['by_sport']}
+        self.by_day = {day: tuple(bucket) for day, bucket in index['by_day'].items()}
+        self.undated_ids = index['undated_ids']
+        self.main_odds = index['main_odds']
+        self.main_sides = index['main_sides']
+        self.side_prices = index['side_prices']
+        self.side_ids = index['side_ids']
+        self.markets = {}  # Main markets are resolved from the records on demand
+        self.columns = None
+        self.rendered = {}
+
+    def acquire(self):
+        with self._hold_lock:
+            self.holders += 1
+        return self
+
+    def release(self):
+        """End one hold, closing a superseded mapping after its last one"""
+        with self._hold_lock:
+            self.holders -= 1
+            self._close_if_unused()
+
+    def retire(self):
+        """Mark the snapshot as superseded, closed now if no request holds it"""
+        with self._hold_lock:
+            self.retired = True
+            self._close_if_unused()
+
+    def _close_if_unused(self):
+        if self.retired and self.holders <= 0 and not self.buffer.closed:
+            self.buffer.close()
+
+    def _blob(self, section):
+        offset, length = section
+        return json.loads(self.buffer[offset:offset + length])
+
+
+class SharedSnapshotReader:
+    """Hands out the MappedSnapshot of the current file generation.
+
+    The writer renames a new file into place, so a changed inode means a
+    new file; it is mapped once and used while its generation is current.
+    Snapshots already handed out keep their (old) mapping until released:
+    every snapshot() call must be paired with a release() of the snapshot.
+    """
+
+    backend = 'mmap'
+
+    def __init__(self, path):
+        self.path = path
+        self._identity = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        stat = os.stat(self.path)
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if identity != self._identity:
+                generation, _ = read_header(self.path)
+                if self._snapshot is None or generation != self._snapshot.generation:
+                    previous, self._snapshot = self._snapshot, MappedSnapshot(self.path)
+                    if previous is not None:
+                        previous.retire()
+                self._identity = identity
+            return self._snapshot.acquire()
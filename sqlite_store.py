@@ -0,0 +1,354 @@
+"""
+Winamax SQLite Store
+Author: Anass EL
+Description: Optional SQLite (WAL) copy of the published snapshot, shared by read-only API worker processes
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from compact_records import json_default
+from match_store import MatchSnapshot
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    listed INTEGER NOT NULL,
+    sport_id INTEGER,
+    tournament_id INTEGER,
+    match_start REAL,
+    sort_start REAL NOT NULL,
+    day TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_order ON matches (listed, sort_start, match_id);
+CREATE INDEX IF NOT EXISTS matches_sport ON matches (listed, sport_id, sort_start, match_id);
+CREATE INDEX IF NOT EXISTS matches_day ON matches (listed, day, sort_start, match_id);
+CREATE INDEX IF NOT EXISTS matches_tournament ON matches (tournament_id);
+
+CREATE TABLE IF NOT EXISTS main_odds (
+    match_id TEXT PRIMARY KEY,
+    home REAL,
+    draw REAL,
+    away REAL,
+    odds TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS main_odds_home ON main_odds (home);
+CREATE INDEX IF NOT EXISTS main_odds_draw ON main_odds (draw);
+CREATE INDEX IF NOT EXISTS main_odds_away ON main_odds (away);
+
+CREATE TABLE IF NOT EXISTS bets (bet_id TEXT PRIMARY KEY, match_id TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS bets_match ON bets (match_id);
+
+CREATE TABLE IF NOT EXISTS outcomes (outcome_id TEXT PRIMARY KEY, bet_id TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS outcomes_bet ON outcomes (bet_id);
+
+CREATE TABLE IF NOT EXISTS odds (outcome_id TEXT PRIMARY KEY, price NOT NULL);
+CREATE TABLE IF NOT EXISTS sports (sport_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tournaments (tournament_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# table -> (key column, value column, value is JSON)
+TABLES = {
+    'matches': ('match_id', 'data', True),
+    'main_odds': ('match_id', 'odds', True),
+    'bets': ('bet_id', 'data', True),
+    'outcomes': ('outcome_id', 'data', True),
+    'odds': ('outcome_id', 'price', False),
+    'sports': ('sport_id', 'data', True),
+    'tournaments': ('tournament_id', 'data', True)
+}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=json_default)
+
+
+def _match_row(snapshot, match_id, match_data, listed):
+    match_start = match_data.get('matchStart')
+    day = None
+    if match_start:
+        day = datetime.fromtimestamp(match_start, tz=timezone.utc).strftime('%d-%m-%Y')
+    return (match_id, int(listed), match_data.get('sportId'), match_data.get('tournamentId'),
+            match_start, snapshot.sort_key(match_id, match_data)[0], day,
+            match_data.get('status'), _dumps(match_data))
+
+
+class SQLiteMatchStore:
+    """Writes published snapshots to a SQLite database in WAL mode.
+
+    Only records that changed since the previously written snapshot are
+    upserted (records are replaced, never mutated, so identity tells what
+    changed) and removed ones are deleted, all in one transaction per
+    snapshot. Readers see either the previous or the new version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.last = None
+        self._lock = threading.Lock()
+
+    def stored_version(self):
+        """Version of the snapshot last written to the database, 0 for a new one"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return json.loads(row[0]) if row else 0
+
+    @staticmethod
+    def _changes(old, new, row):
+        """(rows to upsert, keys to delete) between two {id: record} dicts"""
+        upserts = []
+        for key, value in new.items():
+            previous = old.get(key, _MISSING)
+            # Records are replaced on change, only rebuilt values (main odds) need comparing
+            if previous is not value and previous != value:
+                upserts.append(row(key, value))
+        deletes = [(key,) for key in old if key not in new]
+        return upserts, deletes
+
+    def write_snapshot(self, snapshot):
+        """Write the changes of a published snapshot, returns the number of changed rows"""
+        with self._lock:
+            previous = self.last or MatchSnapshot()
+            listed = set(snapshot.ordered_ids)
+            changed = 0
+            with self.conn:
+                if self.last is None:
+                    # First write of this process: replace whatever an earlier run left
+                    for table in TABLES:
+                        self.conn.execute(f'DELETE FROM {table}')
+
+                changed += self._apply('matches', *self._changes(
+                    previous.matches, snapshot.matches,
+                    lambda key, value: _match_row(snapshot, key, value, key in listed)),
+                    '(match_id, listed, sport_id, tournament_id, match_start, sort_start, '
+                    'day, status, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)')
+
+                def main_odds_row(key, value):
+                    sides = snapshot.main_sides.get(key, {})
+                    return (key, sides.get('home'), sides.get('draw'), sides.get('away'), _dumps(value))
+                changed += self._apply('main_odds', *self._changes(previous.main_odds, snapshot.main_odds,
+                                                                   main_odds_row),
+                                       '(match_id, home, draw, away, odds) VALUES (?, ?, ?, ?, ?)')
+
+                changed += self._apply('bets', *self._changes(
+                    previous.bets, snapshot.bets,
+                    lambda key, value: (key, str(value.get('matchId')) if value.get('matchId') is not None else None,
+                                        _dumps(value))),
+                    '(bet_id, match_id, data) VALUES (?, ?, ?)')
+                changed += self._apply('outcomes', *self._changes(
+                    previous.outcomes, snapshot.outcomes,
+                    lambda key, value: (key, str(value.get('betId')) if value.get('betId') is not None else None,
+                                        _dumps(value))),
+                    '(outcome_id, bet_id, data) VALUES (?, ?, ?)')
+                changed += self._apply('odds', *self._changes(
+                    previous.odds, snapshot.odds, lambda key, value: (key, value)),
+                    '(outcome_id, price) VALUES (?, ?)')
+                for table, old, new in (('sports', previous.sports, snapshot.sports),
+                                        ('tournaments', previous.tournaments, snapshot.tournaments)):
+                    key_column = TABLES[table][0]
+                    changed += self._apply(table, *self._changes(
+                        old, new, lambda key, value: (key, _dumps(value))),
+                        f'({key_column}, data) VALUES (?, ?)')
+
+                meta = {
+                    'version': snapshot.version,
+                    'url': snapshot.url,
+                    'timestamp': snapshot.timestamp,
+                    'message_count': snapshot.message_count,
+                    'counters': snapshot.counters,
+                    'match_pages': snapshot.match_pages
+                }
+                self.conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                      [(key, _dumps(value)) for key, value in meta.items()])
+            self.last = snapshot
+            return changed
+
+    def _apply(self, table, upserts, deletes, insert):
+        key_column = TABLES[table][0]
+        if deletes:
+            self.conn.executemany(f'DELETE FROM {table} WHERE {key_column} = ?', deletes)
+        if upserts:
+            self.conn.executemany(f'INSERT OR REPLACE INTO {table} {insert}', upserts)
+        return len(upserts) + len(deletes)
+
+    def close(self):
+        self.conn.close()
+
+
+_MISSING = object()
+
+
+class RecordView:
+    """Read-only mapping over one table, looked up by primary key on access"""
+
+    def __init__(self, conn, table):
+        self.conn = conn
+        self.table = table
+        self.key_column, self.value_column, self.is_json = TABLES[table]
+
+    def _decode(self, value):
+        return json.loads(value) if self.is_json else value
+
+    def get(self, key, default=None):
+        # Keys are strings like in the in-memory snapshot, an int key is never found
+        if not isinstance(key, str):
+            return default
+        row = self.conn.execute(f'SELECT {self.value_column} FROM {self.table} WHERE {self.key_column} = ?',
+                                (key,)).fetchone()
+        return self._decode(row[0]) if row else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self.conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def items(self):
+        for key, value in self.conn.execute(f'SELECT {self.key_column}, {self.value_column} FROM {self.table}'):
+            yield key, self._decode(value)
+
+    def keys(self):
+        return (key for key, in self.conn.execute(f'SELECT {self.key_column} FROM {self.table}'))
+
+    def values(self):
+        return (value for _, value in self.items())
+
+    def __iter__(self):
+        return self.keys()
+
+
+class SQLiteSnapshot(MatchSnapshot):
+    """MatchSnapshot interface answered from the SQLite store.
+
+    Pinned to one read transaction, so every lookup of a request sees the
+    same store version. Records and filters are read through the indexes on
+    demand, nothing is materialized per worker. release() ends the
+    transaction.
+    """
+
+    def __init__(self, conn, rendered_for_version):
+        self.conn = conn
+        conn.execute('BEGIN')
+        # match_pages can hold every match id, it is only read by the requests that need it
+        meta = {key: json.loads(value) for key, value in conn.execute(
+            "SELECT key, value FROM meta WHERE key != 'match_pages'")}
+        self.version = meta.get('version', 0)
+        self.url = meta.get('url')
+        self.timestamp = meta.get('timestamp')
+        self.message_count = meta.get('message_count', 0)
+        self.counters = meta.get('counters') or {}
+        self.matches = RecordView(conn, 'matches')
+        self.main_odds = RecordView(conn, 'main_odds')
+        self.bets = RecordView(conn, 'bets')
+        self.outcomes = RecordView(conn, 'outcomes')
+        self.odds = RecordView(conn, 'odds')
+        self.sports = RecordView(conn, 'sports')
+        self.tournaments = RecordView(conn, 'tournaments')
+        self.markets = {}  # Main markets are resolved from the records on demand
+        self.bet_pages = {}
+        self.columns = None
+        self.rendered = rendered_for_version(self.version)
+        self._match_pages = None
+
+    @property
+    def match_pages(self):
+        if self._match_pages is None:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'match_pages'").fetchone()
+            self._match_pages = json.loads(row[0]) if row else {}
+        return self._match_pages
+
+    def release(self):
+        if self.conn.in_transaction:
+            self.conn.execute('COMMIT')
+
+    def _ids(self, where='', params=()):
+        sql = f'SELECT match_id FROM matches WHERE listed = 1 {where} ORDER BY sort_start, match_id'
+        return [match_id for match_id, in self.conn.execute(sql, params)]
+
+    @property
+    def ordered_ids(self):
+        return self._ids()
+
+    def seconds_until_next_start(self, now):
+        row = self.conn.execute('SELECT MIN(sort_start) FROM matches WHERE listed = 1 AND sort_start > ? '
+                                'AND match_start IS NOT NULL', (float(now),)).fetchone()
+        return row[0] - now if row and row[0] is not None else None
+
+    def query_ids(self, sport_id=None, date=None, start_from=None, start_to=None):
+        """Same filters and order as MatchSnapshot.query_ids, as one indexed query"""
+        where, params = [], []
+        if date:
+            where.append('AND (day = ? OR day IS NULL)')
+            params.append(date)
+        if sport_id is not None:
+            where.append('AND sport_id = ?')
+            params.append(sport_id)
+        if start_from is not None or start_to is not None:
+            # Matches without matchStart never fall in a range
+            where.append('AND day IS NOT NULL' if date else 'AND match_start IS NOT NULL')
+            if start_from is not None:
+                where.append('AND sort_start >= ?')
+                params.append(float(start_from))
+            if start_to is not None:
+                where.append('AND sort_start <= ?')
+                params.append(float(start_to))
+        return self._ids(' '.join(where), params)
+
+    def ids_with_any_side_between(self, low, high):
+        rows = self.conn.execute('SELECT match_id FROM main_odds WHERE home BETWEEN ?1 AND ?2 '
+                                 'OR draw BETWEEN ?1 AND ?2 OR away BETWEEN ?1 AND ?2', (low, high))
+        return {match_id for match_id, in rows}
+
+    def ids_with_side_above(self, side, value):
+        if side not in ('home', 'draw', 'away'):
+            raise ValueError(side)
+        rows = self.conn.execute(f'SELECT match_id FROM main_odds WHERE {side} > ?', (value,))
+        return {match_id for match_id, in rows}
+
+    def ids_with_home_and_away_above(self, value):
+        rows = self.conn.execute('SELECT match_id FROM main_odds WHERE home > ?1 AND away > ?1', (value,))
+        return {match_id for match_id, in rows}
+
+
+class SQLiteSnapshotReader:
+    """Opens read-only per-thread connections to the store and hands out pinned snapshots"""
+
+    backend = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._rendered_version = None
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _rendered_for_version(self, version):
+        """Rendered bodies shared by every snapshot of the same store version"""
+        with self._lock:
+            if version != self._rendered_version:
+                self._rendered_version = version
+                self._rendered = {}
+            return self._rendered
+
+    def snapshot(self):
+        return SQLiteSnapshot(self._connection(), self._rendered_for_version)
@@ -0,0 +1,395 @@
+"""
+Winamax Synthetic Capture
+Author: Anass EL
+Description: Generates realistic capture files at configurable scale for benchmarks and load tests
+"""
+import json
+import random
+import sys
+import time
+import uuid
+
+from capture_store import format_timestamp, write_capture_file
+
+SYNTHETIC_URL = "https://www.winamax.fr/paris-sportifs/sports/1"
+SYNTHETIC_SOCKET_URL = ("wss://sports-eu-west-3.winamax.fr/uof-sports-server/socket.io/"
+                        "?language=FR&version=3.27.0&embed=false&EIO=3&transport=websocket")
+PING_INTERVAL = 25  # Seconds between Engine.IO pings, like the real socket
+MATCHES_PER_TOURNAMENT = 15
+FILTER_IDS = list(range(1, 79))
+OUTRIGHT_SHARE = 0.04  # Catalogue matches that are outright winner markets with 16-70 outcomes
+
+# (sportId, name, share of the catalogue, outcome codes of the main bet)
+SPORTS = (
+    (1, 'Football', 0.55, ('1', 'x', '2')),
+    (5, 'Tennis', 0.15, ('1', '2')),
+    (2, 'Basketball', 0.12, ('1', '2')),
+    (4, 'Hockey sur glace', 0.08, ('1', 'x', '2')),
+    (12, 'Rugby', 0.05, ('1', 'x', '2')),
+    (6, 'Handball', 0.05, ('1', 'x', '2')),
+)
+
+# Update frame kinds and their share of the stream, from the sample capture
+UPDATE_KINDS = (
+    ('odds', 0.35),  # odds moves of one main bet, with its outcomes' hotUsers
+    ('popularity', 0.25),  # outcomes hotUsers/icon only, often batched
+    ('clock', 0.18),  # live match clock and score
+    ('match', 0.12),  # match fields (moreBets, filters, flags)
+    ('counters', 0.04),  # catalogue counters
+    ('new_match', 0.04),  # a match appears with its bet, outcomes and odds
+    ('remove_match', 0.02),  # a match disappears
+)
+
+
+def frame(payload):
+    """Raw '42["m",{...}]' frame of a payload, serialized like the Winamax server"""
+    return '42["m",' + json.dumps(payload, ensure_ascii=False, separators=(',', ':')) + ']'
+
+
+def hook_message(raw, epoch):
+    """Captured message in the browser hook format"""
+    return {'data': {'raw': raw}, 'event': 'websocket_message', 'timestamp': format_timestamp(epoch)}
+
+
+class SyntheticCatalogue:
+    """Matches, bets, outcomes and odds of a generated catalogue, mutated by the update stream"""
+
+    def __init__(self, match_count, start, rng):
+        self.rng = rng
+        self.start = start
+        self.next_match_id = 56000000
+        self.next_bet_id = 527000000
+        self.next_outcome_id = 1640000000
+        self.sports = {}
+        self.categories = {}
+        self.tournaments = {}
+        self.matches = {}
+        self.bets = {}
+        self.outcomes = {}
+        self.odds = {}
+        self.live = []
+        tournament_count = max(len(SPORTS), match_count // MATCHES_PER_TOURNAMENT)
+        self.tournament_sports = []
+        for position in range(tournament_count):
+            sport = SPORTS[position] if position < len(SPORTS) else rng.choices(SPORTS, [s[2] for s in SPORTS])[0]
+            self._add_tournament(position + 1, sport)
+        for _ in range(match_count):
+            self.add_match()
+
+    def _filters(self, count):
+        return sorted(self.rng.sample(FILTER_IDS, count))
+
+    def _add_tournament(self, tournament_id, sport):
+        sport_id, sport_name, _, _ = sport
+        category_id = 100 + tournament_id // 4
+        self.tournaments[str(tournament_id)] = {
+            'tournamentName': f'{sport_name} League {tournament_id}',
+            'displayLiveTable': self.rng.random() < 0.5,
+            'topName': f'League {tournament_id}',
+            'cardColorBackground': '#6a0f8a',
+            'mainMatchCount': 0,
+            'liveMatchCount': 0,
+            'tvMatchCount': 0,
+            'filters': self._filters(60),
+            'srTournamentId': f'sr:tournament:{tournament_id}',
+            'srSeasonId': f'sr:season:{130000 + tournament_id}'
+        }
+        category = self.categories.setdefault(str(category_id), {
+            'categoryName': f'Category {category_id}',
+            'tournaments': [],
+            'mainMatchCount': 0,
+            'liveMatchCount': 0,
+            'tvMatchCount': 0,
+            'filters': self._filters(60),
+            'flag': 'ENG'
+        })
+        category['tournaments'].append(tournament_id)
+        record = self.sports.setdefault(str(sport_id), {
+            'sportName': sport_name,
+            'categories': [],
+            'mainMatchCount': 0,
+            'liveMatchCount': 0,
+            'tvMatchCount': 0,
+            'filters': self._filters(70),
+            'matches': []
+        })
+        if category_id not in record['categories']:
+            record['categories'].append(category_id)
+        self.tournament_sports.append((tournament_id, category_id, sport))
+
+    def _prices(self, codes):
+        """Main bet odds with a bookmaker margin, favourites priced low"""
+        rng = self.rng
+        strengths = [rng.lognormvariate(0, 0.9) for _ in codes]
+        if len(codes) == 3:
+            # Draw probability shrinks as the match gets one-sided
+            home, _, away = strengths
+            draw = rng.uniform(0.24, 0.30) - 0.1 * abs(home - away) / (home + away)
+            probabilities = [(1 - draw) * home / (home + away), draw, (1 - draw) * away / (home + away)]
+        else:
+            probabilities = [strength / sum(strengths) for strength in strengths]
+        margin = rng.uniform(1.04, 1.08)
+        return [max(1.01, round(1 / (probability * margin), 2)) for probability in probabilities]
+
+    def add_match(self, now=None):
+        """Add a match with its main bet, returns the frame payload announcing it"""
+        rng = self.rng
+        match_id = self.next_match_id
+        self.next_match_id += rng.randint(1, 40)
+        bet_id = self.next_bet_id
+        self.next_bet_id += rng.randint(1, 60)
+        tournament_id, category_id, sport = rng.choice(self.tournament_sports)
+        sport_id, _, _, codes = sport
+        competitor1_id, competitor2_id = rng.sample(range(1000, 400000), 2)
+        home, away = f'Team {competitor1_id}', f'Team {competitor2_id}'
+        outright = now is None and rng.random() < OUTRIGHT_SHARE
+        if outright:
+            codes = tuple(f'pre:outcometext:{rng.randint(1000, 99999)}' for _ in range(rng.randint(16, 70)))
+        live = not outright and now is None and rng.random() < 0.04
+        base = now if now is not None else self.start
+        match_start = int(base - rng.uniform(0, 5400)) if live else int(base + rng.uniform(600, 14 * 86400))
+        match = {
+            'matchId': match_id,
+            'available': True,
+            'status': 'LIVE' if live else 'PREMATCH',
+            'mainBetId': bet_id,
+            'moreBets': rng.randint(5, 120),
+            'periodId': 1 if live else 0,
+            'period': 'first_half' if live else 'not_started',
+            'periodName': '1re MT' if live else '',
+            'hlType': None,
+            'title': self.tournaments[str(tournament_id)]['tournamentName'] if outright else f'{home} - {away}',
+            'roundId': f'day_{rng.randint(1, 38)}',
+            'roundName': f'J{rng.randint(1, 38)}',
+            'tvChannels': None,
+            'sportId': sport_id,
+            'categoryId': category_id,
+            'tournamentId': tournament_id,
+            'srTournamentId': f'sr:tournament:{tournament_id}',
+            'srSeasonId': f'sr:season:{130000 + tournament_id}',
+            # Outright markets have no competitors and are not listed by the API
+            'competitor1Id': None if outright else competitor1_id,
+            'competitor1Name': None if outright else home,
+            'competitor1Flag': None if outright else uuid.UUID(int=rng.getrandbits(128)).hex[:8],
+            'competitor2Id': None if outright else competitor2_id,
+            'competitor2Name': None if outright else away,
+            'competitor2Flag': None if outright else uuid.UUID(int=rng.getrandbits(128)).hex[:8],
+            'matchStart': None if rng.random() < 0.005 else match_start,
+            'isBooked': True,
+            'prematchDisplayOrder': None,
+            'liveDisplayOrder': None,
+            'filters': self._filters(rng.randint(20, 55)),
+            'image': None,
+            'imageXl': None,
+            'streamHighlightsAvailable': False,
+            'highlights': [],
+            'mymatchAvailable': rng.random() < 0.8
+        }
+        if live:
+            match['matchtimeExtended'] = f'{rng.randint(1, 89)}:{rng.randint(0, 59):02d}'
+            match['score'] = [rng.randint(0, 3), rng.randint(0, 3)]
+            self.live.append(str(match_id))
+
+        labels = {'1': home, 'x': 'Match nul', '2': away}
+        competitors = {'1': competitor1_id, '2': competitor2_id}
+        if outright:
+            for code in codes:
+                labels[code] = f'Team {rng.randint(1000, 400000)}'
+        outcome_ids = []
+        outcomes, odds = {}, {}
+        for code, price in zip(codes, self._prices(codes)):
+            outcome_id = self.next_outcome_id
+            self.next_outcome_id += rng.randint(1, 30)
+            outcome_ids.append(outcome_id)
+            outcome = {
+                'betId': bet_id,
+                'label': labels[code],
+                'available': True,
+                'code': code,
+                'percentDistribution': rng.randint(1, 90),
+                'hotUsers': rng.randint(0, 5000)
+            }
+            if code in competitors:
+                outcome['competitorId'] = competitors[code]
+            outcomes[str(outcome_id)] = outcome
+            odds[str(outcome_id)] = price
+        bet = {
+            'betId': bet_id,
+            'matchId': match_id,
+            'marketId': 1,
+            'specialBetValue': '',
+            'outcomes': outcome_ids,
+            'available': True,
+            'template': 'ListOdd' if outright else 'Odd3Columns' if len(codes) == 3 else 'Odd2Columns',
+            'isAlternativeMainBet': False,
+            'betTypeIsLive': live,
+            'betTitle': 'Vainqueur' if outright else 'Résultat',
+            'betTypeName': 'Vainqueur' if outright else 'Résultat',
+            'betType': 1,
+            'betTypeCategoryId': 1,
+            'betCategories': [1],
+            'betTypeCategory': 'Principaux',
+            'betTypeHelp': '',
+            'betGroup': bet_id
+        }
+        self.matches[str(match_id)] = match
+        self.bets[str(bet_id)] = bet
+        self.outcomes.update(outcomes)
+        self.odds.update(odds)
+        self.sports[str(sport_id)]['matches'].append(match_id)
+        return {'matches': {str(match_id): match}, 'bets': {str(bet_id): bet},
+                'outcomes': outcomes, 'odds': odds}
+
+    def remove_match(self, match_id):
+        """Remove a match with its bet, returns the frame payload deleting it"""
+        match = self.matches.pop(match_id)
+        if match_id in self.live:
+            self.live.remove(match_id)
+        bet = self.bets.pop(str(match['mainBetId']), None)
+        outcome_ids = [str(outcome_id) for outcome_id in (bet['outcomes'] if bet else [])]
+        for outcome_id in outcome_ids:
+            self.outcomes.pop(outcome_id, None)
+            self.odds.pop(outcome_id, None)
+        return {'matches': {match_id: None}, 'odds': {outcome_id: None for outcome_id in outcome_ids}}
+
+    def counters(self):
+        return {
+            'mainMatchCount': len(self.matches),
+            'liveMatchCount': len(self.live),
+            'reallyLiveMatchCount': len(self.live),
+            'tvMatchCount': len(self.matches) // 2
+        }
+
+    def initial_payload(self, epoch):
+        """Full catalogue frame sent after subscribing (the ~1.5 MB frame of a real capture)"""
+        rng = self.rng
+        payload = {
+            'outcomes': self.outcomes,
+            'teasers': [{'id': position, 'title': f'Teaser {position}'} for position in range(3)],
+            'betCategories': {str(position): {'name': f'Catégorie {position}', 'order': position}
+                              for position in range(1, 64)},
+            'settings': {f'setting{position}': position % 2 == 0 for position in range(41)},
+            'sportIds': [int(sport_id) for sport_id in self.sports],
+            'sports': self.sports,
+            'categories': self.categories,
+            'tournaments': self.tournaments,
+            'calendar': {'days': sorted({time.strftime('%Y-%m-%d', time.gmtime(match['matchStart']))
+                                         for match in self.matches.values() if match['matchStart']})},
+            **self.counters(),
+            'filters': {str(filter_id): {'name': f'Filtre {filter_id}', 'order': filter_id}
+                        for filter_id in FILTER_IDS},
+            'clientTime': int(epoch * 1000) + 60,
+            'serverReceiveTime': int(epoch * 1000) - 10,
+            'matches': self.matches,
+            'bets': self.bets,
+            'odds': self.odds,
+            'serverSendTime': int(epoch * 1000) + 70,
+            'requestId': str(uuid.UUID(int=rng.getrandbits(128)))
+        }
+        return payload
+
+    def update_payload(self, kind, epoch):
+        """Delta payload of one update frame of the given kind"""
+        rng = self.rng
+        if kind == 'new_match' or not self.matches:
+            return self.add_match(now=epoch)
+        if kind == 'remove_match':
+            return self.remove_match(rng.choice(list(self.matches)))
+        if kind == 'counters':
+            return self.counters()
+        if kind == 'popularity':
+            outcome_ids = rng.sample(list(self.outcomes), min(len(self.outcomes), int(rng.expovariate(1 / 6)) + 1))
+            return {'outcomes': {outcome_id: {'hotUsers': rng.randint(0, 20000)} for outcome_id in outcome_ids}}
+        if kind == 'clock' and self.live:
+            match_id = rng.choice(self.live)
+            update = {'matchtimeExtended': f'{rng.randint(1, 95)}:{rng.randint(0, 59):02d}'}
+            if rng.random() < 0.1:
+                update['score'] = [rng.randint(0, 4), rng.randint(0, 4)]
+            self.matches[match_id] = {**self.matches[match_id], **update}
+            return {'matches': {match_id: update}}
+        match_id = rng.choice(list(self.matches))
+        if kind == 'odds':
+            bet = self.bets.get(str(self.matches[match_id]['mainBetId']))
+            outcome_ids = [str(outcome_id) for outcome_id in (bet['outcomes'] if bet else [])]
+            odds = {}
+            for outcome_id in outcome_ids:
+                if rng.random() < 0.7:
+                    odds[outcome_id] = max(1.01, round(self.odds[outcome_id] * rng.uniform(0.93, 1.07), 2))
+            self.odds.update(odds)
+            payload = {'odds': odds or {outcome_ids[0]: self.odds[outcome_ids[0]]}} if outcome_ids else {}
+            payload['outcomes'] = {outcome_id: {'hotUsers': rng.randint(0, 20000)} for outcome_id in outcome_ids}
+            return payload
+        update = {'moreBets': rng.randint(5, 120)}
+        if rng.random() < 0.4:
+            update['filters'] = self._filters(rng.randint(20, 55))
+        if rng.random() < 0.2:
+            update['mymatchAvailable'] = rng.random() < 0.5
+        self.matches[match_id] = {**self.matches[match_id], **update}
+        return {'matches': {match_id: update}}
+
+
+def generate_capture(matches=1000, updates=2000, duration=180.0, seed=0, start=None):
+    """Capture document (the format of winamax_socketio_analysis.json) of a synthetic session.
+
+    The session opens the socket, receives one initial frame holding the
+    whole catalogue of `matches` matches, then `updates` delta frames spread
+    over `duration` seconds with Poisson arrivals: odds moves, popularity,
+    live clocks, match field changes, counters, new and removed matches, in
+    the proportions of a real capture. Engine.IO pings run every 25 s.
+    Times are relative to start (default: now) so date filters see upcoming
+    matches. The same seed and start give the same document.
+    """
+    rng = random.Random(seed)
+    start = time.time() if start is None else start
+    catalogue = SyntheticCatalogue(matches, start, rng)
+    kinds, weights = zip(*UPDATE_KINDS)
+
+    epoch = start
+    messages = [
+        {'data': {'url': SYNTHETIC_SOCKET_URL + '&sid=' + uuid.UUID(int=rng.getrandbits(128)).hex[:20]},
+         'event': 'websocket_open', 'timestamp': format_timestamp(epoch)},
+        hook_message('0' + json.dumps({'sid': 'synthetic', 'upgrades': [], 'pingInterval': PING_INTERVAL * 1000,
+                                       'pingTimeout': 60000}), epoch + 0.05),
+        hook_message('40', epoch + 0.06),
+        hook_message(frame(catalogue.initial_payload(epoch)), epoch + 0.2)
+    ]
+    epoch += 0.2
+    next_ping = start + PING_INTERVAL
+    for _ in range(updates):
+        epoch += rng.expovariate(updates / duration) if updates else 0
+        while next_ping <= epoch:
+            messages.append(hook_message('3', next_ping + 0.03))
+            next_ping += PING_INTERVAL
+        kind = rng.choices(kinds, weights)[0]
+        messages.append(hook_message(frame(catalogue.update_payload(kind, epoch)), epoch))
+    return {
+        'url': SYNTHETIC_URL,
+        'timestamp': format_timestamp(epoch),
+        'message_count': len(messages),
+        'messages': messages
+    }
+
+
+def write_synthetic_capture(filename, matches=1000, updates=2000, duration=180.0, seed=0, start=None, decoded=False):
+    """Generate a capture and publish it as a capture file, returns the document"""
+    capture = generate_capture(matches, updates, duration, seed, start)
+    write_capture_file(capture['messages'], capture['url'], filename=filename, decoded=decoded)
+    return capture
+
+
+def frame_sizes(capture):
+    """Sizes in bytes of the raw frames of a capture document"""
+    return [len(msg['data']['raw'].encode('utf-8')) for msg in capture.get('messages', [])
+            if isinstance(msg.get('data'), dict) and isinstance(msg['data'].get('raw'), str)]
+
+
+if __name__ == '__main__':
+    # python synthetic_capture.py [matches] [updates] [filename] [seed]
+    match_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    update_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    output = sys.argv[3] if len(sys.argv) > 3 else 'synthetic_capture.json'
+    seed_value = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    generated = write_synthetic_capture(output, match_count, update_count, seed=seed_value)
+    sizes = sorted(frame_sizes(generated))
+    print(f"Wrote {output}: {match_count} matches, {generated['message_count']} messages, "
+          f"initial frame {sizes[-1] / 1024:.0f} KB, median frame {sizes[len(sizes) // 2]} bytes")
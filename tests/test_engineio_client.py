@@ -0,0 +1,112 @@
+"""
+Winamax Engine.IO Client Tests
+Author: Anass EL
+Description: SocketIOClientCapture and EngineIOClient against the local Socket.IO stand-in server
+"""
+import time
+
+from engineio_client import EngineIOClient, SocketIOClientCapture
+from engineio_standin import SocketIOStandInServer
+
+FRAMES = [f'42["m",{{"matches":{{"{match_id}":{{"matchId":{match_id},"status":"PREMATCH"}}}}}}]'
+          for match_id in range(1, 6)]
+
+
+def wait_for(predicate, timeout=5.0):
+    """Poll predicate until it is true or timeout seconds have passed"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_capture_receives_every_frame_in_order():
+    batches = []
+    with SocketIOStandInServer(FRAMES) as server:
+        capture = SocketIOClientCapture(on_messages=batches.append, socket_url=server.url, batch_interval=0.05)
+        received = capture.run(duration=5, save=False, should_stop=lambda: capture.frame_count >= len(FRAMES))
+
+    assert received
+    assert capture.frame_count == len(FRAMES)
+    frames = [msg['data']['raw'] for msg in capture.messages if msg['event'] == 'websocket_message']
+    assert frames == FRAMES
+    # Every captured message reaches on_messages exactly once
+    assert [msg for batch in batches for msg in batch] == capture.messages
+    assert capture.messages[0]['event'] == 'websocket_open'
+
+
+def test_capture_follows_schedule():
+    with SocketIOStandInServer(FRAMES[:2], schedule=[0.0, 0.3]) as server:
+        capture = SocketIOClientCapture(socket_url=server.url, batch_interval=0.05)
+        capture.run(duration=5, save=False, should_stop=lambda: capture.frame_count >= 2)
+        # The send time is recorded once the frame is written, possibly after the client saw it
+        assert wait_for(lambda: len(server.sent_times) == 2)
+
+    assert server.sent_times[1] - server.sent_times[0] >= 0.25
+
+
+def test_quiet_feed_is_flushed_without_a_new_frame():
+    delivered = []
+    with SocketIOStandInServer(FRAMES[:2], schedule=[0.0, 0.1]) as server:
+        capture = SocketIOClientCapture(on_messages=delivered.extend, socket_url=server.url, batch_interval=0.3)
+        started = time.time()
+        capture.run(duration=5, save=False,
+                    should_stop=lambda: sum(msg['event'] == 'websocket_message' for msg in delivered) >= 2)
+
+    # No frame follows the second one: it is flushed by the idle check, not when the capture ends
+    assert time.time() - started < 2
+    assert [msg['data']['raw'] for msg in delivered if msg['event'] == 'websocket_message'] == FRAMES[:2]
+
+
+def test_client_pings_are_answered_with_pongs():
+    with SocketIOStandInServer(ping_interval=100) as server:
+        client = EngineIOClient(server.url).connect()
+        connected_at = client.last_pong_time
+        try:
+            client.run(0.5, lambda raw: None)
+        finally:
+            client.close()
+
+    assert client.ping_interval == 0.1
+    assert '2' in server.received
+    assert client.last_pong_time > connected_at
+
+
+def test_server_ping_is_answered_and_subscribe_packets_sent():
+    subscribe = '42["m",{"route":"sports:1"}]'
+    with SocketIOStandInServer() as server:
+        client = EngineIOClient(server.url, subscribe_packets=[subscribe]).connect()
+        try:
+            client.run(0.3, lambda raw: None)
+            assert client.connected
+            assert client.handle_packet('2', lambda raw: None)
+            assert wait_for(lambda: '3' in server.received)
+        finally:
+            client.close()
+
+    assert server.received[0] == subscribe
+
+
+def test_close_sends_socketio_disconnect():
+    with SocketIOStandInServer() as server:
+        client = EngineIOClient(server.url).connect()
+        client.run(0.3, lambda raw: None)
+        client.close()
+        assert wait_for(lambda: '41' in server.received)
+
+    assert client.ws is None
+    assert not client.connected
+
+
+def test_server_disconnect_ends_capture():
+    frames = FRAMES[:2] + ['41'] + FRAMES[2:]
+    with SocketIOStandInServer(frames) as server:
+        capture = SocketIOClientCapture(socket_url=server.url, batch_interval=0.05)
+        started = time.time()
+        capture.run(duration=5, save=False)
+
+    # '41' ends the session well before the duration, frames after it are never read
+    assert time.time() - started < 4
+    assert capture.frame_count == 2